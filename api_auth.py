@@ -0,0 +1,17 @@
+import hmac
+import os
+
+from fastapi import HTTPException
+
+
+def authorize(authorization: str | None, token_var: str):
+    """Checks a bearer token against the one in the `token_var` environment variable.
+
+    The endpoints are off (404) while it isn't set.
+    """
+    token = os.getenv(token_var)
+    if not token:
+        raise HTTPException(status_code=404)
+    scheme, _, supplied = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(supplied.encode(), token.encode()):
+        raise HTTPException(status_code=401, headers={"WWW-Authenticate": "Bearer"})
@@ -0,0 +1,142 @@
+"""Measure what field-projected Airtable reads and the parsed Booking save.
+
+Run from the repository root:
+
+    python -m benchmarks.airtable_reads [--extra-fields N] [--matches M] [--repeat R]
+
+Builds an Airtable response for a bookings table with the fields the
+functions use plus N others (flight numbers, prices, notes, ...), and
+compares reads as they were, with every field of every matching row (M rows,
+e.g. a phone number with several bookings), to reads asking only for the
+fields a lookup or an update uses and the first match. Reports the response
+size, and the time to decode a lookup's response and build the find_booking
+result, and to read the booking back from the (JSON) booking cache and
+format it, as it was (strptime and pytz on every use) and with Booking
+(parsed once).
+"""
+
+import argparse
+import json
+import random
+import string
+import time
+from datetime import datetime
+
+import pytz
+
+from functions.booking import BOOKING_FIELDS, ID_FIELDS, Booking
+from functions.find_booking import format_booking
+
+
+def old_format_booking(record: dict, registration: str) -> dict:
+    # find_booking's result as it was built from the record's string fields.
+    try:
+        booking_time = datetime.strptime(record["Entry_Date_Time"], "%d/%m/%Y %H:%M")
+        booking_time = pytz.timezone("Europe/London").localize(booking_time)
+        formatted_booking_time = booking_time.strftime("%B %d at %I:%M %p")
+    except ValueError:
+        formatted_booking_time = "Date format error"
+    contact_number = record.get("Contact_Number", "Not provided")
+    if contact_number != "Not provided":
+        contact_number = " ".join(
+            [contact_number[i : i + 4] for i in range(0, len(contact_number), 4)]
+        )
+    return {
+        "found": True,
+        "customerName": record.get("Name", "Not provided"),
+        "terminal": record.get("Terminal", "Not provided"),
+        "bookingTime": formatted_booking_time,
+        "contactNumber": contact_number,
+        "allocatedCarPark": record.get("Allocated_Car_Park", "Not provided"),
+        "registration": registration,
+    }
+
+
+def words(n: int) -> str:
+    return " ".join(
+        "".join(random.choices(string.ascii_lowercase, k=random.randint(3, 9))) for _ in range(n)
+    )
+
+
+def make_record(extra_fields: int) -> dict:
+    fields = {
+        "Registration": "VE68VEP",
+        "Name": "Jane Smith",
+        "Entry_Date_Time": "14/06/2024 05:30",
+        "Contact_Number": "07700900123",
+        "Terminal": "Terminal 2",
+        "Allocated_Car_Park": "Car Park B",
+        "Vehicle_Make": "Volkswagen Golf",
+        "Current_ETA": "2024-06-14 05:45:00",
+    }
+    for i in range(extra_fields):
+        fields[f"Field_{i}"] = words(random.choice((1, 2, 3, 12)))
+    return {
+        "id": "rec" + "".join(random.choices(string.ascii_letters, k=14)),
+        "createdTime": "2024-06-01T09:12:44.000Z",
+        "fields": fields,
+    }
+
+
+def response(records: list, fields: tuple | None) -> bytes:
+    if fields:
+        records = [
+            {**record, "fields": {name: record["fields"][name] for name in fields}}
+            for record in records
+        ]
+    return json.dumps({"records": records}).encode()
+
+
+def timed(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--extra-fields", type=int, default=30)
+    parser.add_argument("--matches", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=20000)
+    args = parser.parse_args()
+    random.seed(1)
+
+    records = [make_record(args.extra_fields) for _ in range(args.matches)]
+    full = response(records, None)
+    lookup = response(records[:1], BOOKING_FIELDS)
+    update = response(records[:1], ID_FIELDS)
+    print(f"{len(BOOKING_FIELDS) + args.extra_fields} fields, {args.matches} matching row(s)")
+    print(f"response bytes: all fields {len(full)}, lookup {len(lookup)}, update {len(update)}")
+
+    def old_lookup():
+        record = json.loads(full)["records"][0]
+        return old_format_booking(record["fields"], "VE68VEP")
+
+    def new_lookup():
+        return format_booking(Booking.from_record(json.loads(lookup)["records"][0]))
+
+    # The booking cache holds JSON (the Redis and SQLite stores serialize).
+    old_cached = json.dumps({"id": records[0]["id"], "fields": records[0]["fields"]})
+    new_cached = json.dumps(Booking.from_record(records[0]).to_json())
+
+    def old_cache_read():
+        return old_format_booking(json.loads(old_cached)["fields"], "VE68VEP")
+
+    def new_cache_read():
+        return format_booking(Booking.from_json(json.loads(new_cached)))
+
+    assert old_lookup() == new_lookup() == old_cache_read() == new_cache_read()
+    print(
+        f"lookup, decode and format: {timed(old_lookup, args.repeat) * 1e6:.1f} µs before, "
+        f"{timed(new_lookup, args.repeat) * 1e6:.1f} µs after"
+    )
+    print(
+        f"cached booking read and format: {timed(old_cache_read, args.repeat) * 1e6:.1f} µs "
+        f"before, {timed(new_cache_read, args.repeat) * 1e6:.1f} µs after "
+        f"({len(old_cached)} vs {len(new_cached)} bytes cached)"
+    )
+
+
+if __name__ == "__main__":
+    main()
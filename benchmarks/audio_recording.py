@@ -0,0 +1,118 @@
+"""Measure what recording call audio costs per concurrent call.
+
+Run from the repository root:
+
+    python -m benchmarks.audio_recording [--calls N] [--seconds S] [--slow-disk-ms MS]
+
+Simulates N calls in real time for S seconds: each sends the caller's 20 ms
+frames continuously, and the bot's for two seconds out of every four, the
+way the audio taps see them. The same calls are run without recording, with
+recording, and with recording under tracemalloc, and the differences give
+the CPU (as a share of one core) and memory each recorded call adds. Also
+reports the worst event loop lag (a blocked loop would show here) and the
+frames dropped. `--slow-disk-ms` makes every write that much slower, to show
+frames being dropped instead of the calls being held up.
+"""
+
+import argparse
+import asyncio
+import os
+import struct
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from recording.audio import CallAudioRecorder
+
+FRAME_SECS = 0.02
+SAMPLE_RATE = 16000
+
+
+class SlowDiskRecorder(CallAudioRecorder):
+    delay = 0.0
+
+    def _frames(self, caller, bot):
+        time.sleep(self.delay)
+        return super()._frames(caller, bot)
+
+
+def make_frame(hz):
+    t = np.arange(int(SAMPLE_RATE * FRAME_SECS)) / SAMPLE_RATE
+    return (np.sin(2 * np.pi * hz * t) * 8000).astype(np.int16).tobytes()
+
+
+def recorded_seconds(path):
+    # The fact chunk holds the number of samples per channel.
+    with open(path, "rb") as f:
+        header = f.read(58)
+    return struct.unpack_from("<I", header, 46)[0] / 8000
+
+
+async def call(recorder, seconds, lags):
+    caller, bot = make_frame(220), make_frame(440)
+    start = time.monotonic()
+    for i in range(int(seconds / FRAME_SECS)):
+        due = start + (i + 1) * FRAME_SECS
+        await asyncio.sleep(max(0.0, due - time.monotonic()))
+        lags.append(time.monotonic() - due)
+        if recorder:
+            recorder.add("caller", caller, SAMPLE_RATE)
+            if (i * FRAME_SECS) % 4 < 2:
+                recorder.add("bot", bot, SAMPLE_RATE)
+
+
+async def run(calls, seconds, directory=None, delay=0.0, stereo=True):
+    recorders = []
+    if directory:
+        SlowDiskRecorder.delay = delay
+        recorders = [
+            SlowDiskRecorder(os.path.join(directory, f"call{i}.wav"), stereo=stereo)
+            for i in range(calls)
+        ]
+    lags = []
+    cpu = time.process_time()
+    await asyncio.gather(
+        *(call(recorders[i] if recorders else None, seconds, lags) for i in range(calls))
+    )
+    for recorder in recorders:
+        recorder.close()
+    for recorder in recorders:
+        recorder.join()
+    cpu = time.process_time() - cpu
+    dropped = sum(recorder.dropped for recorder in recorders)
+    return cpu, max(lags), dropped
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=20)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--slow-disk-ms", type=float, default=0.0)
+    parser.add_argument("--mono", action="store_true")
+    args = parser.parse_args()
+    call_secs = args.calls * args.seconds
+    stereo = not args.mono
+
+    with tempfile.TemporaryDirectory() as directory:
+        base_cpu, base_lag, _ = await run(args.calls, args.seconds)
+        cpu, lag, dropped = await run(
+            args.calls, args.seconds, directory, args.slow_disk_ms / 1000, stereo
+        )
+        recorded_secs = recorded_seconds(os.path.join(directory, "call0.wav"))
+    with tempfile.TemporaryDirectory() as directory:
+        tracemalloc.start()
+        await run(args.calls, args.seconds, directory, args.slow_disk_ms / 1000, stereo)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    print(f"{args.calls} calls for {args.seconds:.0f}s, {'stereo' if stereo else 'mono'}")
+    print(f"CPU per recorded call: {(cpu - base_cpu) / call_secs:.2%} of a core")
+    print(f"memory per recorded call: {peak / args.calls / 1024:.0f} KB (tracemalloc peak)")
+    print(f"worst event loop lag: {base_lag * 1000:.1f} ms without, {lag * 1000:.1f} ms with")
+    print(f"frames dropped: {dropped}, first call's file holds {recorded_secs:.2f}s of audio")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,128 @@
+"""Compare updating many bookings one at a time with the bulk updater.
+
+Run from the repository root:
+
+    python -m benchmarks.bulk_update [--bookings N] [--latency-ms MS]
+
+Starts a local stand-in for the Airtable API that enforces the 5 requests
+per second per base limit (answering 429 beyond it) and adds `--latency-ms`
+to every request. It then updates N bookings the way the call handlers do,
+with a GET and a PATCH per booking in sequence, and again with
+`bulk_updates.AirtableBulkUpdater`.
+"""
+
+import argparse
+import asyncio
+import time
+from collections import deque
+
+import aiohttp
+from aiohttp import web
+
+from bulk_updates import AirtableBulkUpdater, BookingUpdate
+
+RATE_LIMIT = 5
+
+
+class FakeAirtable:
+    def __init__(self, bookings, latency):
+        self.records = {f"rec{i}": {"Registration": reg} for i, reg in enumerate(bookings)}
+        self.by_registration = {reg: f"rec{i}" for i, reg in enumerate(bookings)}
+        self.latency = latency
+        self.requests = 0
+        self.rate_limited = 0
+        self._starts = deque()
+
+    def _over_limit(self):
+        now = time.monotonic()
+        while self._starts and now - self._starts[0] > 1.0:
+            self._starts.popleft()
+        self._starts.append(now)
+        return len(self._starts) > RATE_LIMIT
+
+    async def handle(self, request):
+        self.requests += 1
+        if self._over_limit():
+            self.rate_limited += 1
+            return web.json_response({"error": "RATE_LIMIT_REACHED"}, status=429)
+        await asyncio.sleep(self.latency)
+        if request.method == "GET":
+            formula = request.query.get("filterByFormula", "")
+            records = [
+                {"id": record_id, "fields": {"Registration": reg}}
+                for reg, record_id in self.by_registration.items()
+                if f'"{reg}"' in formula
+            ]
+            return web.json_response({"records": records})
+        body = await request.json()
+        if len(body["records"]) > 10:
+            return web.json_response({"error": "TOO_MANY_RECORDS"}, status=422)
+        for record in body["records"]:
+            self.records[record["id"]].update(record["fields"])
+        return web.json_response({"records": body["records"]})
+
+
+async def one_at_a_time(session, url, registrations):
+    # What the per-call handlers do: look the booking up, then PATCH it.
+    for reg in registrations:
+        while True:
+            params = {"filterByFormula": f'UPPER({{Registration}})=UPPER("{reg}")'}
+            async with session.get(url, params=params) as response:
+                if response.status == 429:
+                    await asyncio.sleep(1.0)
+                    continue
+                record_id = (await response.json())["records"][0]["id"]
+            body = {"records": [{"id": record_id, "fields": {"Terminal": "Terminal 2"}}]}
+            async with session.patch(url, json=body) as response:
+                if response.status == 429:
+                    await asyncio.sleep(1.0)
+                    continue
+            break
+
+
+async def main(count, latency):
+    registrations = [
+        f"AB{i % 100:02d}C{chr(65 + i // 100 % 26)}{chr(65 + i % 26)}" for i in range(count)
+    ]
+    fake = FakeAirtable(registrations, latency)
+    app = web.Application()
+    app.router.add_route("*", "/v0/base/bookings", fake.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    api_url = f"http://127.0.0.1:{port}/v0"
+
+    async with aiohttp.ClientSession() as session:
+        start = time.perf_counter()
+        await one_at_a_time(session, f"{api_url}/base/bookings", registrations)
+        sequential = time.perf_counter() - start
+        sequential_requests, fake.requests = fake.requests, 0
+        await asyncio.sleep(1.0)
+
+        updater = AirtableBulkUpdater(
+            session, api_key="key", base_id="base", table="bookings", api_url=api_url
+        )
+        updates = [
+            BookingUpdate(registration=r, fields={"Terminal": "Terminal 3"}) for r in registrations
+        ]
+        start = time.perf_counter()
+        statuses = {}
+        async for row in updater.run(updates):
+            statuses[row["status"]] = statuses.get(row["status"], 0) + 1
+        bulk = time.perf_counter() - start
+
+    await runner.cleanup()
+    print(f"{count} bookings, {latency * 1000:.0f} ms per Airtable request")
+    print(f"one at a time: {sequential:7.1f} s  {sequential_requests:5d} requests")
+    print(f"bulk:          {bulk:7.1f} s  {fake.requests:5d} requests  {statuses}")
+    print(f"429s answered: {fake.rate_limited}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bookings", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=150.0)
+    args = parser.parse_args()
+    asyncio.run(main(args.bookings, args.latency_ms / 1000))
@@ -0,0 +1,109 @@
+"""Check the spoken-ETA parser against a corpus of caller phrasing, and time it.
+
+Run from the repository root:
+
+    python -m benchmarks.eta_parser [--corpus PATH] [--repeat R]
+
+Each line of the corpus (`benchmarks/eta_phrases.tsv` by default) is a phrase
+and the ETA it should give when said at the corpus's reference time, or at
+the time in a third column (for clock changes). Reports
+the phrases parsed correctly by `parse_spoken_eta` and by the regex parser it
+replaced, and parses per second over the whole corpus.
+"""
+
+import argparse
+import re
+import time
+from datetime import datetime, time as clock_time, timedelta
+from pathlib import Path
+
+import pytz
+
+from functions.eta_parser import parse_spoken_eta
+
+TIMEZONE = pytz.timezone("Europe/London")
+# The time the corpus expectations are written against.
+NOW = TIMEZONE.localize(datetime(2024, 6, 14, 15, 10))
+DEFAULT_CORPUS = Path(__file__).with_name("eta_phrases.tsv")
+
+
+def legacy_parse_eta(eta_string, current_time, timezone):
+    # The parser update_eta used before, for comparison.
+    match = re.match(r"(\d+)\s*(minutes?|hours?)", eta_string, re.IGNORECASE)
+    if match:
+        value = int(match.group(1))
+        unit = "hours" if match.group(2).lower().startswith("hour") else "minutes"
+        return current_time + timedelta(**{unit: value})
+    for time_format in ("%I:%M %p", "%H:%M"):
+        try:
+            parsed_time = datetime.strptime(eta_string, time_format).time()
+        except ValueError:
+            continue
+        eta_datetime = datetime.combine(current_time.date(), parsed_time)
+        if parsed_time < current_time.time():
+            eta_datetime += timedelta(days=1)
+        return timezone.localize(eta_datetime)
+    return None
+
+
+def load_corpus(path):
+    cases = []
+    for line in Path(path).read_text().splitlines():
+        if line.strip() and not line.startswith("#"):
+            phrase, expected, *said_at = line.split("\t")
+            now = NOW
+            if said_at:
+                now = TIMEZONE.localize(datetime.strptime(said_at[0], "%Y-%m-%d %H:%M"))
+            cases.append((phrase, now, expected_eta(expected, now)))
+    return cases
+
+
+def expected_eta(expected, now):
+    if expected == "-":
+        return None
+    if expected.startswith("+"):
+        return TIMEZONE.normalize(now + timedelta(minutes=int(expected[1:])))
+    clock, _, days = expected.partition(" +")
+    hour, minute = map(int, clock.split(":"))
+    day = now.date() + timedelta(days=int(days or 0))
+    return TIMEZONE.localize(datetime.combine(day, clock_time(hour, minute)))
+
+
+def same_time(eta, expected):
+    # The same instant, with the same UTC offset, so it's read back right.
+    if eta is None or expected is None:
+        return eta is expected
+    return eta == expected and eta.utcoffset() == expected.utcoffset()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    cases = load_corpus(args.corpus)
+    correct = legacy_correct = 0
+    for phrase, now, expected in cases:
+        parsed = parse_spoken_eta(phrase, now)
+        if same_time(parsed.eta if parsed else None, expected):
+            correct += 1
+        else:
+            print(f"wrong: {phrase!r} -> {parsed.spoken if parsed else None}")
+        if same_time(legacy_parse_eta(phrase, now, TIMEZONE), expected):
+            legacy_correct += 1
+
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        for phrase, now, _ in cases:
+            parse_spoken_eta(phrase, now)
+    elapsed = time.perf_counter() - start
+    parses = args.repeat * len(cases)
+
+    print(f"{len(cases)} phrases")
+    print(f"correct: {correct} ({correct / len(cases):.0%}), previous parser {legacy_correct}")
+    print(f"{parses / elapsed:,.0f} parses/s, {elapsed / parses * 1e6:.1f} us/parse")
+
+
+if __name__ == "__main__":
+    main()
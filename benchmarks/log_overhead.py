@@ -0,0 +1,98 @@
+"""Measure how long a log call blocks the calling thread.
+
+Run from the repository root:
+
+    python -m benchmarks.log_overhead [--records N] [--slow-write-us US]
+
+Compares the old setup (loguru writing text synchronously to the stream)
+with `log_config.setup_logging()`, with and without sampling. Each is run
+against a fast stream and against a slow one that takes `--slow-write-us` per
+write, like a stderr pipe that the log shipper isn't draining. Reports the
+mean, p99 and worst time per `logger.debug()` call.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+from loguru import logger
+
+from log_config import setup_logging
+
+
+class NullStream:
+    def write(self, message):
+        pass
+
+    def flush(self):
+        pass
+
+
+class SlowStream(NullStream):
+    def __init__(self, delay):
+        self._delay = delay
+
+    def write(self, message):
+        time.sleep(self._delay)
+
+
+def old_setup(stream):
+    logger.remove()
+    logger.add(stream, level="DEBUG")
+    return None
+
+
+def new_setup(sample_every):
+    def setup(stream):
+        os.environ["LOG_SAMPLE_EVERY"] = str(sample_every)
+        return setup_logging(stream)
+
+    return setup
+
+
+def run(records):
+    timings = []
+    with logger.contextualize(call_sid="CA00000000000000000000000000000000", stream_sid="MZ0"):
+        for i in range(records):
+            start = time.perf_counter()
+            logger.debug(f"Generating TTS: [chunk {i}]")
+            timings.append(time.perf_counter() - start)
+    timings.sort()
+    return sum(timings) / records, timings[int(records * 0.99)], timings[-1]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=20000)
+    parser.add_argument("--slow-write-us", type=float, default=200)
+    args = parser.parse_args()
+
+    setups = (
+        ("old sync text", old_setup),
+        ("json, no sampling", new_setup(1)),
+        ("json, sampled", new_setup(10)),
+    )
+    streams = (
+        ("fast", NullStream),
+        ("slow", lambda: SlowStream(args.slow_write_us / 1e6)),
+    )
+
+    print(f"{args.records} debug records from one call site")
+    print(f"{'':28}{'mean us':>10}{'p99 us':>10}{'max us':>10}{'dropped':>10}")
+    for stream_name, make_stream in streams:
+        for setup_name, setup in setups:
+            sink = setup(make_stream())
+            mean, p99, worst = run(args.records)
+            dropped = sink.dropped if sink else 0
+            if sink:
+                sink.stop()
+            label = f"{setup_name} ({stream_name})"
+            print(f"{label:28}{mean * 1e6:>10.1f}{p99 * 1e6:>10.1f}{worst * 1e6:>10.1f}{dropped:>10}")
+
+    logger.remove()
+    logger.add(sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
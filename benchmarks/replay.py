@@ -0,0 +1,61 @@
+"""Replay recorded calls through the pipeline to check latency offline.
+
+Run from the repository root:
+
+    python -m benchmarks.replay recordings/*.callrec [--speed S]
+
+Calls are recorded by setting RECORDINGS_DIR on the server. Each recording is
+played back through `bot.run_bot` with the recorded caller audio, transcripts,
+LLM responses and function results, so a change to the pipeline (processors,
+aggregation, pacing) can be compared against the same calls without Twilio
+or any paid API. TTS is replaced by silence of a plausible length after the
+recording's median time to first byte. `--speed` plays everything faster;
+latencies are reported in wall-clock seconds, so multiply by the speed to
+compare with live calls.
+"""
+
+import argparse
+import asyncio
+
+from recording.replay import replay_call
+
+
+def mean(count, total):
+    return f"{total / count * 1000:.0f}" if count else "-"
+
+
+async def replay_all(paths, speed):
+    totals = {}
+    print(f"{'recording':44}{'wall s':>8}{'llm':>8}{'ttfa ms':>10}{'clause ms':>11}{'barge-in ms':>13}")
+    for path in paths:
+        result = await replay_call(path, speed)
+        ttfa = result["time_to_first_audio_seconds"]
+        clause = result["tts_first_clause_delay_seconds"]
+        barge_in = result["barge_in_to_silence_seconds"]
+        llm = f"{result['llm_requests']}/{result['recorded_llm_requests']}"
+        print(
+            f"{path[-44:]:44}{result['wall_secs']:>8.1f}{llm:>8}"
+            f"{mean(*ttfa):>10}{mean(*clause):>11}{mean(*barge_in):>13}"
+        )
+        if result["unmatched_llm_requests"]:
+            print(f"  {result['unmatched_llm_requests']} LLM requests had no recorded response")
+        for name in ("time_to_first_audio_seconds", "tts_first_clause_delay_seconds", "barge_in_to_silence_seconds"):
+            count, total = totals.get(name, (0, 0.0))
+            totals[name] = (count + result[name][0], total + result[name][1])
+
+    print()
+    print(f"mean time to first audio:     {mean(*totals['time_to_first_audio_seconds'])} ms")
+    print(f"mean first clause delay:      {mean(*totals['tts_first_clause_delay_seconds'])} ms")
+    print(f"mean barge-in to silence:     {mean(*totals['barge_in_to_silence_seconds'])} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("recordings", nargs="+")
+    parser.add_argument("--speed", type=float, default=1.0)
+    args = parser.parse_args()
+    asyncio.run(replay_all(args.recordings, args.speed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Compare FastTwilioFrameSerializer with pipecat's TwilioFrameSerializer.
+
+Run from the repository root:
+
+    python -m benchmarks.serializer [--frames N] [--call-seconds S] [--repeat R]
+
+Reports the cost of one 20 ms frame in each direction and the total CPU time
+spent serializing a full call of the given length.
+"""
+
+import argparse
+import base64
+import json
+import time
+import warnings
+
+import numpy as np
+
+warnings.filterwarnings("ignore", category=DeprecationWarning)
+
+from pipecat.frames.frames import AudioRawFrame
+from pipecat.serializers.twilio import TwilioFrameSerializer
+
+from serializers import FastTwilioFrameSerializer
+
+STREAM_SID = "MZ00000000000000000000000000000000"
+
+
+def make_inbound_messages(count):
+    rng = np.random.default_rng(0)
+    messages = []
+    for i in range(count):
+        payload = base64.b64encode(rng.integers(0, 256, 160, dtype=np.uint8).tobytes())
+        messages.append(
+            json.dumps(
+                {
+                    "event": "media",
+                    "sequenceNumber": str(i + 2),
+                    "media": {
+                        "track": "inbound",
+                        "chunk": str(i + 1),
+                        "timestamp": str(i * 20),
+                        "payload": payload.decode("ascii"),
+                    },
+                    "streamSid": STREAM_SID,
+                }
+            )
+        )
+    return messages
+
+
+def make_outbound_frames(count):
+    t = np.arange(320 * count) / 16000
+    pcm = (np.sin(2 * np.pi * 220 * t) * 12000).astype(np.int16).tobytes()
+    return [AudioRawFrame(pcm[i * 640 : (i + 1) * 640], 16000, 1) for i in range(count)]
+
+
+def run(serializer, inbound, outbound, repeat):
+    # Best of `repeat` runs, to keep scheduler noise out of the comparison.
+    inbound_time = outbound_time = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for message in inbound:
+            serializer.deserialize(message)
+        inbound_time = min(inbound_time, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for frame in outbound:
+            serializer.serialize(frame)
+        outbound_time = min(outbound_time, time.perf_counter() - start)
+
+    return inbound_time, outbound_time
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--frames", type=int, default=20000)
+    parser.add_argument("--call-seconds", type=int, default=180)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    inbound = make_inbound_messages(args.frames)
+    outbound = make_outbound_frames(args.frames)
+    frames_per_call = args.call_seconds * 50
+
+    results = {}
+    for name, serializer in (
+        ("stock", TwilioFrameSerializer(STREAM_SID)),
+        ("fast", FastTwilioFrameSerializer(STREAM_SID)),
+    ):
+        results[name] = run(serializer, inbound, outbound, args.repeat)
+
+    print(f"{args.frames} frames per direction, {args.call_seconds}s call = {frames_per_call} frames")
+    print(f"{'':8}{'in us/frame':>14}{'out us/frame':>14}{'ms/call':>12}")
+    for name, (inbound_time, outbound_time) in results.items():
+        per_in = inbound_time / args.frames * 1e6
+        per_out = outbound_time / args.frames * 1e6
+        per_call = (per_in + per_out) * frames_per_call / 1000
+        print(f"{name:8}{per_in:>14.2f}{per_out:>14.2f}{per_call:>12.1f}")
+
+    stock = sum(results["stock"])
+    fast = sum(results["fast"])
+    print(f"speedup: {stock / fast:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
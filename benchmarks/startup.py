@@ -0,0 +1,131 @@
+"""Measure cold-start cost: module import times and server boot.
+
+Run from the repository root:
+
+    python -m benchmarks.startup [--repeat R] [--top N] [--no-boot] [--port P]
+
+Each module is imported in a fresh interpreter, so the numbers include
+everything it pulls in. The heaviest packages behind `bot` are listed from
+`python -X importtime`. Unless `--no-boot` is given, the server is then
+started with uvicorn, and the time until `/health` answers (port bound) and
+until it reports `warm` (call pipeline loaded) is measured.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+from collections import defaultdict
+
+from warmup import PRELOAD_MODULES
+
+IMPORT_SNIPPET = (
+    "import time; start = time.perf_counter(); import {module}; "
+    "print(time.perf_counter() - start)"
+)
+
+
+def import_time(module, repeat):
+    # Best of `repeat` fresh interpreters. Returns (seconds, error).
+    best = float("inf")
+    for _ in range(repeat):
+        result = subprocess.run(
+            [sys.executable, "-c", IMPORT_SNIPPET.format(module=module)],
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode != 0:
+            lines = result.stderr.strip().splitlines()
+            return None, lines[-1] if lines else f"exit code {result.returncode}"
+        best = min(best, float(result.stdout.strip().splitlines()[-1]))
+    return best, None
+
+
+def heaviest_packages(module, top):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+    )
+    # Lines look like: "import time:   self [us] | cumulative | imported package"
+    totals = defaultdict(int)
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:") :].split("|")
+        name = name.strip()
+        package = ".".join(name.split(".")[:2]) if name.startswith("pipecat.") else name.split(".")[0]
+        totals[package] += int(self_us)
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)[:top]
+
+
+def get_health(url):
+    try:
+        with urllib.request.urlopen(url, timeout=0.5) as response:
+            return json.loads(response.read())
+    except Exception:
+        return None
+
+
+def boot_times(port, timeout):
+    env = dict(os.environ, FAST_START="1")
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--port", str(port), "--log-level", "warning"],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}/health"
+    bound = warm = None
+    try:
+        while time.perf_counter() - start < timeout and server.poll() is None:
+            health = get_health(url)
+            if health:
+                bound = bound or time.perf_counter() - start
+                if health.get("warm"):
+                    warm = time.perf_counter() - start
+                    break
+            time.sleep(0.02)
+    finally:
+        server.terminate()
+        server.wait()
+    return bound, warm
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=12)
+    parser.add_argument("--no-boot", action="store_true")
+    parser.add_argument("--port", type=int, default=8799)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    args = parser.parse_args()
+
+    print(f"{'module':48}{'import ms':>12}")
+    for module in ("server", *PRELOAD_MODULES):
+        seconds, error = import_time(module, args.repeat)
+        if error:
+            print(f"{module:48}{'failed':>12}  {error}")
+        else:
+            print(f"{module:48}{seconds * 1000:>12.1f}")
+
+    print()
+    print("heaviest packages behind bot (self time)")
+    for package, self_us in heaviest_packages("bot", args.top):
+        print(f"  {package:46}{self_us / 1000:>12.1f}")
+
+    if args.no_boot:
+        return
+
+    print()
+    bound, warm = boot_times(args.port, args.timeout)
+    print(f"port bound after:  {f'{bound * 1000:.0f} ms' if bound else 'never'}")
+    print(f"pipeline warm after: {f'{warm * 1000:.0f} ms' if warm else 'not within timeout'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""Check the state store backends and time them.
+
+Run from the repository root:
+
+    python -m benchmarks.state_store [--redis-url URL] [--machines N] [--ops N]
+
+Runs each backend (memory, a SQLite file, and a Redis-protocol server)
+through the operations the handlers use, checking the results, and reports
+operations per second. Without `--redis-url` the Redis backend talks to a
+local stand-in server that implements the few commands the store sends.
+
+Then N "machines", each with its own store instance, send requests through
+the shared Airtable rate limiter for a few seconds. With the memory backend
+each machine keeps its own budget, so together they go over Airtable's 5
+requests per second; the shared backends keep them under it.
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from collections import deque
+
+from state import MemoryStore, RedisStore, SharedRateLimiter, SQLiteStore
+from state.redis_store import RESERVE_SCRIPT
+
+AIRTABLE_LIMIT = 5
+REQUESTS_PER_SEC = 4.0
+
+
+class FakeRedis:
+    """A Redis-protocol server holding its data in memory, with the commands
+    `RedisStore` uses: GET, SET (NX, PX), DEL, RPUSH, LPOP with a count, and
+    EVAL of its reserve script (run here in Python rather than Lua)."""
+
+    def __init__(self):
+        self.values = {}  # key -> (value, expires at or None)
+        self.lists = {}
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                args = []
+                for _ in range(int(line[1:])):
+                    length = int((await reader.readline())[1:])
+                    args.append((await reader.readexactly(length + 2))[:-2])
+                writer.write(self.command(args))
+                await writer.drain()
+        finally:
+            writer.close()
+
+    def _live(self, key):
+        entry = self.values.get(key)
+        if entry and entry[1] is not None and entry[1] <= time.monotonic():
+            del self.values[key]
+            return None
+        return entry
+
+    def command(self, args):
+        name, args = args[0].upper(), args[1:]
+        if name == b"GET":
+            entry = self._live(args[0])
+            return _bulk(entry[0] if entry else None)
+        if name == b"SET":
+            key, value, options = args[0], args[1], [a.upper() for a in args[2:]]
+            if b"NX" in options and self._live(key):
+                return _bulk(None)
+            expires_at = None
+            if b"PX" in options:
+                expires_at = time.monotonic() + int(args[2 + options.index(b"PX") + 1]) / 1000
+            self.values[key] = (value, expires_at)
+            return b"+OK\r\n"
+        if name == b"DEL":
+            removed = sum(
+                1 for key in args if self.values.pop(key, None) or self.lists.pop(key, None)
+            )
+            return b":%d\r\n" % removed
+        if name == b"RPUSH":
+            items = self.lists.setdefault(args[0], [])
+            items.extend(args[1:])
+            return b":%d\r\n" % len(items)
+        if name == b"LPOP":
+            items = self.lists.get(args[0], [])
+            count = int(args[1])
+            popped, self.lists[args[0]] = items[:count], items[count:]
+            if not popped:
+                return b"*-1\r\n"
+            return b"*%d\r\n" % len(popped) + b"".join(_bulk(item) for item in popped)
+        if name == b"EVAL" and args[0] == RESERVE_SCRIPT.encode():
+            key, now, interval = args[2], float(args[3]), float(args[4])
+            entry = self._live(key)
+            start = max(float(entry[0]) if entry else 0, now)
+            next_free = start + interval
+            self.values[key] = (repr(next_free).encode(), time.monotonic() + next_free - now)
+            return _bulk(repr(start).encode())
+        return b"-ERR unknown command\r\n"
+
+
+def _bulk(value):
+    if value is None:
+        return b"$-1\r\n"
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+async def check(store):
+    # The operations the handlers rely on, with the results they expect.
+    await store.set("booking:x", {"id": "rec1", "fields": {"Name": "A"}}, ttl=60)
+    assert await store.get("booking:x") == {"id": "rec1", "fields": {"Name": "A"}}
+    await store.delete("booking:x")
+    assert await store.get("booking:x") is None
+    assert await store.add("dedup", 1, ttl=0.2)
+    assert not await store.add("dedup", 1, ttl=0.2)
+    await asyncio.sleep(0.25)
+    assert await store.get("dedup") is None
+    assert await store.add("dedup", 1, ttl=0.2)
+    for i in range(3):
+        await store.push("queue", [i, f"message {i}"])
+    assert await store.pop_all("queue") == [[0, "message 0"], [1, "message 1"], [2, "message 2"]]
+    assert await store.pop_all("queue") == []
+    # A command cancelled while it waits for its reply (e.g. a function call
+    # timing out) doesn't leave the reply for the next one.
+    await store.set("a", "A")
+    await store.set("b", "B")
+    task = asyncio.create_task(store.get("a"))
+    await asyncio.sleep(0)
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    assert await store.get("b") == "B"
+    # Every caller waiting on a schedule gets a turn of its own, however far
+    # ahead the free turns have run.
+    delays = sorted(await asyncio.gather(*(store.reserve("turns", 1.0) for _ in range(150))))
+    assert delays[0] < 0.5 and delays[-1] > 148
+    assert all(later - earlier > 0.9 for earlier, later in zip(delays, delays[1:]))
+
+
+async def throughput(store, ops):
+    start = time.perf_counter()
+    for i in range(ops):
+        await store.set(f"bench:{i % 100}", {"value": i}, ttl=60)
+        await store.get(f"bench:{i % 100}")
+        await store.add(f"bench-add:{i}", 1, ttl=60)
+    return ops * 3 / (time.perf_counter() - start)
+
+
+async def machines(stores, seconds):
+    # Each store is one machine; every task is a call making Airtable requests.
+    starts = []
+
+    async def call(store):
+        limiter = SharedRateLimiter(store, "airtable:bench", REQUESTS_PER_SEC)
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            await limiter.wait()
+            starts.append(time.monotonic())
+
+    await asyncio.gather(*(call(store) for store in stores for _ in range(3)))
+    window, busiest = deque(), 0
+    for start in sorted(starts):
+        window.append(start)
+        while start - window[0] >= 1.0:
+            window.popleft()
+        busiest = max(busiest, len(window))
+    return len(starts) / (starts[-1] - starts[0]), busiest
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--redis-url")
+    parser.add_argument("--machines", type=int, default=3)
+    parser.add_argument("--ops", type=int, default=2000)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    args = parser.parse_args()
+
+    server = None
+    redis_url = args.redis_url
+    if not redis_url:
+        server = await asyncio.start_server(FakeRedis().handle, "127.0.0.1", 0)
+        redis_url = f"redis://127.0.0.1:{server.sockets[0].getsockname()[1]}/0"
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "state.db")
+        backends = {
+            "memory": lambda: MemoryStore(),
+            "sqlite": lambda: SQLiteStore(path),
+            "redis" if args.redis_url else "redis (stand-in)": lambda: RedisStore(redis_url),
+        }
+        for name, open_store in backends.items():
+            store = open_store()
+            await check(store)
+            ops_per_sec = await throughput(store, args.ops)
+            await store.close()
+
+            stores = [open_store() for _ in range(args.machines)]
+            rate, busiest = await machines(stores, args.seconds)
+            for store in stores:
+                await store.close()
+            verdict = "over the limit" if busiest > AIRTABLE_LIMIT else "ok"
+            print(
+                f"{name:18} checks passed, {ops_per_sec:,.0f} ops/s; {args.machines} machines "
+                f"sent {rate:.1f} req/s, busiest second {busiest} ({verdict})"
+            )
+
+    if server:
+        server.close()
+        await server.wait_closed()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,169 @@
+"""Measure what hedging TTS requests does to time to first audio.
+
+Run from the repository root:
+
+    python -m benchmarks.tts_hedging [--sentences N] [--hedge-ms MS] [--spike-rate P]
+
+Two local stand-in servers play ElevenLabs and Cartesia: each waits a
+time-to-first-byte before streaming a second of audio. ElevenLabs usually
+answers in about 250 ms, but a share of requests (`--spike-rate`) take 1.5
+to 3 seconds; Cartesia answers in about 300 ms. N sentences are spoken
+through HedgedTTSService with and without hedging, and the time from each
+request to its first audio is reported (p50/p95/p99), with how often the
+hedge was sent and how often it won, and the extra requests it cost.
+"""
+
+import argparse
+import asyncio
+import random
+import time
+
+from aiohttp import web
+
+from pipecat.clocks.system_clock import SystemClock
+from pipecat.frames.frames import EndFrame, StartFrame, TTSAudioRawFrame
+
+from breakers import CircuitBreaker
+from services.hedged_tts import (
+    TTS_UTTERANCES,
+    CartesiaStream,
+    ElevenLabsStream,
+    HedgedTTSService,
+)
+
+AUDIO = bytes(32000)  # a second of 16 kHz audio
+
+
+class LocalElevenLabs(ElevenLabsStream):
+    url = ""
+
+    def request(self, text, sample_rate):
+        _, headers, payload = super().request(text, sample_rate)
+        return self.url, headers, payload
+
+
+class LocalCartesia(CartesiaStream):
+    url = ""
+
+    def request(self, text, sample_rate):
+        _, headers, payload = super().request(text, sample_rate)
+        return self.url, headers, payload
+
+
+def provider_app(ttfb, requests):
+    async def handler(request):
+        requests.append(time.monotonic())
+        await asyncio.sleep(ttfb())
+        response = web.StreamResponse()
+        try:
+            await response.prepare(request)
+            for i in range(0, len(AUDIO), 3200):
+                await response.write(AUDIO[i : i + 3200])
+                await asyncio.sleep(0.01)
+        except ConnectionError:
+            pass  # the request lost the race and was cancelled
+        return response
+
+    app = web.Application()
+    app.router.add_post("/{tail:.*}", handler)
+    return app
+
+
+async def serve(app):
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/"
+
+
+def spoken():
+    # {(provider, how): sentences} so far, from the service's own counter.
+    return {
+        (sample.labels["provider"], sample.labels["how"]): sample.value
+        for metric in TTS_UTTERANCES.collect()
+        for sample in metric.samples
+        if sample.name.endswith("_total")
+    }
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+async def speak(sentences, hedge, hedge_secs):
+    # Fresh breakers that won't open, so this measures the hedge alone.
+    breakers = {
+        name: CircuitBreaker(name, timeout_secs=10, slow_call_secs=10, min_calls=10**6)
+        for name in ("elevenlabs", "cartesia")
+    }
+    service = HedgedTTSService(
+        primary=LocalElevenLabs(api_key="", voice_id="voice"),
+        secondary=LocalCartesia(api_key="", voice_id="voice"),
+        breakers=breakers,
+        hedge=hedge,
+        hedge_secs=hedge_secs,
+    )
+    await service.start(StartFrame(clock=SystemClock()))
+    before = spoken()
+    ttfas = []
+    for i in range(sentences):
+        # Each sentence starts a new reply, so each one is hedged.
+        service._speaking = None
+        start = time.monotonic()
+        first = None
+        async for frame in service.run_tts(f"Sentence {i}."):
+            if isinstance(frame, TTSAudioRawFrame) and first is None:
+                first = time.monotonic() - start
+        ttfas.append(first)
+    await service.stop(EndFrame())
+    outcomes = {}
+    for (provider, how), count in spoken().items():
+        if count > before.get((provider, how), 0):
+            outcomes[how] = outcomes.get(how, 0) + int(count - before.get((provider, how), 0))
+    return ttfas, outcomes
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sentences", type=int, default=200)
+    parser.add_argument("--hedge-ms", type=float, default=500.0)
+    parser.add_argument("--spike-rate", type=float, default=0.1)
+    args = parser.parse_args()
+    random.seed(1)
+
+    def elevenlabs_ttfb():
+        if random.random() < args.spike_rate:
+            return random.uniform(1.5, 3.0)
+        return random.gauss(0.25, 0.05)
+
+    elevenlabs_requests, cartesia_requests = [], []
+    runners = []
+    for stream, ttfb, requests in (
+        (LocalElevenLabs, elevenlabs_ttfb, elevenlabs_requests),
+        (LocalCartesia, lambda: random.gauss(0.3, 0.05), cartesia_requests),
+    ):
+        runner, stream.url = await serve(provider_app(lambda t=ttfb: max(0.05, t()), requests))
+        runners.append(runner)
+
+    print(f"{args.sentences} sentences, ElevenLabs slow on {args.spike_rate:.0%} of them")
+    for hedge in (False, True):
+        del elevenlabs_requests[:], cartesia_requests[:]
+        ttfas, outcomes = await speak(args.sentences, hedge, args.hedge_ms / 1000)
+        label = f"hedged at {args.hedge_ms:.0f} ms" if hedge else "primary only"
+        extra = len(cartesia_requests) / args.sentences
+        print(
+            f"{label:18} time to first audio p50 {percentile(ttfas, 50) * 1000:.0f} ms, "
+            f"p95 {percentile(ttfas, 95) * 1000:.0f} ms, p99 {percentile(ttfas, 99) * 1000:.0f} ms; "
+            f"{', '.join(f'{how} {n}' for how, n in sorted(outcomes.items()))}; "
+            f"extra requests {extra:.0%}"
+        )
+
+    for runner in runners:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,36 +1,26 @@
 import os
-import sys
+import functools
+import json
 from datetime import datetime, timedelta
 import asyncio
-import aiohttp
 import pytz
 import re
 from urllib.parse import urlencode
 from pipecat.frames.frames import TextFrame, EndFrame, LLMMessagesFrame
-from openai.types.chat import ChatCompletionToolParam
-from pipecat.services.openai import OpenAILLMContext, OpenAILLMService
-from pipecat.processors.user_idle_processor import UserIdleProcessor
+from pipecat.services.openai import OpenAILLMContext
 
 from pipecat.pipeline.pipeline import Pipeline
 from pipecat.pipeline.runner import PipelineRunner
 from pipecat.pipeline.task import PipelineParams, PipelineTask
 
-from pipecat.processors.aggregators.llm_response import (
-    LLMAssistantResponseAggregator,
-    LLMUserResponseAggregator,
-)
 from pipecat.services.elevenlabs import ElevenLabsTTSService
 
-from pipecat.services.cartesia import CartesiaTTSService
-from pipecat.services.openai import OpenAILLMService
 from pipecat.services.deepgram import DeepgramSTTService
 from pipecat.transports.network.fastapi_websocket import (
     FastAPIWebsocketTransport,
     FastAPIWebsocketParams,
 )
 from pipecat.vad.silero import SileroVADAnalyzer
-from pipecat.serializers.twilio import TwilioFrameSerializer
-from twilio.rest import Client
 
 from loguru import logger
 
@@ -38,268 +28,33 @@ from dotenv import load_dotenv
 
 load_dotenv(override=True)
 
-logger.remove(0)
-logger.add(sys.stderr, level="DEBUG")
-
-AIRTABLE_API_KEY = os.getenv("AIRTABLE_API_KEY")
-AIRTABLE_BASE_ID = os.getenv("AIRTABLE_BASE_ID")
-AIRTABLE_BOOKINGS_TABLE = os.getenv("AIRTABLE_BOOKINGS_TABLE")
-
+from breakers import breakers
+from serializers import FastTwilioFrameSerializer
+from processors import (
+    IdleCallReaper,
+    PhoneTextAggregator,
+    ScriptedConfirmations,
+    TimeToFirstAudioObserver,
+    ToolLatencyFiller,
+    TurnCompletionDetector,
+    TwilioPlayoutTracker,
+)
+from services import (
+    CartesiaStream,
+    ElevenLabsStream,
+    HedgedTTSService,
+    RoutedOpenAILLMService,
+    phrase_cache_for,
+)
+from recording import CallAudioRecorder, CallRecorder
+from call_memory import call_memory
+from tenants import Tenant, tenants, use_tenant
 
 # Import functions
-from functions import (
-    find_booking,
-    update_terminal,
-    update_registration,
-    update_phone_number,
-    transfer_call,
-    whatsapp_message,
-    find_booking_by_phone,
-    update_eta,
-    handle_get_current_time,
-    handle_get_current_date,
-)
+from functions import TOOLS, Booking, call_middleware, format_booking, register_tools
 
 
-async def run_bot(websocket_client, stream_sid):
-    async with aiohttp.ClientSession() as session:
-        try:
-            transport = FastAPIWebsocketTransport(
-                websocket=websocket_client,
-                params=FastAPIWebsocketParams(
-                    audio_out_enabled=True,
-                    add_wav_header=False,
-                    vad_enabled=True,
-                    vad_analyzer=SileroVADAnalyzer(),
-                    vad_audio_passthrough=True,
-                    serializer=TwilioFrameSerializer(stream_sid),
-                ),
-            )
-
-            llm = OpenAILLMService(api_key=os.getenv("OPENAI_API_KEY"), model="gpt-4o")
-
-            # Register functions
-            llm.register_function("find_booking", find_booking)
-            llm.register_function("update_terminal", update_terminal)
-            llm.register_function("update_registration", update_registration)
-            llm.register_function("update_phone_number", update_phone_number)
-            llm.register_function("transfer_call", transfer_call)
-            llm.register_function("whatsapp_message", whatsapp_message)
-            llm.register_function("find_booking_by_phone", find_booking_by_phone)
-            llm.register_function("update_eta", update_eta)
-            llm.register_function("get_current_time", handle_get_current_time)
-            llm.register_function("get_current_date", handle_get_current_date)
-
-            stt = DeepgramSTTService(api_key=os.getenv("DEEPGRAM_API_KEY"))
-
-            # stt = GladiaSTTService(
-            #     api_key=os.getenv("GLADIA_API_KEY"),
-            # )
-
-            # tts = DeepgramTTSService(
-            #     aiohttp_session=session,
-            #     api_key=os.getenv("DEEPGRAM_API_KEY"),
-            #     voice="aura-helios-en",
-            #     encoding="linear16",  # or "mulaw" or "alaw" for streaming
-            #     sample_rate=16000,  # choose an appropriate sample rate
-            #     container="none",  # This is the key change
-            # )
-
-            # tts = CartesiaTTSService(
-            #     api_key=os.getenv("CARTESIA_API_KEY"),
-            #     voice_id="641a6ee5-9427-47de-8f81-c92025db1a4b",  # British Customer Support
-            #     # speed=1,
-            #     # emotions="positive",
-            # )
-
-            tts = ElevenLabsTTSService(
-                api_key=os.getenv("ELEVENLABS_API_KEY", ""),
-                voice_id=os.getenv("ELEVENLABS_VOICE_ID", ""),
-            )
-
-            tools = [
-                ChatCompletionToolParam(
-                    type="function",
-                    function={
-                        "name": "find_booking",
-                        "description": "Find a booking by registration number",
-                        "parameters": {
-                            "type": "object",
-                            "properties": {
-                                "registration": {
-                                    "type": "string",
-                                    "description": "The vehicle registration number",
-                                },
-                            },
-                            "required": ["registration"],
-                        },
-                    },
-                ),
-                ChatCompletionToolParam(
-                    type="function",
-                    function={
-                        "name": "update_terminal",
-                        "description": "Update the terminal for a booking",
-                        "parameters": {
-                            "type": "object",
-                            "properties": {
-                                "registration": {
-                                    "type": "string",
-                                    "description": "The vehicle registration number",
-                                },
-                                "terminal": {
-                                    "type": "string",
-                                    "description": "The new terminal (e.g., 'Terminal 1', 'Terminal 2', 'Terminal 3')",
-                                },
-                            },
-                            "required": ["registration", "terminal"],
-                        },
-                    },
-                ),
-                ChatCompletionToolParam(
-                    type="function",
-                    function={
-                        "name": "update_registration",
-                        "description": "Update the registration number for a booking",
-                        "parameters": {
-                            "type": "object",
-                            "properties": {
-                                "old_registration": {
-                                    "type": "string",
-                                    "description": "The current vehicle registration number",
-                                },
-                                "new_registration": {
-                                    "type": "string",
-                                    "description": "The new vehicle registration number",
-                                },
-                            },
-                            "required": ["old_registration", "new_registration"],
-                        },
-                    },
-                ),
-                ChatCompletionToolParam(
-                    type="function",
-                    function={
-                        "name": "update_phone_number",
-                        "description": "Update the phone number for a booking",
-                        "parameters": {
-                            "type": "object",
-                            "properties": {
-                                "registration": {
-                                    "type": "string",
-                                    "description": "The vehicle registration number",
-                                },
-                                "phone_number": {
-                                    "type": "string",
-                                    "description": "The new phone number",
-                                },
-                            },
-                            "required": ["registration", "phone_number"],
-                        },
-                    },
-                ),
-                ChatCompletionToolParam(
-                    type="function",
-                    function={
-                        "name": "transfer_call",
-                        "description": "Transfer the current call to a human agent",
-                        "parameters": {
-                            "type": "object",
-                            "properties": {
-                                "call_sid": {
-                                    "type": "string",
-                                    "description": "The unique identifier for the current call",
-                                },
-                            },
-                            "required": ["call_sid"],
-                        },
-                    },
-                ),
-                ChatCompletionToolParam(
-                    type="function",
-                    function={
-                        "name": "whatsapp_message",
-                        "description": "Send a WhatsApp message to notify staff about a new booking",
-                        "parameters": {
-                            "type": "object",
-                            "properties": {
-                                "registration": {
-                                    "type": "string",
-                                    "description": "The vehicle registration number",
-                                },
-                            },
-                            "required": ["registration"],
-                        },
-                    },
-                ),
-                ChatCompletionToolParam(
-                    type="function",
-                    function={
-                        "name": "find_booking_by_phone",
-                        "description": "Find a booking using the customer's phone number",
-                        "parameters": {
-                            "type": "object",
-                            "properties": {
-                                "phone_number": {
-                                    "type": "string",
-                                    "description": "The customer's phone number",
-                                },
-                            },
-                            "required": ["phone_number"],
-                        },
-                    },
-                ),
-                ChatCompletionToolParam(
-                    type="function",
-                    function={
-                        "name": "update_eta",
-                        "description": "Update the estimated time of arrival (ETA) for a booking",
-                        "parameters": {
-                            "type": "object",
-                            "properties": {
-                                "registration": {
-                                    "type": "string",
-                                    "description": "The vehicle registration number",
-                                },
-                                "customer_eta": {
-                                    "type": "string",
-                                    "description": "The customer's estimated time of arrival. Can be a relative time (e.g., '30 minutes' or '2 hours') or an exact time (e.g., '4:30 PM')",
-                                },
-                            },
-                            "required": ["registration", "customer_eta"],
-                        },
-                    },
-                ),
-                ChatCompletionToolParam(
-                    type="function",
-                    function={
-                        "name": "get_current_time",
-                        "description": "Get the current time in UK timezone",
-                        "parameters": {
-                            "type": "object",
-                            "properties": {},  # This function doesn't require any parameters
-                            "required": [],
-                        },
-                    },
-                ),
-                ChatCompletionToolParam(
-                    type="function",
-                    function={
-                        "name": "get_current_date",
-                        "description": "Get the current date in UK timezone",
-                        "parameters": {
-                            "type": "object",
-                            "properties": {},  # This function doesn't require any parameters
-                            "required": [],
-                        },
-                    },
-                ),
-            ]
-
-            messages = [
-                {
-                    "role": "system",
-                    "content": """You are Jessica, the virtual assistant for Manchester Airport Parking. Your output is being converted to audio. You have a youthful and cheery personality. Your goal is to assist customers efficiently and professionally with their parking reservations.
+SYSTEM_PROMPT = """You are Jessica, the virtual assistant for Manchester Airport Parking. Your output is being converted to audio. You have a youthful and cheery personality. Your goal is to assist customers efficiently and professionally with their parking reservations.
 
 Main Objective:
 Assist customers with Manchester Airport Parking reservations for car drop-offs and pick-ups efficiently and professionally, following a specific conversation flow.
@@ -327,6 +82,7 @@ Key Guidelines:
 
 5. Error Handling:
    - If a function call fails, acknowledge the issue and offer an alternative solution
+   - If a function result says "unavailable", follow its instructions: don't call that function again, and offer to transfer the caller to a member of staff
    - Provide clear instructions or prompts to help the user rectify the issue
 
 6. Confirmation Efficiency:
@@ -389,11 +145,9 @@ For Both Drop-offs and Collections:
 
 3. For Drop-offs - Estimated Arrival Time:
    - Ask Politely: "Could you please tell me your estimated arrival time? You might want to check your navigation system for an accurate time."
-   - Handle Varied Responses: If the customer provides an estimate like "in 30 minutes," calculate the actual time
-   - Use the get_current_time function to get the current time
-   - Calculate the Estimated Arrival Time based on the current time and the customer's input
-   - Confirm ETA with Customer: "Based on the current time of [Current Time], your estimated arrival time would be approximately [Estimated Arrival Time]. Is this correct?"
-   - Important: Only if the customer confirms, proceed to execute the `update_eta` function
+   - Record It Straight Away: Call the `update_eta` function with the customer's own words for the time, e.g. "half an hour" or "quarter past four". Do not work out the time yourself or call get_current_time first
+   - Confirm ETA with Customer: Read back the `confirmation` from the result: "I've noted your arrival time as [confirmation]. Is that right?"
+   - If the customer corrects it, call `update_eta` again with their correction. If the result says the time wasn't understood, ask them to say it another way
 
 4. For Drop-offs - Provide Drop-off Instructions:
    - "Please ensure you go to the [Allocated Car Park]; a driver will be there to meet you."
@@ -448,9 +202,8 @@ Important Notes and Critical Reminders:
 - Conversation Progress: Always be aware of which details have been confirmed and which are next in the sequence. Do not go back to reconfirm details unless the customer explicitly requests it
 - Registration Numbers: Always pronounce with clear pauses, e.g., "V-E-6-8-V-E-P"
 - Phone Numbers: Always use the format "0742-111-7301"
-- ETA Calculation:
-  - Calculate the ETA accurately based on the current time and the customer's estimated arrival time
-  - Use the update_eta function with the calculated ETA
+- ETA Updates:
+  - Pass the customer's words for their arrival time straight to the update_eta function; it works out the time and returns a confirmation to read back
 - Function Execution Rules:
   - Complete each function call in a single step and wait for its result before proceeding to the next step or making another call
   - Do Not Share Raw Function Data: Keep function data confidential
@@ -512,51 +265,255 @@ Critical Instructions:
 4. Function Calls: Always wait for the result of each function call before proceeding to the next step or making another call.
 
 Remember: Your goal is to provide efficient, accurate assistance while maintaining a natural, non-repetitive conversation flow. Adapt your responses based on the context and information already provided by the customer.
-""",
+"""
+
+
+@functools.cache
+def tenant_tools(tenant: Tenant) -> list:
+    """The tools offered on the tenant's calls. Built once per tenant."""
+    return [tool.schema() for tool in TOOLS if tenant.tools is None or tool.name in tenant.tools]
+
+
+@functools.cache
+def system_prompt(tenant: Tenant) -> str:
+    """The tenant's system prompt, read once: its own file or the stock prompt."""
+    if tenant.prompt_file:
+        with open(tenant.prompt_file) as f:
+            return f.read()
+    return SYSTEM_PROMPT.replace("Manchester Airport Parking", tenant.business_name)
+
+
+def greeting(tenant: Tenant) -> str:
+    return tenant.greeting or (
+        f"Hello! Welcome to {tenant.business_name}. "
+        "Are you dropping off a car or collecting one after landing??"
+    )
+
+
+def create_services(tenant: Tenant):
+    """Creates the STT, LLM and TTS services used on the tenant's live calls."""
+    # Short conversational turns go to LLM_FAST_MODEL, everything else to
+    # gpt-4o. Set LLM_FAST_MODEL to an empty string to use gpt-4o throughout.
+    llm = RoutedOpenAILLMService(
+        api_key=os.getenv("OPENAI_API_KEY"),
+        model="gpt-4o",
+        fast_model=os.getenv("LLM_FAST_MODEL", "gpt-4o-mini"),
+        breaker=breakers["openai"],
+    )
+
+    # Register functions. Every call goes through the same middleware
+    # (functions.registry): argument checks, timing, a timeout, error
+    # results, and reuse of an identical call's result (e.g. one re-issued
+    # after an interruption) instead of running it again.
+    register_tools(llm, TOOLS, call_middleware())
+
+    stt = DeepgramSTTService(api_key=os.getenv("DEEPGRAM_API_KEY"))
+    breakers["deepgram"].watch_connect(stt, lambda stt: stt._connection.is_connected())
+
+    # stt = GladiaSTTService(
+    #     api_key=os.getenv("GLADIA_API_KEY"),
+    # )
+
+    # tts = DeepgramTTSService(
+    #     aiohttp_session=session,
+    #     api_key=os.getenv("DEEPGRAM_API_KEY"),
+    #     voice="aura-helios-en",
+    #     encoding="linear16",  # or "mulaw" or "alaw" for streaming
+    #     sample_rate=16000,  # choose an appropriate sample rate
+    #     container="none",  # This is the key change
+    # )
+
+    if "cartesia" in tenant.tts_providers:
+        # ElevenLabs, hedged or backed up by Cartesia in the tenant's
+        # fallback voice (e.g. 641a6ee5-9427-47de-8f81-c92025db1a4b, British
+        # Customer Support).
+        tts = HedgedTTSService(
+            primary=ElevenLabsStream(
+                api_key=os.getenv("ELEVENLABS_API_KEY", ""), voice_id=tenant.voice_id
+            ),
+            secondary=CartesiaStream(
+                api_key=os.getenv("CARTESIA_API_KEY", ""), voice_id=tenant.fallback_voice_id
+            ),
+            breakers=breakers,
+            hedge=tenant.tts_fallback == "hedge",
+            hedge_secs=float(os.getenv("TTS_HEDGE_MS", "500")) / 1000,
+        )
+    else:
+        tts = ElevenLabsTTSService(
+            api_key=os.getenv("ELEVENLABS_API_KEY", ""),
+            voice_id=tenant.voice_id,
+        )
+        breakers["elevenlabs"].watch_connect(tts, lambda tts: tts._websocket is not None)
+
+    return stt, llm, tts
+
+
+def outbound_call_messages(booking: Booking) -> list:
+    """Context for an outbound ETA call: the booking as a find_booking call and result."""
+    result = format_booking(booking)
+    registration = result["registration"]
+    tool_call_id = "call_campaign_booking"
+    return [
+        {
+            "role": "system",
+            "content": "This is an outbound call you placed to the customer about their "
+            "upcoming drop-off. Their booking has already been found below, so don't ask for "
+            "their registration. Ask what time they expect to arrive, record it with "
+            "update_eta, give the drop-off instructions and conclude the call.",
+        },
+        {
+            "role": "assistant",
+            "tool_calls": [
+                {
+                    "id": tool_call_id,
+                    "type": "function",
+                    "function": {
+                        "name": "find_booking",
+                        "arguments": json.dumps({"registration": registration, "is_arrival": False}),
+                    },
                 }
-            ]
-
-            context = OpenAILLMContext(messages, tools)
-            context_aggregator = llm.create_context_aggregator(context)
-
-            pipeline = Pipeline(
-                [
-                    transport.input(),
-                    stt,
-                    # user_idle,
-                    context_aggregator.user(),
-                    llm,
-                    tts,
-                    transport.output(),
-                    context_aggregator.assistant(),
-                ]
-            )
-
-            task = PipelineTask(
-                pipeline,
-                PipelineParams(
-                    allow_interruptions=True,
-                    enable_metrics=True,
-                    report_only_initial_ttfb=True,
-                ),
-            )
-
-            @transport.event_handler("on_client_connected")
-            async def on_client_connected(transport, client):
-                # Kick off the conversation.
-                await tts.say(
-                    "Hello! Welcome to Manchester Airport Parking. Are you dropping off a car or collecting one after landing??"
-                )
-
-            @transport.event_handler("on_client_disconnected")
-            async def on_client_disconnected(transport, client):
-                await task.queue_frames([EndFrame()])
-
-            runner = PipelineRunner(handle_sigint=False)
+            ],
+        },
+        # Function results are added to the context JSON-encoded.
+        {"role": "tool", "tool_call_id": tool_call_id, "content": json.dumps(json.dumps(result))},
+    ]
+
+
+def outbound_greeting(booking: Booking, tenant: Tenant) -> str:
+    name = booking.name.split(" ")[0]
+    return (
+        f"Hello{' ' + name if name else ''}, this is Jessica from {tenant.business_name}, "
+        "calling about your upcoming drop-off. What time do you expect to arrive?"
+    )
+
+
+async def run_bot(
+    websocket_client, stream_sid, call_sid=None, services=None, booking=None, tenant=None
+):
+    # `booking` is the Booking for an outbound campaign call, which
+    # is answered by the same pipeline with the booking already looked up.
+    # `tenant` is the business the call is for; the function handlers read
+    # it through tenants.current_tenant().
+    tenant = tenant or tenants.default
+    use_tenant(tenant)
+    phrases = phrase_cache_for(tenant.voice_id)
+    # Records the call for offline replay when RECORDINGS_DIR is set.
+    recorder = CallRecorder.from_env(stream_sid, call_sid)
+    # Records both sides of the call to a WAV file when CALL_AUDIO_DIR is set.
+    audio = CallAudioRecorder.from_env(stream_sid)
+    # Checks that everything the call allocated is freed after hangup.
+    memory = call_memory.start(stream_sid)
+    context = None
+
+    try:
+        serializer = FastTwilioFrameSerializer(stream_sid)
+
+        transport = FastAPIWebsocketTransport(
+            websocket=websocket_client,
+            params=FastAPIWebsocketParams(
+                audio_out_enabled=True,
+                add_wav_header=False,
+                vad_enabled=True,
+                vad_analyzer=SileroVADAnalyzer(),
+                vad_audio_passthrough=True,
+                serializer=serializer,
+            ),
+        )
+
+        # Paces bot audio to Twilio and flushes it on barge-in.
+        playout = TwilioPlayoutTracker(websocket_client, stream_sid, serializer)
+
+        # Checks in on silent callers, then ends the call.
+        idle_reaper = IdleCallReaper(phrases)
+
+        # The real services unless replaying a recorded call.
+        stt, llm, tts = services or create_services(tenant)
+
+        tools = tenant_tools(tenant)
+
+        messages = [{"role": "system", "content": system_prompt(tenant)}]
+
+        if booking:
+            messages += outbound_call_messages(booking)
+
+        context = OpenAILLMContext(messages, tools)
+        context_aggregator = llm.create_context_aggregator(context)
+
+        processors = [
+            transport.input(),
+            audio.tap("caller"),
+            recorder.tap("input"),
+            stt,
+            recorder.tap("stt"),
+            idle_reaper,
+            # Keeps the turn open while a registration or phone number is
+            # still being read out.
+            TurnCompletionDetector(context),
+            context_aggregator.user(),
+            # Runs the post-lookup confirmations without the LLM when
+            # SCRIPTED_CONFIRMATIONS=1; counts local and LLM turns either way.
+            ScriptedConfirmations(enabled=os.getenv("SCRIPTED_CONFIRMATIONS", "0") == "1"),
+            recorder.tap("llm_in"),
+            llm,
+            recorder.tap("llm_out"),
+            PhoneTextAggregator(),
+            recorder.tap("tts_in"),
+            tts,
+            recorder.tap("tts_out"),
+            ToolLatencyFiller(phrases),
+            TimeToFirstAudioObserver(),
+            playout.pacer(),
+            audio.tap("bot"),
+            transport.output(),
+            playout.marker(),
+            context_aggregator.assistant(),
+        ]
+        # Taps are None when recording is off.
+        pipeline = Pipeline([p for p in processors if p])
+        memory.track(websocket_client, transport, serializer, playout, context, *processors)
+        if services is None:
+            memory.track(stt, llm, tts)
+
+        task = PipelineTask(
+            pipeline,
+            PipelineParams(
+                allow_interruptions=True,
+                enable_metrics=True,
+                report_only_initial_ttfb=True,
+            ),
+        )
+
+        @transport.event_handler("on_client_connected")
+        async def on_client_connected(transport, client):
+            # Kick off the conversation.
+            if booking:
+                await tts.say(outbound_greeting(booking, tenant))
+                return
+            await tts.say(greeting(tenant))
+
+        @transport.event_handler("on_client_disconnected")
+        async def on_client_disconnected(transport, client):
+            await task.queue_frames([EndFrame()])
+
+        @idle_reaper.event_handler("on_teardown_timeout")
+        async def on_teardown_timeout(reaper):
+            await task.cancel()
+
+        runner = PipelineRunner(handle_sigint=False)
+        memory.track(pipeline, task, runner)
 
+        try:
             await runner.run(task)
-
-        except Exception as e:
-            logger.error(f"Error in run_bot: {str(e)}")
-        finally:
-            print("Customer has ended call")
+        except asyncio.CancelledError:
+            # A cancelled task surfaces here as CancelledError. Only
+            # propagate it if this coroutine itself is being cancelled.
+            if asyncio.current_task().cancelling():
+                raise
+
+    except Exception as e:
+        logger.error(f"Error in run_bot: {str(e)}")
+    finally:
+        recorder.close()
+        audio.close()
+        memory.finish(context)
+        logger.info("Customer has ended call")
@@ -0,0 +1,276 @@
+"""Circuit breakers for the services a call depends on.
+
+There is one `CircuitBreaker` per upstream (Airtable, Twilio, OpenAI,
+Deepgram, ElevenLabs) in `breakers`, shared by every call in the process.
+Each request through a breaker is given `timeout_secs`, and its outcome is
+recorded: an error, a timeout, or a response slower than `slow_call_secs`
+counts as a failure. Once at least `min_calls` of the last `window` requests
+have been made and `failure_rate` of them failed, the breaker opens and
+requests fail at once with `CircuitOpenError` instead of waiting on a
+service that is down. After `open_secs` one request is let through as a
+probe (half-open): if it succeeds the breaker closes, if not it opens again.
+
+Breaker state is on /health and in `circuit_breaker_state`, with outcomes in
+`circuit_breaker_calls_total`.
+"""
+
+import asyncio
+import inspect
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from loguru import logger
+from prometheus_client import Counter, Gauge
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+CIRCUIT_BREAKER_STATE = Gauge(
+    "circuit_breaker_state", "Circuit breaker state: 0 closed, 1 half-open, 2 open", ["upstream"]
+)
+CIRCUIT_BREAKER_CALLS = Counter(
+    "circuit_breaker_calls_total",
+    "Requests to an upstream by outcome: success, failure, slow or rejected (breaker open)",
+    ["upstream", "result"],
+)
+CIRCUIT_BREAKER_TRANSITIONS = Counter(
+    "circuit_breaker_transitions_total", "Circuit breaker state changes", ["upstream", "state"]
+)
+
+# Per-upstream (timeout, slow call) seconds. For OpenAI the timeout covers
+# the request until its response starts streaming; for Deepgram and
+# ElevenLabs' websocket, opening it; for TTS over HTTP, the first audio.
+UPSTREAM_LIMITS = {
+    "airtable": (5.0, 2.0),
+    "twilio": (10.0, 4.0),
+    "openai": (5.0, 3.0),
+    "deepgram": (5.0, 2.0),
+    "elevenlabs": (5.0, 2.0),
+    "cartesia": (5.0, 2.0),
+}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of making a request while the upstream's breaker is open."""
+
+    def __init__(self, name: str):
+        super().__init__(f"{name} is unavailable (circuit breaker open)")
+        self.name = name
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        name: str,
+        *,
+        timeout_secs: float,
+        slow_call_secs: float,
+        failure_rate: float = 0.5,
+        min_calls: int = 5,
+        window: int = 20,
+        open_secs: float = 30.0,
+    ):
+        self.name = name
+        self.timeout_secs = timeout_secs
+        self.slow_call_secs = slow_call_secs
+        self._failure_rate = failure_rate
+        self._min_calls = min_calls
+        self._open_secs = open_secs
+        self._outcomes = deque(maxlen=window)  # True for a failure
+        self.state = CLOSED
+        self._opened_at = 0.0
+        self._probe_started = None
+        CIRCUIT_BREAKER_STATE.labels(upstream=name).set(0)
+
+    @property
+    def is_open(self) -> bool:
+        """True while requests would be turned away."""
+        return self._rejects(time.monotonic())
+
+    def _rejects(self, now: float) -> bool:
+        if self.state == OPEN:
+            return now - self._opened_at < self._open_secs
+        if self.state == HALF_OPEN:
+            # A probe that never reported back (cancelled) doesn't hold the
+            # breaker half-open for good.
+            return (
+                self._probe_started is not None
+                and now - self._probe_started < 2 * self.timeout_secs
+            )
+        return False
+
+    def check(self):
+        """Raises CircuitOpenError if a request now would be turned away."""
+        if self.is_open:
+            CIRCUIT_BREAKER_CALLS.labels(upstream=self.name, result="rejected").inc()
+            raise CircuitOpenError(self.name)
+
+    def acquire(self):
+        """Like `check`, but lets the request through as the probe when it's time for one."""
+        now = time.monotonic()
+        if self._rejects(now):
+            CIRCUIT_BREAKER_CALLS.labels(upstream=self.name, result="rejected").inc()
+            raise CircuitOpenError(self.name)
+        if self.state == OPEN:
+            self._transition(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            self._probe_started = now
+
+    def record(self, ok: bool, seconds: float):
+        """Records a request's outcome, opening or closing the breaker as needed."""
+        slow = ok and seconds > self.slow_call_secs
+        failed = not ok or slow
+        result = "failure" if not ok else "slow" if slow else "success"
+        CIRCUIT_BREAKER_CALLS.labels(upstream=self.name, result=result).inc()
+
+        if self.state == HALF_OPEN:
+            self._probe_started = None
+            if failed:
+                self._open("the probe request failed")
+            else:
+                self._outcomes.clear()
+                self._transition(CLOSED)
+            return
+        if self.state == OPEN:
+            # Started before the breaker opened.
+            return
+        self._outcomes.append(failed)
+        if (
+            len(self._outcomes) >= self._min_calls
+            and sum(self._outcomes) >= self._failure_rate * len(self._outcomes)
+        ):
+            self._open(
+                f"{sum(self._outcomes)} of the last {len(self._outcomes)} requests failed or were slow"
+            )
+
+    def release(self):
+        """Gives up a probe that ended without an outcome (cancelled)."""
+        if self.state == HALF_OPEN:
+            self._probe_started = None
+
+    def _open(self, reason: str):
+        logger.warning(
+            f"Circuit breaker for {self.name} opened ({reason}); failing fast for "
+            f"{self._open_secs:g}s"
+        )
+        self._opened_at = time.monotonic()
+        self._transition(OPEN)
+
+    def _transition(self, state: str):
+        if state != OPEN:
+            logger.info(f"Circuit breaker for {self.name} is {state.replace('_', '-')}")
+        self.state = state
+        CIRCUIT_BREAKER_STATE.labels(upstream=self.name).set(STATE_VALUES[state])
+        CIRCUIT_BREAKER_TRANSITIONS.labels(upstream=self.name, state=state).inc()
+
+    @asynccontextmanager
+    async def guard(self):
+        """Runs the block as one request: fails fast while open, times it out
+        after `timeout_secs` and records the outcome."""
+        self.acquire()
+        start = time.monotonic()
+        try:
+            async with asyncio.timeout(self.timeout_secs):
+                yield
+        except asyncio.CancelledError:
+            self.release()
+            raise
+        except Exception:
+            self.record(False, time.monotonic() - start)
+            raise
+        self.record(True, time.monotonic() - start)
+
+    def trace_config(self):
+        """An aiohttp TraceConfig that puts every request of a session through
+        the breaker. 5xx and 429 responses count as failures."""
+        import aiohttp
+
+        async def on_request_start(session, ctx, params):
+            self.acquire()
+            ctx.start = time.monotonic()
+
+        async def on_request_end(session, ctx, params):
+            failed = params.response.status >= 500 or params.response.status == 429
+            self.record(not failed, time.monotonic() - ctx.start)
+
+        async def on_request_exception(session, ctx, params):
+            if not hasattr(ctx, "start"):
+                return
+            if isinstance(params.exception, asyncio.CancelledError):
+                self.release()
+            else:
+                self.record(False, time.monotonic() - ctx.start)
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_request_end.append(on_request_end)
+        trace_config.on_request_exception.append(on_request_exception)
+        return trace_config
+
+    def session(self, **kwargs):
+        """An aiohttp ClientSession whose requests go through the breaker,
+        each timed out after `timeout_secs`."""
+        import aiohttp
+
+        return aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=self.timeout_secs),
+            trace_configs=[self.trace_config()],
+            **kwargs,
+        )
+
+    def watch_connect(self, service, connected):
+        """Puts a pipecat websocket service's connects through the breaker.
+
+        pipecat's services log a failed connect and carry on without a
+        connection, so success is judged by `connected(service)` (which may
+        be async) afterwards.
+        """
+        connect = service._connect
+
+        async def _connect():
+            start = time.monotonic()
+            try:
+                async with asyncio.timeout(self.timeout_secs):
+                    await connect()
+            except Exception as e:
+                logger.error(f"{self.name} connect failed: {e!r}")
+            ok = connected(service)
+            if inspect.isawaitable(ok):
+                ok = await ok
+            self.record(bool(ok), time.monotonic() - start)
+
+        service._connect = _connect
+        return service
+
+    def status(self) -> dict:
+        return {"state": self.state, "recent_failures": sum(self._outcomes)}
+
+
+def _from_env(name: str) -> CircuitBreaker:
+    timeout_secs, slow_call_secs = UPSTREAM_LIMITS[name]
+    return CircuitBreaker(
+        name,
+        timeout_secs=timeout_secs,
+        slow_call_secs=slow_call_secs,
+        failure_rate=float(os.getenv("BREAKER_FAILURE_RATE", "0.5")),
+        min_calls=int(os.getenv("BREAKER_MIN_CALLS", "5")),
+        window=int(os.getenv("BREAKER_WINDOW", "20")),
+        open_secs=float(os.getenv("BREAKER_OPEN_SECS", "30")),
+    )
+
+
+breakers = {name: _from_env(name) for name in UPSTREAM_LIMITS}
+
+
+def voice_unavailable(tts: tuple[str, ...] = ("elevenlabs",)) -> list:
+    """The upstreams a call's audio or replies depend on that are down now.
+    `tts` are the TTS providers that can speak for the tenant; only when all
+    of them are down is TTS."""
+    down = [name for name in ("openai", "deepgram") if breakers[name].is_open]
+    if all(breakers[name].is_open for name in tts):
+        down += tts
+    return down
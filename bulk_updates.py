@@ -0,0 +1,255 @@
+"""Bulk booking updates for disruption events.
+
+`POST /bookings/bulk_update` takes a list of `{"registration", "fields"}`
+updates and applies them to a tenant's Airtable bookings table (the default
+tenant's unless the request names one). Record ids are
+looked up `LOOKUP_BATCH` registrations per request, and changes are written
+in PATCHes of up to `PATCH_BATCH` records (Airtable's maximum), with at most
+`max_concurrency` requests in flight and no more than `requests_per_sec`
+started, leaving headroom under Airtable's 5 requests per second per base
+limit (a 429 costs a 30 second wait). That budget is shared through the
+state store with the call handlers and other machines. Results
+are streamed back as newline-delimited JSON, one line per update as its
+batch completes, then a summary line.
+
+The endpoint is only enabled when BULK_API_TOKEN is set, and requires it as
+a bearer token.
+"""
+
+import asyncio
+import json
+import time
+
+from fastapi import APIRouter, Header, HTTPException
+from loguru import logger
+from prometheus_client import Counter
+from pydantic import BaseModel, Field
+from starlette.responses import StreamingResponse
+
+from api_auth import authorize
+from breakers import breakers
+from state import SharedRateLimiter, state_store
+from tenants import tenants
+
+BULK_UPDATE_ROWS = Counter(
+    "bulk_update_rows_total",
+    "Booking updates received by the bulk endpoint, by outcome",
+    ["status"],
+)
+BULK_UPDATE_REQUESTS = Counter(
+    "bulk_update_airtable_requests_total", "Airtable requests made for bulk updates", ["kind"]
+)
+
+AIRTABLE_API_URL = "https://api.airtable.com/v0"
+# Registrations per lookup, which keeps the filterByFormula URL well short
+# of Airtable's 16k character limit, and records per PATCH (Airtable's cap).
+LOOKUP_BATCH = 50
+PATCH_BATCH = 10
+MAX_UPDATES = 1000
+MAX_ATTEMPTS = 3
+# Airtable asks clients to wait 30 seconds after a 429.
+RATE_LIMITED_WAIT_SECS = 30.0
+
+router = APIRouter()
+
+
+class BookingUpdate(BaseModel):
+    registration: str
+    fields: dict = Field(min_length=1)
+
+
+class BulkUpdateRequest(BaseModel):
+    updates: list[BookingUpdate] = Field(min_length=1, max_length=MAX_UPDATES)
+    typecast: bool = True
+    # The tenant whose bookings to update; the default tenant if left out.
+    tenant: str | None = None
+
+
+class RateLimiter:
+    """Spaces out request starts to at most `per_sec` a second."""
+
+    def __init__(self, per_sec: float):
+        self._interval = 1.0 / per_sec
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            now = time.monotonic()
+            if self._next > now:
+                await asyncio.sleep(self._next - now)
+            self._next = max(now, self._next) + self._interval
+
+
+class AirtableBulkUpdater:
+    """Applies many booking updates to Airtable in batches.
+
+    `run()` is an async generator of per-update result dicts. Each has the
+    registration as given, a `status` (`updated`, `not_found`, `duplicate`,
+    `error`), and the record `id` or an `error` message.
+    """
+
+    def __init__(
+        self,
+        session,
+        *,
+        api_key: str,
+        base_id: str,
+        table: str,
+        max_concurrency: int = 4,
+        requests_per_sec: float = 4.0,
+        api_url: str = AIRTABLE_API_URL,
+    ):
+        self._session = session
+        self._headers = {"Authorization": f"Bearer {api_key}"}
+        self._url = f"{api_url}/{base_id}/{table}"
+        self._base_id = base_id
+        self._table = table
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        # The same budget the call handlers draw on (functions.airtable_config),
+        # so a bulk update doesn't push calls on any machine over the limit.
+        self._limiter = SharedRateLimiter(state_store, f"airtable:{base_id}", requests_per_sec)
+
+    async def run(self, updates: list[BookingUpdate], typecast: bool = True):
+        # Imported here so the functions package isn't paid for before the
+        # port is bound.
+        from functions.booking import normalize_registration
+
+        pending = {}
+        for update in updates:
+            registration = normalize_registration(update.registration)
+            if not registration:
+                yield _row(update, "error", error="Empty registration")
+            elif registration in pending:
+                yield _row(update, "duplicate", error="Registration already in this request")
+            else:
+                pending[registration] = update
+
+        registrations = list(pending)
+        lookups = [
+            self._lookup(registrations[i : i + LOOKUP_BATCH])
+            for i in range(0, len(registrations), LOOKUP_BATCH)
+        ]
+        record_ids = {}
+        for lookup in asyncio.as_completed(lookups):
+            batch, found, error = await lookup
+            if error:
+                for registration in batch:
+                    yield _row(pending.pop(registration), "error", error=error)
+            record_ids.update(found)
+
+        found = []
+        for registration, update in pending.items():
+            if registration in record_ids:
+                found.append((record_ids[registration], update))
+            else:
+                yield _row(update, "not_found", error="No booking found")
+
+        patches = [
+            self._patch(found[i : i + PATCH_BATCH], typecast)
+            for i in range(0, len(found), PATCH_BATCH)
+        ]
+        for patch in asyncio.as_completed(patches):
+            for row in await patch:
+                yield row
+
+    async def _lookup(self, registrations: list[str]) -> tuple[list, dict, str | None]:
+        # Returns the registrations, {registration: record id} for the ones
+        # that exist, and an error message if the lookup failed.
+        from functions.booking import normalize_registration
+
+        conditions = ",".join(f'UPPER({{Registration}})="{r}"' for r in registrations)
+        params = {"filterByFormula": f"OR({conditions})", "fields[]": "Registration"}
+        record_ids = {}
+        try:
+            while True:
+                data = await self._request("GET", params=params, kind="lookup")
+                for record in data["records"]:
+                    registration = normalize_registration(record["fields"].get("Registration", ""))
+                    record_ids.setdefault(registration, record["id"])
+                if not data.get("offset"):
+                    return registrations, record_ids, None
+                params = {**params, "offset": data["offset"]}
+        except Exception as e:
+            logger.error(f"Error looking up {len(registrations)} bookings: {str(e)}")
+            return registrations, {}, str(e)
+
+    async def _patch(self, batch: list, typecast: bool) -> list[dict]:
+        body = {
+            "records": [{"id": record_id, "fields": update.fields} for record_id, update in batch],
+            "typecast": typecast,
+        }
+        try:
+            await self._request("PATCH", json=body, kind="patch")
+        except Exception as e:
+            logger.error(f"Error updating {len(batch)} bookings: {str(e)}")
+            return [
+                _row(update, "error", id=record_id, error=str(e)) for record_id, update in batch
+            ]
+        await self._forget(batch)
+        return [_row(update, "updated", id=record_id) for record_id, update in batch]
+
+    async def _forget(self, batch: list):
+        # Drops the bookings from the call handlers' shared booking cache and
+        # hot set.
+        from functions.airtable_config import forget_bookings
+
+        registrations = [update.registration for _, update in batch]
+        await forget_bookings(self._base_id, self._table, registrations)
+
+    async def _request(self, method: str, *, kind: str, **kwargs) -> dict:
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            async with self._semaphore:
+                # Nothing is sent while the calls' Airtable breaker is open.
+                breakers["airtable"].check()
+                await self._limiter.wait()
+                BULK_UPDATE_REQUESTS.labels(kind=kind).inc()
+                async with self._session.request(
+                    method, self._url, headers=self._headers, **kwargs
+                ) as response:
+                    if response.status == 200:
+                        return await response.json()
+                    error_text = await response.text()
+            retryable = response.status == 429 or response.status >= 500
+            if not retryable or attempt == MAX_ATTEMPTS:
+                raise RuntimeError(f"Airtable returned {response.status}: {error_text}")
+            wait = RATE_LIMITED_WAIT_SECS if response.status == 429 else attempt
+            logger.warning(f"Airtable returned {response.status}, retrying in {wait}s")
+            await asyncio.sleep(wait)
+
+
+def _row(update: BookingUpdate, status: str, **fields) -> dict:
+    return {"registration": update.registration, "status": status, **fields}
+
+
+@router.post("/bookings/bulk_update")
+async def bulk_update(request: BulkUpdateRequest, authorization: str | None = Header(None)):
+    authorize(authorization, "BULK_API_TOKEN")
+    tenant = tenants.get(request.tenant)
+    if request.tenant and tenant.id != request.tenant:
+        raise HTTPException(status_code=404, detail=f"Unknown tenant {request.tenant}")
+    logger.info(f"Bulk update of {len(request.updates)} bookings for {tenant.id}")
+
+    async def results():
+        # Imported here so it isn't paid for before the port is bound.
+        import aiohttp
+
+        counts = {}
+        start = time.monotonic()
+        async with aiohttp.ClientSession() as session:
+            updater = AirtableBulkUpdater(
+                session,
+                api_key=tenant.airtable_api_key,
+                base_id=tenant.airtable_base_id,
+                table=tenant.bookings_table,
+            )
+            async for row in updater.run(request.updates, request.typecast):
+                counts[row["status"]] = counts.get(row["status"], 0) + 1
+                BULK_UPDATE_ROWS.labels(status=row["status"]).inc()
+                yield json.dumps(row) + "\n"
+
+        summary = {"summary": counts, "seconds": round(time.monotonic() - start, 3)}
+        logger.info(f"Bulk update finished: {summary}")
+        yield json.dumps(summary) + "\n"
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
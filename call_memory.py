@@ -0,0 +1,247 @@
+"""Per-call memory accounting and leak checks.
+
+`call_memory.start(stream_sid)` at the start of a call returns a
+`CallMemory`. The call registers the objects that should die with it
+(transport, processors, services, LLM context, pipeline task) through
+`track()`, and calls `finish()` at hangup. Only weak references are kept.
+
+`CALL_LEAK_CHECK_SECS` (30) after hangup, any tracked object still alive is
+checked again every so often, since the pipeline's processors link to each
+other and so are only freed by the cyclic garbage collector. When no call
+is running, a full collection is run to settle it at once (never during a
+call: with a large heap it can hold the event loop for long enough to break
+up other calls' audio). Anything still alive after that, or after
+`LEAK_GIVE_UP_SECS` of waiting, is logged as leaked with the tasks holding
+on to it, and counted in `call_objects_leaked_total`. A sweep then counts
+Frames and open aiohttp sessions left in the process.
+
+With CALL_MEMORY_TRACE=1, tracemalloc traces every allocation (at a cost of
+roughly 30% more CPU and memory, so it's for staging and load tests), and
+each call reports its peak and retained memory: the most traced memory
+above the call's start while it ran, and what was still allocated once its
+objects were freed. tracemalloc can't tell calls apart, so these are exact
+for a call that ran on its own and an upper bound when calls overlapped,
+which the `overlapped` label records. Calls that retain more than
+`CALL_MEMORY_REPORT_KB` log the lines that allocated it.
+"""
+
+import asyncio
+import gc
+import json
+import os
+import tracemalloc
+import weakref
+
+from loguru import logger
+from prometheus_client import Counter, Histogram
+
+MEMORY_BUCKETS = tuple(mb * 1024 * 1024 for mb in (1, 2, 5, 10, 20, 50, 100, 200, 500))
+
+CALL_MEMORY_PEAK = Histogram(
+    "call_memory_peak_bytes",
+    "Most traced memory above the call's start while it ran (CALL_MEMORY_TRACE only)",
+    ["overlapped"],
+    buckets=MEMORY_BUCKETS,
+)
+CALL_MEMORY_RETAINED = Histogram(
+    "call_memory_retained_bytes",
+    "Traced memory still allocated above the call's start once its objects were freed "
+    "(CALL_MEMORY_TRACE only)",
+    ["overlapped"],
+    buckets=MEMORY_BUCKETS,
+)
+CALL_CONTEXT_BYTES = Histogram(
+    "call_llm_context_bytes",
+    "Size of the LLM context's messages, as JSON, when the call ended",
+    buckets=tuple(kb * 1024 for kb in (4, 8, 16, 32, 64, 128, 256, 512, 1024)),
+)
+CALL_LEAK_CHECKS = Counter(
+    "call_leak_checks_total", "Post-hangup checks for call objects left alive", ["result"]
+)
+CALL_OBJECTS_LEAKED = Counter(
+    "call_objects_leaked_total",
+    "Call objects, Frames and open aiohttp sessions still alive after a call was over",
+    ["kind"],
+)
+
+# How often the traced memory is sampled for call peaks.
+SAMPLE_SECS = 0.5
+# How often objects still alive after the first check are looked at again,
+# and how long before they're reported without a full collection.
+RECHECK_SECS = 30.0
+LEAK_GIVE_UP_SECS = 300.0
+TRACE_FRAMES = 8
+REPORT_TOP_LINES = 10
+
+
+class CallMemory:
+    """Memory bookkeeping for one call."""
+
+    def __init__(self, monitor: "CallMemoryMonitor", call_id: str):
+        self.call_id = call_id
+        self._monitor = monitor
+        self._refs = []  # (kind, weakref)
+        self.start_bytes = self.peak_bytes = monitor.traced_bytes()
+        self.start_snapshot = tracemalloc.take_snapshot() if monitor.trace else None
+        self.overlapped = False
+
+    def track(self, *objects):
+        """Registers objects that should be freed when the call is over."""
+        for obj in objects:
+            if obj is None:
+                continue
+            try:
+                self._refs.append((type(obj).__name__, weakref.ref(obj)))
+            except TypeError:
+                pass
+
+    def alive(self) -> list:
+        return [(kind, ref()) for kind, ref in self._refs if ref() is not None]
+
+    def finish(self, context=None):
+        """Marks the call over and schedules its leak check."""
+        if context is not None:
+            CALL_CONTEXT_BYTES.observe(len(json.dumps(context.messages, default=str)))
+            logger.debug(f"LLM context ended with {len(context.messages)} messages")
+        self._monitor.finish(self)
+
+
+class CallMemoryMonitor:
+    """Starts each call's accounting and runs the checks after hangup."""
+
+    def __init__(self, *, trace: bool = False, check_delay_secs: float = 30.0, report_kb=1024):
+        self.trace = trace
+        self._check_delay_secs = check_delay_secs
+        self._report_bytes = report_kb * 1024
+        self._active = set()
+        self._sampler = None
+        self._checks = set()
+        if trace and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACE_FRAMES)
+
+    @classmethod
+    def from_env(cls) -> "CallMemoryMonitor":
+        return cls(
+            trace=os.getenv("CALL_MEMORY_TRACE", "0") == "1",
+            check_delay_secs=float(os.getenv("CALL_LEAK_CHECK_SECS", "30")),
+            report_kb=int(os.getenv("CALL_MEMORY_REPORT_KB", "1024")),
+        )
+
+    def traced_bytes(self) -> int:
+        return tracemalloc.get_traced_memory()[0] if self.trace else 0
+
+    def start(self, call_id: str) -> CallMemory:
+        call = CallMemory(self, call_id)
+        if self._active:
+            call.overlapped = True
+            for other in self._active:
+                other.overlapped = True
+        self._active.add(call)
+        if self.trace and self._sampler is None:
+            self._sampler = asyncio.create_task(self._sample())
+        return call
+
+    def finish(self, call: CallMemory):
+        self._active.discard(call)
+        if call.start_snapshot is not None:
+            self._update_peaks()
+            CALL_MEMORY_PEAK.labels(overlapped=str(call.overlapped).lower()).observe(
+                max(0, call.peak_bytes - call.start_bytes)
+            )
+        check = asyncio.create_task(self._check(call))
+        self._checks.add(check)
+        check.add_done_callback(self._checks.discard)
+
+    def _update_peaks(self):
+        current = self.traced_bytes()
+        for call in self._active:
+            call.peak_bytes = max(call.peak_bytes, current)
+
+    async def _sample(self):
+        while self._active:
+            self._update_peaks()
+            await asyncio.sleep(SAMPLE_SECS)
+        self._sampler = None
+
+    async def _check(self, call: CallMemory):
+        await asyncio.sleep(self._check_delay_secs)
+        waited = self._check_delay_secs
+        while call.alive() and waited < LEAK_GIVE_UP_SECS:
+            if not self._active:
+                # Nothing to disturb, so let the collector settle it now.
+                gc.collect()
+                break
+            await asyncio.sleep(RECHECK_SECS)
+            waited += RECHECK_SECS
+
+        alive = call.alive()
+        CALL_LEAK_CHECKS.labels(result="leaked" if alive else "clean").inc()
+        if alive:
+            for kind, _ in alive:
+                CALL_OBJECTS_LEAKED.labels(kind=kind).inc()
+            holders = _holding_tasks([obj for _, obj in alive])
+            logger.warning(
+                f"Call {call.call_id}: {len(alive)} objects still alive {waited:.0f}s after "
+                f"hangup: {', '.join(sorted({kind for kind, _ in alive}))}"
+                + (f"; held by tasks {', '.join(holders)}" if holders else "")
+            )
+        del alive
+        if call.start_snapshot is not None:
+            await self._report_retained(call)
+        if not self._active:
+            _sweep()
+
+    async def _report_retained(self, call: CallMemory):
+        retained = self.traced_bytes() - call.start_bytes
+        CALL_MEMORY_RETAINED.labels(overlapped=str(call.overlapped).lower()).observe(
+            max(0, retained)
+        )
+        logger.info(
+            f"Call {call.call_id} memory: peak {(call.peak_bytes - call.start_bytes) / 1e6:.1f} MB, "
+            f"retained {retained / 1e6:.1f} MB"
+            + (" (other calls overlapped)" if call.overlapped else "")
+        )
+        if retained > self._report_bytes:
+            snapshot = tracemalloc.take_snapshot()
+            # Comparing takes seconds with a large heap; don't do it on the event loop.
+            stats = await asyncio.to_thread(snapshot.compare_to, call.start_snapshot, "lineno")
+            for stat in stats[:REPORT_TOP_LINES]:
+                logger.info(f"Call {call.call_id} retained: {stat}")
+        call.start_snapshot = None
+
+
+def _holding_tasks(objects: list) -> list:
+    # Names the pending tasks whose coroutines have one of `objects` as `self`.
+    ids = {id(obj) for obj in objects}
+    holders = []
+    for task in asyncio.all_tasks():
+        coro = task.get_coro()
+        while coro is not None:
+            frame = getattr(coro, "cr_frame", None)
+            if frame is not None and id(frame.f_locals.get("self")) in ids:
+                holders.append(task.get_name())
+                break
+            coro = getattr(coro, "cr_await", None)
+    return holders
+
+
+def _sweep():
+    # With no call running, there should be no Frames or open sessions left.
+    import aiohttp
+    from pipecat.frames.frames import Frame
+
+    frames = sessions = 0
+    for obj in gc.get_objects():
+        if isinstance(obj, Frame):
+            frames += 1
+        elif isinstance(obj, aiohttp.ClientSession) and not obj.closed:
+            sessions += 1
+    if frames:
+        CALL_OBJECTS_LEAKED.labels(kind="Frame").inc(frames)
+    if sessions:
+        CALL_OBJECTS_LEAKED.labels(kind="ClientSession").inc(sessions)
+    if frames or sessions:
+        logger.warning(f"No calls running, but {frames} Frames and {sessions} open sessions alive")
+
+
+call_memory = CallMemoryMonitor.from_env()
@@ -0,0 +1,476 @@
+"""Outbound call campaigns.
+
+`POST /campaigns/eta_confirmations` pulls the drop-offs starting in the next
+`hours_ahead` hours that have a contact number and no ETA yet, and queues a
+call to each customer to confirm when they'll arrive. Calls are placed
+through Twilio, earliest booking first, with at most `max_concurrent_calls`
+ringing or connected at once (what one machine can run alongside inbound
+calls) and no more than `calls_per_sec` started, Twilio's per-account CPS
+limit. A number isn't dialled again within `retry_after_secs` of its last
+call. Busy, unanswered and failed calls are retried after that window, up to
+`max_attempts` times, while the booking is still in the future.
+
+An answered call connects to the usual `/ws` stream with a `campaignCallId`
+parameter, and the bot starts with the booking already looked up. Twilio's
+status callback (`POST /campaigns/status`) reports how each call ended. The
+queue and call slots live in the process that started the campaign, but
+placed calls and the bookings being called are kept in the state store, so
+an answered call's stream can reach any machine, and two campaigns don't
+call the same booking. Status callbacks carry the Fly machine that placed
+the call, and are replayed there by Fly's proxy if they land elsewhere.
+
+The endpoints are only enabled when CAMPAIGN_API_TOKEN is set, and require it
+as a bearer token.
+"""
+
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING
+from urllib.parse import parse_qsl
+from xml.sax.saxutils import quoteattr
+
+from fastapi import APIRouter, Header, HTTPException, Request
+from loguru import logger
+from prometheus_client import Counter, Gauge, Histogram
+from pydantic import BaseModel, Field
+from starlette.responses import Response
+
+from api_auth import authorize
+from breakers import CircuitOpenError, breakers, voice_unavailable
+from bulk_updates import AIRTABLE_API_URL, RateLimiter
+from state import StateStore, state_store
+from tenants import Tenant, tenants
+
+if TYPE_CHECKING:
+    from functions.booking import Booking
+
+CAMPAIGN_DIALS = Counter(
+    "campaign_dials_total",
+    "Outbound campaign calls placed, by whether Twilio accepted the request",
+    ["result"],
+)
+CAMPAIGN_CONNECTS = Counter(
+    "campaign_connects_total", "Outbound campaign calls answered and connected to the bot"
+)
+CAMPAIGN_OUTCOMES = Counter(
+    "campaign_call_outcomes_total",
+    "Outbound campaign calls by how they ended (Twilio's final call status)",
+    ["status"],
+)
+CAMPAIGN_ANSWER_SECONDS = Histogram(
+    "campaign_answer_seconds",
+    "Time from placing an outbound campaign call until it connected to the bot",
+    buckets=(2.0, 5.0, 10.0, 15.0, 20.0, 25.0, 30.0, 45.0, 60.0),
+)
+CAMPAIGN_QUEUED = Gauge(
+    "campaign_queued_calls",
+    "Outbound campaign calls waiting to be placed: ready now, or waiting on a retry window",
+    ["state"],
+)
+CAMPAIGN_ACTIVE = Gauge("campaign_active_calls", "Outbound campaign calls ringing or connected")
+
+# Twilio's final call statuses, and the ones worth trying again later.
+FINAL_STATUSES = {"completed", "busy", "no-answer", "failed", "canceled"}
+RETRY_STATUSES = {"busy", "no-answer", "failed", "dial_error"}
+# How long a placed call can run before its slot is freed without a status.
+MAX_CALL_SECS = 900.0
+PUBLIC_URL = os.getenv("PUBLIC_URL", "https://callgpt-parking.fly.dev")
+# Set by Fly on each machine.
+MACHINE_ID = os.getenv("FLY_MACHINE_ID", "")
+
+router = APIRouter()
+
+
+@dataclass
+class CampaignCall:
+    booking: "Booking"
+    number: str
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    attempts: int = 0
+    call_sid: str | None = None
+    dialled_at: float = 0.0
+    timeout: asyncio.Task | None = None
+
+
+def to_e164(number: str) -> str | None:
+    # UK numbers as they're stored in Airtable ("07700 900123", "44...",
+    # "+44...") in the form Twilio dials, or None if it doesn't look like one.
+    digits = "".join(char for char in number if char.isdigit())
+    if number.strip().startswith("+") and len(digits) >= 10:
+        return f"+{digits}"
+    if digits.startswith("0") and len(digits) == 11:
+        return f"+44{digits[1:]}"
+    if digits.startswith("44") and len(digits) == 12:
+        return f"+{digits}"
+    return None
+
+
+def stream_twiml(ws_url: str, parameters: dict) -> str:
+    """TwiML connecting an answered call to the bot, passing `parameters` to `/ws`."""
+    tags = "".join(
+        f"<Parameter name={quoteattr(name)} value={quoteattr(value)}/>"
+        for name, value in parameters.items()
+    )
+    return (
+        f"<Response><Connect><Stream url={quoteattr(ws_url)}>{tags}</Stream></Connect>"
+        "<Hangup/></Response>"
+    )
+
+
+class TwilioDialler:
+    """Places outbound calls that stream to the bot's `/ws` once answered."""
+
+    def __init__(self, *, account_sid: str, auth_token: str, from_number: str, public_url: str):
+        # Imported here so it isn't paid for before the port is bound.
+        from twilio.rest import Client
+
+        self._client = Client(account_sid, auth_token)
+        self._from_number = from_number
+        # Campaign calls are for the tenant that owns the number they come from.
+        self.tenant = tenants.for_number(from_number)
+        self._ws_url = public_url.replace("https://", "wss://", 1).rstrip("/") + "/ws"
+        self._status_url = public_url.rstrip("/") + "/campaigns/status"
+        if MACHINE_ID:
+            self._status_url += f"?machine={MACHINE_ID}"
+
+    async def __call__(self, call: CampaignCall) -> str:
+        # No calling customers while the bot couldn't talk to them.
+        down = voice_unavailable(self.tenant.tts_providers)
+        if down:
+            raise CircuitOpenError(", ".join(down))
+        parameters = {
+            "campaignCallId": call.id,
+            "registration": call.booking.registration,
+            "tenant": self.tenant.id,
+        }
+        twiml = stream_twiml(self._ws_url, parameters)
+        # The Twilio client is synchronous.
+        async with breakers["twilio"].guard():
+            twilio_call = await asyncio.to_thread(
+                self._client.calls.create,
+                to=call.number,
+                from_=self._from_number,
+                twiml=twiml,
+                timeout=25,
+                status_callback=self._status_url,
+            )
+        return twilio_call.sid
+
+
+class CampaignEngine:
+    """Schedules outbound calls from a priority queue ordered by booking time.
+
+    `dial` is an async callable that places a `CampaignCall` and returns its
+    Twilio call SID. Calls come off the `ready` heap earliest booking first.
+    A call whose number was dialled too recently, or is on a call now, goes
+    to the `waiting` heap until its window opens. A slot is held from dialling
+    until Twilio reports the final status, or `max_call_secs` passes without
+    one.
+
+    A booking is claimed in `store` while it's queued or being called, and
+    after it's been reached, until its booking time, so it's queued once
+    across every machine. Placed calls are kept in `store` for
+    `max_call_secs`, for `campaign_booking()`.
+    """
+
+    def __init__(
+        self,
+        dial,
+        *,
+        max_concurrent_calls: int = 4,
+        calls_per_sec: float = 1.0,
+        retry_after_secs: float = 1800.0,
+        max_attempts: int = 3,
+        max_call_secs: float = MAX_CALL_SECS,
+        store: StateStore | None = None,
+    ):
+        self._dial = dial
+        self._store = store or state_store
+        self._slots = asyncio.Semaphore(max_concurrent_calls)
+        self._limiter = RateLimiter(calls_per_sec)
+        self._retry_after_secs = retry_after_secs
+        self._max_attempts = max_attempts
+        self._max_call_secs = max_call_secs
+        self._ready = []  # (booking time, seq, call)
+        self._waiting = []  # (monotonic time it can be placed, seq, call)
+        self._seq = itertools.count()
+        self._number_free_at = {}
+        self._calls = {}  # campaign call id -> call, while it's active
+        self._sids = {}  # Twilio call SID -> call, while it's active
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    async def add(self, booking: "Booking") -> bool:
+        """Queues a call for a booking. False if it's already queued or can't be dialled."""
+        number = to_e164(booking.contact_number)
+        if not booking.registration or not number or not booking.entry:
+            logger.warning(f"Skipping campaign call for booking {booking.registration or '?'}")
+            return False
+        # Held until the booking time, after which it can't be queued anyway.
+        ttl = (booking.entry - datetime.now(timezone.utc)).total_seconds() + 60
+        if not await self._store.add(_booking_key(booking.registration), 1, ttl=max(ttl, 60)):
+            return False
+
+        call = CampaignCall(booking, number)
+        heapq.heappush(self._ready, (booking.entry, next(self._seq), call))
+        self._update_gauges()
+        self._wakeup.set()
+        if not self._task:
+            self._task = asyncio.create_task(self._dispatch())
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "ready": len(self._ready),
+            "waiting": len(self._waiting),
+            "active": len(self._calls),
+        }
+
+    async def call_status(self, call_sid: str, status: str):
+        call = self._sids.get(call_sid)
+        if call and status in FINAL_STATUSES:
+            await self._finish(call, status)
+
+    async def _dispatch(self):
+        while True:
+            await self._slots.acquire()
+            call = await self._next_call()
+            await self._limiter.wait()
+            await self._place(call)
+
+    async def _next_call(self) -> CampaignCall:
+        while True:
+            now = time.monotonic()
+            while self._waiting and self._waiting[0][0] <= now:
+                _, seq, call = heapq.heappop(self._waiting)
+                heapq.heappush(self._ready, (call.booking.entry, seq, call))
+
+            while self._ready:
+                _, seq, call = heapq.heappop(self._ready)
+                if call.booking.entry <= datetime.now(timezone.utc):
+                    CAMPAIGN_OUTCOMES.labels(status="expired").inc()
+                    await self._store.delete(_booking_key(call.booking.registration))
+                    continue
+                free_at = self._number_free_at.get(call.number, 0.0)
+                if free_at > now:
+                    # A number on a call now is checked again a window later.
+                    recheck_at = min(free_at, now + self._retry_after_secs)
+                    heapq.heappush(self._waiting, (recheck_at, seq, call))
+                    continue
+                self._update_gauges()
+                return call
+
+            self._update_gauges()
+            self._wakeup.clear()
+            timeout = self._waiting[0][0] - now if self._waiting else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _place(self, call: CampaignCall):
+        call.attempts += 1
+        # No other call to this number until this one has ended.
+        self._number_free_at[call.number] = math.inf
+        # A new id for each attempt, so each answer is taken once.
+        call.id = uuid.uuid4().hex
+        self._calls[call.id] = call
+        CAMPAIGN_ACTIVE.set(len(self._calls))
+        call.dialled_at = time.time()
+        try:
+            # Before dialling, as the call can be answered on any machine.
+            await self._store.set(
+                _call_key(call.id),
+                {"booking": call.booking.to_json(), "dialled_at": call.dialled_at},
+                ttl=self._max_call_secs,
+            )
+            call.call_sid = await self._dial(call)
+        except Exception as e:
+            logger.error(f"Error placing campaign call for {call.booking.registration}: {str(e)}")
+            CAMPAIGN_DIALS.labels(result="error").inc()
+            await self._finish(call, "dial_error")
+            return
+
+        CAMPAIGN_DIALS.labels(result="placed").inc()
+        logger.info(f"Placed campaign call {call.call_sid} for {call.booking.registration}")
+        self._sids[call.call_sid] = call
+        # Frees the slot if the status callback never arrives.
+        call.timeout = asyncio.create_task(self._time_out(call))
+
+    async def _time_out(self, call: CampaignCall):
+        await asyncio.sleep(self._max_call_secs)
+        await self._finish(call, "timeout")
+
+    async def _finish(self, call: CampaignCall, status: str):
+        if self._calls.pop(call.id, None) is None:
+            return
+        self._sids.pop(call.call_sid, None)
+        if call.timeout and call.timeout is not asyncio.current_task():
+            call.timeout.cancel()
+        call.timeout = None
+        self._slots.release()
+        CAMPAIGN_ACTIVE.set(len(self._calls))
+        CAMPAIGN_OUTCOMES.labels(status=status).inc()
+        logger.info(f"Campaign call for {call.booking.registration} ended: {status}")
+
+        retry_at = time.monotonic() + self._retry_after_secs
+        self._number_free_at[call.number] = retry_at
+        if status in RETRY_STATUSES and call.attempts < self._max_attempts:
+            heapq.heappush(self._waiting, (retry_at, next(self._seq), call))
+            self._update_gauges()
+            self._wakeup.set()
+        elif status != "completed":
+            # Not reached: a later campaign run can queue it again.
+            await self._store.delete(_booking_key(call.booking.registration))
+        await self._store.delete(_call_key(call.id))
+
+    def _update_gauges(self):
+        CAMPAIGN_QUEUED.labels(state="ready").set(len(self._ready))
+        CAMPAIGN_QUEUED.labels(state="waiting").set(len(self._waiting))
+
+
+def _booking_key(registration: str) -> str:
+    return f"campaign:booking:{registration}"
+
+
+def _call_key(call_id: str) -> str:
+    return f"campaign:call:{call_id}"
+
+
+async def fetch_eligible_bookings(session, hours_ahead: float, tenant: Tenant) -> list["Booking"]:
+    """Drop-offs in the next `hours_ahead` hours with a contact number and no ETA."""
+    # Imported here so the functions package isn't paid for before the port
+    # is bound.
+    from functions.booking import BOOKING_FIELDS, Booking
+
+    formula = (
+        "AND({Contact_Number}!='', {Current_ETA}='', IS_AFTER({Entry_Date_Time}, NOW()), "
+        f"IS_BEFORE({{Entry_Date_Time}}, DATEADD(NOW(), {hours_ahead}, 'hours')))"
+    )
+    params = [
+        ("filterByFormula", formula),
+        ("cellFormat", "string"),
+        ("timeZone", "Europe/London"),
+        ("userLocale", "en-gb"),
+        *[("fields[]", name) for name in BOOKING_FIELDS],
+    ]
+    url = f"{AIRTABLE_API_URL}/{tenant.airtable_base_id}/{tenant.bookings_table}"
+    headers = {"Authorization": f"Bearer {tenant.airtable_api_key}"}
+
+    now = datetime.now(timezone.utc)
+    end = now + timedelta(hours=hours_ahead)
+    bookings = []
+    offset = None
+    while True:
+        page_params = params + [("offset", offset)] if offset else params
+        async with session.get(url, params=page_params, headers=headers) as response:
+            if response.status != 200:
+                raise RuntimeError(f"Airtable returned {response.status}: {await response.text()}")
+            data = await response.json()
+        for record in data["records"]:
+            booking = Booking.from_record(record)
+            if booking.entry and now < booking.entry <= end:
+                bookings.append(booking)
+        offset = data.get("offset")
+        if not offset:
+            return bookings
+
+
+_engine = None
+
+
+def get_engine() -> CampaignEngine:
+    global _engine
+    if not _engine:
+        dialler = TwilioDialler(
+            account_sid=os.getenv("TWILIO_ACCOUNT_SID"),
+            auth_token=os.getenv("TWILIO_AUTH_TOKEN"),
+            from_number=os.getenv("CAMPAIGN_FROM_NUMBER"),
+            public_url=PUBLIC_URL,
+        )
+        _engine = CampaignEngine(
+            dialler,
+            max_concurrent_calls=int(os.getenv("CAMPAIGN_MAX_CONCURRENT_CALLS", "4")),
+            calls_per_sec=float(os.getenv("CAMPAIGN_CALLS_PER_SEC", "1")),
+            retry_after_secs=float(os.getenv("CAMPAIGN_RETRY_MINS", "30")) * 60,
+        )
+    return _engine
+
+
+async def campaign_booking(call_id: str | None) -> "Booking | None":
+    """The booking for an answered campaign call, or None for any other call.
+
+    Works on any machine sharing the state store with the one that placed the
+    call, and only once per call.
+    """
+    if not call_id:
+        return None
+    key = _call_key(call_id)
+    call = await state_store.get(key)
+    if not call or not await state_store.add(f"{key}:answered", 1, ttl=MAX_CALL_SECS):
+        return None
+    CAMPAIGN_CONNECTS.inc()
+    CAMPAIGN_ANSWER_SECONDS.observe(max(0.0, time.time() - call["dialled_at"]))
+    from functions.booking import Booking
+
+    if "record" in call:
+        # Placed by an older version, with the Airtable fields.
+        return Booking.from_fields(call["record"])
+    return Booking.from_json(call["booking"])
+
+
+class CampaignRequest(BaseModel):
+    hours_ahead: float = Field(default=3.0, gt=0, le=24)
+
+
+@router.post("/campaigns/eta_confirmations")
+async def eta_confirmations(request: CampaignRequest, authorization: str | None = Header(None)):
+    authorize(authorization, "CAMPAIGN_API_TOKEN")
+    # Imported here so it isn't paid for before the port is bound.
+    import aiohttp
+
+    async with aiohttp.ClientSession() as session:
+        tenant = tenants.for_number(os.getenv("CAMPAIGN_FROM_NUMBER"))
+        bookings = await fetch_eligible_bookings(session, request.hours_ahead, tenant)
+
+    engine = get_engine()
+    queued = sum([await engine.add(booking) for booking in bookings])
+    logger.info(f"ETA confirmation campaign: {len(bookings)} eligible, {queued} queued")
+    return {"eligible": len(bookings), "queued": queued, **engine.stats()}
+
+
+@router.get("/campaigns")
+async def campaign_stats(authorization: str | None = Header(None)):
+    authorize(authorization, "CAMPAIGN_API_TOKEN")
+    return _engine.stats() if _engine else {"ready": 0, "waiting": 0, "active": 0}
+
+
+@router.post("/campaigns/status")
+async def call_status(request: Request, x_twilio_signature: str = Header("")):
+    if not os.getenv("CAMPAIGN_API_TOKEN"):
+        raise HTTPException(status_code=404)
+    machine = request.query_params.get("machine")
+    if machine and machine != MACHINE_ID:
+        # The slot is held by the machine that placed the call.
+        return Response(status_code=204, headers={"fly-replay": f"instance={machine}"})
+    from twilio.request_validator import RequestValidator
+
+    params = dict(parse_qsl((await request.body()).decode()))
+    # Signed against the public URL, which the proxy in front may have rewritten.
+    url = f"{PUBLIC_URL.rstrip('/')}/campaigns/status"
+    if request.url.query:
+        url += f"?{request.url.query}"
+    validator = RequestValidator(os.getenv("TWILIO_AUTH_TOKEN"))
+    if not validator.validate(url, params, x_twilio_signature):
+        raise HTTPException(status_code=403)
+
+    if _engine:
+        await _engine.call_status(params.get("CallSid", ""), params.get("CallStatus", ""))
+    return Response(status_code=204)
@@ -1,4 +1,4 @@
-from .find_booking import find_booking
+from .find_booking import find_booking, format_booking
 from .update_terminal import update_terminal
 from .update_registration import update_registration
 from .update_phone_number import update_phone_number
@@ -6,16 +6,22 @@ from .transfer_call import transfer_call
 from .whatsapp_message import whatsapp_message
 from .find_booking_by_phone import find_booking_by_phone
 from .update_eta import update_eta
+from .booking import Booking
+from .idempotency import IdempotentTools
+from .registry import Tool, ToolCall, call_middleware, register_tools
+from .tools import TOOLS, TOOLS_BY_NAME
+from .staff_notifications import StaffNotifier, staff_notifier
 from .time_utils import (
     get_current_time,
     handle_get_current_time,
     get_current_date,
     handle_get_current_date,
-    parse_eta,
 )
+from .eta_parser import ParsedETA, parse_eta, parse_spoken_eta
 
 __all__ = [
     "find_booking",
+    "format_booking",
     "update_terminal",
     "update_registration",
     "update_phone_number",
@@ -23,9 +29,21 @@ __all__ = [
     "whatsapp_message",
     "find_booking_by_phone",
     "update_eta",
+    "Booking",
+    "IdempotentTools",
+    "Tool",
+    "ToolCall",
+    "TOOLS",
+    "TOOLS_BY_NAME",
+    "call_middleware",
+    "register_tools",
+    "StaffNotifier",
+    "staff_notifier",
     "get_current_time",
     "handle_get_current_time",
     "get_current_date",
     "handle_get_current_date",
     "parse_eta",
+    "parse_spoken_eta",
+    "ParsedETA",
 ]
@@ -1,5 +1,140 @@
+import asyncio
+import json
 import os
+import time
 
-AIRTABLE_API_KEY = os.getenv("AIRTABLE_API_KEY")
-AIRTABLE_BASE_ID = os.getenv("AIRTABLE_BASE_ID")
-AIRTABLE_BOOKINGS_TABLE = os.getenv("AIRTABLE_BOOKINGS_TABLE")
+import aiohttp
+
+from breakers import breakers
+from state import SharedRateLimiter, state_store
+from tenants import current_tenant
+
+from .booking import BOOKING_FIELDS, Booking, normalize_registration
+
+AIRTABLE_API_URL = "https://api.airtable.com/v0"
+# Airtable allows 5 requests a second per base. The budget is shared through
+# the state store by every call, bulk update and machine using the base.
+AIRTABLE_REQUESTS_PER_SEC = float(os.getenv("AIRTABLE_REQUESTS_PER_SEC", "4"))
+# How long a looked-up booking is reused. Updates made through the functions
+# drop it at once; this only bounds staleness from edits made in Airtable.
+BOOKING_CACHE_SECS = float(os.getenv("BOOKING_CACHE_SECS", "120"))
+# How long a changed booking is marked as changed, so a copy loaded before
+# the change (the hot set's) isn't used. Longer than the hot set is ever used
+# without reloading.
+BOOKING_CHANGED_SECS = 600.0
+
+
+def bookings_url() -> str:
+    """The bookings table URL for the current call's tenant."""
+    return table_url(current_tenant())
+
+
+def table_url(tenant) -> str:
+    return f"{AIRTABLE_API_URL}/{tenant.airtable_base_id}/{tenant.bookings_table}"
+
+
+def airtable_headers() -> dict:
+    return {"Authorization": f"Bearer {current_tenant().airtable_api_key}"}
+
+
+def lookup_params(
+    formula: str, fields: tuple = BOOKING_FIELDS, max_records: int | None = 1
+) -> list:
+    """Query parameters for the first booking matching `formula` (or the
+    first `max_records`, or all of them if None), with only `fields` (string
+    cell format, UK time)."""
+    params = [
+        ("filterByFormula", formula),
+        ("cellFormat", "string"),
+        ("timeZone", "Europe/London"),
+        ("userLocale", "en-gb"),
+        *[("fields[]", name) for name in fields],
+    ]
+    if max_records:
+        params.append(("maxRecords", str(max_records)))
+    return params
+
+
+def airtable_limiter(base_id: str) -> SharedRateLimiter:
+    return SharedRateLimiter(state_store, f"airtable:{base_id}", AIRTABLE_REQUESTS_PER_SEC)
+
+
+def airtable_session() -> aiohttp.ClientSession:
+    """A session whose requests go through the Airtable circuit breaker and
+    time out instead of holding the call up."""
+    return breakers["airtable"].session()
+
+
+def unavailable_result() -> str:
+    """The function result while Airtable is down, steering the LLM to a transfer."""
+    return json.dumps(
+        {
+            "error": "The booking system isn't responding right now.",
+            "unavailable": True,
+            "instructions": "Apologise, don't try again on this call, and offer to transfer "
+            "the caller to a member of staff with transfer_call.",
+        }
+    )
+
+
+async def wait_for_airtable():
+    """Waits for a turn in the current tenant's base's request budget.
+    Raises CircuitOpenError straight away while Airtable is down."""
+    breakers["airtable"].check()
+    await airtable_limiter(current_tenant().airtable_base_id).wait()
+
+
+def booking_cache_key(base_id: str, table: str, registration: str) -> str:
+    return f"booking:{base_id}:{table}:{normalize_registration(registration)}"
+
+
+def _booking_key(registration: str) -> str:
+    tenant = current_tenant()
+    return booking_cache_key(tenant.airtable_base_id, tenant.bookings_table, registration)
+
+
+async def cached_booking(registration: str) -> Booking | None:
+    """The booking for a registration, if it was looked up recently."""
+    value = await state_store.get(_booking_key(registration))
+    if value is None:
+        return None
+    if isinstance(value, dict):
+        # Cached as the Airtable record by an older version.
+        return Booking.from_record(value)
+    return Booking.from_json(value)
+
+
+async def cache_booking(booking: Booking):
+    await state_store.set(
+        _booking_key(booking.registration), booking.to_json(), ttl=BOOKING_CACHE_SECS
+    )
+
+
+def booking_changed_key(base_id: str, table: str, registration: str) -> str:
+    return f"booking_changed:{base_id}:{table}:{normalize_registration(registration)}"
+
+
+async def booking_changed_at(tenant, registration: str) -> float | None:
+    """When the booking was last changed through the functions or a bulk
+    update (wall clock), if that was in the last BOOKING_CHANGED_SECS."""
+    return await state_store.get(
+        booking_changed_key(tenant.airtable_base_id, tenant.bookings_table, registration)
+    )
+
+
+async def forget_bookings(base_id: str, table: str, registrations: list[str]):
+    """Drops changed bookings from the booking cache, and marks them changed
+    so the hot set doesn't serve them until it has reloaded."""
+    now = time.time()
+    await asyncio.gather(
+        *(state_store.delete(booking_cache_key(base_id, table, r)) for r in registrations),
+        *(
+            state_store.set(booking_changed_key(base_id, table, r), now, ttl=BOOKING_CHANGED_SECS)
+            for r in registrations
+        ),
+    )
+
+
+async def forget_booking(registration: str):
+    tenant = current_tenant()
+    await forget_bookings(tenant.airtable_base_id, tenant.bookings_table, [registration])
@@ -0,0 +1,145 @@
+from dataclasses import dataclass
+from datetime import datetime
+
+import pytz
+
+TIMEZONE = pytz.timezone("Europe/London")
+BOOKING_TIME_FORMAT = "%d/%m/%Y %H:%M"
+# How update_eta writes Current_ETA (ISO 8601, so it's read back with
+# datetime.fromisoformat, which is far quicker than strptime).
+ETA_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+# How find_booking gives the booking time ("June 14 at 05:30 AM").
+SPOKEN_TIME_FORMAT = "%B %d at %I:%M %p"
+
+# The fields a booking lookup asks Airtable for: everything find_booking,
+# find_booking_by_phone and whatsapp_message use, so a booking cached by one
+# serves the others. Updates only need the record id, and ask for
+# ID_FIELDS.
+BOOKING_FIELDS = (
+    "Registration",
+    "Name",
+    "Entry_Date_Time",
+    "Contact_Number",
+    "Terminal",
+    "Allocated_Car_Park",
+    "Vehicle_Make",
+    "Current_ETA",
+)
+ID_FIELDS = ("Registration",)
+
+
+def normalize_registration(registration: str) -> str:
+    return "".join(char for char in registration if char.isalnum()).upper()
+
+
+def normalize_phone(number: str) -> str:
+    """A UK number's digits in national form ("07700900123"), "" if there are none."""
+    digits = "".join(char for char in number if char.isdigit())
+    if digits.startswith("44"):
+        return "0" + digits[2:]
+    if digits and not digits.startswith("0"):
+        return "0" + digits
+    return digits
+
+
+def parse_booking_time(text: str) -> datetime | None:
+    try:
+        return TIMEZONE.localize(datetime.strptime(text, BOOKING_TIME_FORMAT))
+    except ValueError:
+        return None
+
+
+def parse_eta_time(text: str) -> datetime | None:
+    """Current_ETA as update_eta writes it, or as Airtable gives a date field
+    (the booking time format)."""
+    try:
+        return TIMEZONE.localize(datetime.fromisoformat(text))
+    except ValueError:
+        return parse_booking_time(text)
+
+
+def parse_spoken_time(text: str, now: datetime) -> datetime | None:
+    """A find_booking booking time, in the year that puts it nearest `now`."""
+    times = []
+    for year in (now.year - 1, now.year, now.year + 1):
+        try:
+            naive = datetime.strptime(f"{year} {text}", f"%Y {SPOKEN_TIME_FORMAT}")
+        except ValueError:
+            continue
+        times.append(TIMEZONE.localize(naive))
+    return min(times, key=lambda time: abs(time - now), default=None)
+
+
+@dataclass(frozen=True, slots=True)
+class Booking:
+    """A booking as read from Airtable (string cell format), parsed once.
+
+    The registration is normalized ("VE68VEP"), the contact number is digits
+    in national form, and `entry` is Entry_Date_Time in UK time (None if it
+    couldn't be parsed; `entry_text` is what Airtable had). `current_eta` and
+    `current_eta_text` are the same for Current_ETA. Fields Airtable left out
+    are "".
+    """
+
+    id: str
+    registration: str
+    name: str
+    entry: datetime | None
+    entry_text: str
+    contact_number: str
+    terminal: str
+    allocated_car_park: str
+    vehicle_make: str
+    current_eta: datetime | None
+    current_eta_text: str
+
+    @classmethod
+    def from_fields(cls, fields: dict, id: str = "") -> "Booking":
+        entry_text = fields.get("Entry_Date_Time", "")
+        current_eta_text = fields.get("Current_ETA", "")
+        return cls(
+            id=id,
+            registration=normalize_registration(fields.get("Registration", "")),
+            name=fields.get("Name", ""),
+            entry=parse_booking_time(entry_text),
+            entry_text=entry_text,
+            contact_number=normalize_phone(fields.get("Contact_Number", "")),
+            terminal=fields.get("Terminal", ""),
+            allocated_car_park=fields.get("Allocated_Car_Park", ""),
+            vehicle_make=fields.get("Vehicle_Make", ""),
+            current_eta=parse_eta_time(current_eta_text),
+            current_eta_text=current_eta_text,
+        )
+
+    @classmethod
+    def from_record(cls, record: dict) -> "Booking":
+        """From an Airtable record, `{"id", "fields"}`."""
+        return cls.from_fields(record["fields"], record["id"])
+
+    def to_json(self) -> list:
+        """The booking as a JSON list, for the state store."""
+        return [
+            self.id,
+            self.registration,
+            self.name,
+            self.entry.isoformat() if self.entry else None,
+            self.entry_text,
+            self.contact_number,
+            self.terminal,
+            self.allocated_car_park,
+            self.vehicle_make,
+            self.current_eta.isoformat() if self.current_eta else None,
+            self.current_eta_text,
+        ]
+
+    @classmethod
+    def from_json(cls, values: list) -> "Booking":
+        values = list(values)
+        if values[3]:
+            values[3] = datetime.fromisoformat(values[3])
+        if len(values) == 10:
+            # Cached by an older version, with only Current_ETA's text.
+            values.insert(9, parse_eta_time(values[9]))
+        elif values[9]:
+            values[9] = datetime.fromisoformat(values[9])
+        return cls(*values)
@@ -0,0 +1,235 @@
+import re
+from datetime import date, datetime, time, timedelta
+from typing import NamedTuple
+
+NUMBER_WORDS = {
+    "zero": 0, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7,
+    "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12, "thirteen": 13,
+    "fourteen": 14, "fifteen": 15, "sixteen": 16, "seventeen": 17, "eighteen": 18,
+    "nineteen": 19,
+}
+TENS_WORDS = {"twenty": 20, "thirty": 30, "forty": 40, "fourty": 40, "fifty": 50}
+# Spoken quantities in front of a unit, and fractions of an hour.
+QUANTITIES = {"a": 1, "an": 1, "one": 1, "a couple of": 2, "couple of": 2, "a few": 3, "few": 3}
+FRACTIONS = {"half": 30, "quarter": 15}
+# What the rest of the sentence says about the time of day.
+PM_WORDS = ("pm", "afternoon", "evening", "tonight")
+AM_WORDS = ("am", "morning")
+ARRIVED_RE = re.compile(r"\b(?:right now|now|already here|here already|i m here|arrived|outside)\b")
+# Arriving just after a stated clock time still means that time, not tomorrow.
+PAST_GRACE = timedelta(minutes=10)
+
+QUANTITY = r"(?P<n>\d+(?:\.\d+)?|a couple of|couple of|a few|few|an?)"
+NOT_A_DURATION = r"(?! (?:minutes?|hours?))"
+
+# (name, pattern) tried in order. The clock patterns need something that
+# marks a time of day (past/to, a colon, o'clock, am/pm), so they don't catch
+# durations; the durations need a unit.
+CLOCK_PATTERNS = [
+    (
+        "past_to",
+        rf"\b(?P<m>\d+|quarter|half)(?: minutes?)? (?P<dir>past|after|to|till|before) "
+        rf"(?P<h>\d{{1,2}})\b{NOT_A_DURATION}",
+    ),
+    ("half_h", rf"\bhalf (?P<h>\d{{1,2}})\b{NOT_A_DURATION}"),
+    ("hh_mm", rf"\b(?P<h>\d{{1,2}})[:.](?P<m>[0-5]\d)\b{NOT_A_DURATION}"),
+    ("hhmm", rf"\b(?P<h>[01]\d|2[0-3])(?P<m>[0-5]\d)\b{NOT_A_DURATION}"),
+    ("oclock", r"\b(?P<h>\d{1,2}) oclock\b"),
+    ("h_ampm", r"\b(?P<h>\d{1,2})(?: (?P<m>[0-5]\d))? (?:am|pm)\b"),
+    ("h_m", rf"\b(?P<h>\d{{1,2}}) (?P<m>[0-5]\d)\b{NOT_A_DURATION}"),
+    ("noon", r"\b(?:noon|midday|(?P<midnight>midnight))\b"),
+]
+DURATION_PATTERNS = [
+    ("and_a_frac_hours", rf"\b{QUANTITY} and a (?P<frac>half|quarter) hours?\b"),
+    ("hours_and_a_frac", rf"\b(?:{QUANTITY} )?hours? and a (?P<frac>half|quarter)\b"),
+    ("three_quarters", r"\b3 quarters? of an hour\b"),
+    ("frac_hour", r"\b(?:a )?(?P<frac>half|quarter)(?: of)? (?:an? )?hour\b"),
+    ("hours", rf"\b{QUANTITY} hours?(?: and)?(?: (?P<m>\d+)(?: minutes?)?)?\b"),
+    ("minutes", rf"\b{QUANTITY} minutes?\b"),
+    # "in 20", with the unit left off, is minutes.
+    ("in_minutes", r"\bin (?:about |around )?(?P<n>\d+)\b(?! oclock)"),
+]
+# A bare hour ("at five", "about 6"), only when nothing above matched.
+BARE_HOUR_RE = re.compile(rf"\b(?P<h>\d{{1,2}})\b{NOT_A_DURATION}")
+
+CLOCK_RES = [(name, re.compile(pattern)) for name, pattern in CLOCK_PATTERNS]
+DURATION_RES = [(name, re.compile(pattern)) for name, pattern in DURATION_PATTERNS]
+NUMBER_WORD_RE = re.compile(
+    r"\b(?:(?P<tens>" + "|".join(TENS_WORDS) + r")(?: (?P<unit>" + "|".join(NUMBER_WORDS)
+    + r"))?|(?P<word>" + "|".join(NUMBER_WORDS) + r"))\b"
+)
+NORMALIZE_SUBS = [
+    (re.compile(r"o'? ?clock"), "oclock"),
+    (re.compile(r"\b([ap])\.? ?m\b\.?"), r"\1m"),
+    (re.compile(r"(\d)([ap]m)\b"), r"\1 \2"),
+    (re.compile(r"\b(?:mins?|minuites|minits)\b"), "minutes"),
+    (re.compile(r"\b(?:hrs?|hours?)\b"), "hour"),
+    (re.compile(r"[^a-z0-9:. ]+"), " "),
+    (re.compile(r"(?<!\d)\.|\.(?!\d)"), " "),
+    (re.compile(r"\s+"), " "),
+]
+OH_MINUTES_RE = re.compile(r"\b(\d{1,2}) (?:oh|o) (\d)\b")
+
+
+class ParsedETA(NamedTuple):
+    eta: datetime
+    # How to read the ETA back to the caller, e.g. "4:15 PM, in about 35 minutes".
+    spoken: str
+
+
+def _normalize(text: str) -> str:
+    text = text.lower().replace("-", " ")
+    for pattern, replacement in NORMALIZE_SUBS:
+        text = pattern.sub(replacement, text)
+
+    def number(match):
+        if match.group("word"):
+            return str(NUMBER_WORDS[match.group("word")])
+        value = TENS_WORDS[match.group("tens")]
+        if match.group("unit"):
+            value += NUMBER_WORDS[match.group("unit")]
+        return str(value)
+
+    # "one" in "one and a half" is a number, but "a" and "an" are left as
+    # words: "a" is never a number outside a quantity.
+    text = NUMBER_WORD_RE.sub(number, text)
+    text = OH_MINUTES_RE.sub(r"\1 0\2", text)
+    return text.strip()
+
+
+def _quantity(value: str | None) -> float:
+    if value is None:
+        return 1
+    return QUANTITIES[value] if value in QUANTITIES else float(value)
+
+
+def _duration_minutes(name: str, match: re.Match) -> float:
+    groups = match.groupdict()
+    if name in ("and_a_frac_hours", "hours_and_a_frac"):
+        return _quantity(groups["n"]) * 60 + FRACTIONS[groups["frac"]]
+    if name == "three_quarters":
+        return 45
+    if name == "frac_hour":
+        return FRACTIONS[groups["frac"]]
+    if name == "hours":
+        return _quantity(groups["n"]) * 60 + int(groups["m"] or 0)
+    return _quantity(groups["n"])
+
+
+def _clock(name: str, match: re.Match) -> tuple[int, int, bool] | None:
+    # (hour, minute, whether the hour is already on the 24-hour clock)
+    groups = match.groupdict()
+    if name == "noon":
+        return (0, 0, True) if groups["midnight"] else (12, 0, True)
+    hour = int(groups["h"])
+    if name == "past_to":
+        minutes = groups["m"]
+        minutes = FRACTIONS[minutes] if minutes in FRACTIONS else int(minutes)
+        if minutes >= 60 or hour > 12:
+            return None
+        if groups["dir"] in ("to", "till", "before"):
+            return (hour - 1) % 12 or 12, 60 - minutes, False
+        return hour, minutes, False
+    if name == "half_h":
+        return hour, 30, False
+    return hour, int(groups.get("m") or 0), False
+
+
+def _resolve_clock(
+    hour: int, minute: int, exact: bool, text: str, now: datetime
+) -> datetime | None:
+    if hour > 24 or minute > 59:
+        return None
+    hour %= 24
+    words = text.split()
+    tomorrow = "tomorrow" in words
+    if exact or hour > 12 or hour == 0:
+        hours = [hour]
+    elif any(word in words for word in PM_WORDS):
+        hours = [hour % 12 + 12]
+    elif any(word in words for word in AM_WORDS) or tomorrow:
+        hours = [hour % 12]
+    else:
+        # Whichever of the morning and afternoon times comes next.
+        hours = [hour % 12, hour % 12 + 12]
+
+    start = now.date() + timedelta(days=1) if tomorrow else now.date()
+    candidates = []
+    for days in (0, 1):
+        day = start + timedelta(days=days)
+        for h in hours:
+            candidate = _at(day, h, minute, now)
+            if tomorrow or candidate >= now - PAST_GRACE:
+                candidates.append(candidate)
+    return min(candidates)
+
+
+def _at(day: date, hour: int, minute: int, now: datetime) -> datetime:
+    # The wall-clock time on `day` in `now`'s timezone. pytz zones have to
+    # localize it, or it keeps `now`'s UTC offset across a clock change.
+    naive = datetime.combine(day, time(hour, minute))
+    if hasattr(now.tzinfo, "localize"):
+        return now.tzinfo.localize(naive)
+    return naive.replace(tzinfo=now.tzinfo)
+
+
+def _after(now: datetime, minutes: float) -> datetime:
+    eta = now + timedelta(minutes=minutes)
+    # pytz needs the offset fixing up if a clock change was crossed.
+    return now.tzinfo.normalize(eta) if hasattr(now.tzinfo, "normalize") else eta
+
+
+def _speak(eta: datetime, now: datetime) -> str:
+    clock = eta.strftime("%I:%M %p").lstrip("0")
+    if eta.date() == now.date() + timedelta(days=1):
+        clock += " tomorrow"
+    minutes = round((eta - now).total_seconds() / 60)
+    if minutes <= 1:
+        return f"{clock}, which is about now"
+    hours, minutes = divmod(minutes, 60)
+    if not hours:
+        return f"{clock}, in about {minutes} minutes"
+    in_hours = "an hour" if hours == 1 else f"{hours} hours"
+    if minutes:
+        in_hours += f" and {minutes} minutes"
+    return f"{clock}, in about {in_hours}"
+
+
+def parse_spoken_eta(text: str, now: datetime) -> ParsedETA | None:
+    """Parses an ETA the way callers say it, relative to `now` (timezone-aware).
+
+    Understands durations ("half an hour", "an hour and a half", "about 10
+    mins", "10 to 15 minutes") and times of day ("quarter past four", "twenty
+    to six", "half seven", "4:30 pm", "16:30", "five o'clock tomorrow"). A
+    time of day without am or pm is whichever comes next, rolling over to
+    tomorrow if need be. Returns None if nothing in `text` looks like an ETA.
+    """
+    normalized = _normalize(text)
+    eta = None
+    for name, pattern in CLOCK_RES:
+        match = pattern.search(normalized)
+        if match:
+            clock = _clock(name, match)
+            eta = clock and _resolve_clock(*clock, normalized, now)
+            break
+    else:
+        for name, pattern in DURATION_RES:
+            match = pattern.search(normalized)
+            if match:
+                eta = _after(now, _duration_minutes(name, match))
+                break
+        else:
+            match = BARE_HOUR_RE.search(normalized)
+            if match:
+                eta = _resolve_clock(int(match.group("h")), 0, False, normalized, now)
+            elif ARRIVED_RE.search(normalized):
+                eta = now
+
+    if eta is None:
+        return None
+    return ParsedETA(eta, _speak(eta, now))
+
+
+def parse_eta(eta_string, current_time, timezone):
+    parsed = parse_spoken_eta(eta_string, current_time)
+    return parsed.eta if parsed else None
@@ -1,10 +1,15 @@
-import json
-import pytz
-import re
-from datetime import datetime
 from loguru import logger
-import aiohttp
-from .airtable_config import AIRTABLE_API_KEY, AIRTABLE_BASE_ID, AIRTABLE_BOOKINGS_TABLE
+from .airtable_config import (
+    airtable_headers,
+    airtable_session,
+    bookings_url,
+    cache_booking,
+    lookup_params,
+    wait_for_airtable,
+)
+from .booking import Booking, normalize_phone
+from .find_booking import format_booking
+from .hot_bookings import hot_bookings
 
 
 async def find_booking_by_phone(
@@ -14,61 +19,50 @@ async def find_booking_by_phone(
 
     logger.debug(f"Finding booking for phone number: {phone_number}")
 
-    # Remove any non-digit characters and ensure the number starts with '44' or '0'
-    formatted_phone_number = re.sub(r"\D", "", phone_number)
-    if formatted_phone_number.startswith("44"):
-        formatted_phone_number = "0" + formatted_phone_number[2:]
-    elif not formatted_phone_number.startswith("0"):
-        formatted_phone_number = "0" + formatted_phone_number
+    # Stored either as 07... or 447...
+    formatted_phone_number = normalize_phone(phone_number)
+    if len(formatted_phone_number) < 10:
+        await result_callback({"found": False, "error": f"{phone_number} isn't a phone number."})
+        return
 
-    url = (
-        f"https://api.airtable.com/v0/{AIRTABLE_BASE_ID}/{AIRTABLE_BOOKINGS_TABLE}?"
-        f'filterByFormula=OR(SEARCH("{formatted_phone_number}",{{Contact_Number}}),SEARCH("{formatted_phone_number.replace("^0", "44")}",{{Contact_Number}}))&'
-        f"cellFormat=string&timeZone=Europe/London&userLocale=en-gb"
+    booking = await hot_bookings.find_by_phone(formatted_phone_number)
+    if booking:
+        logger.debug(f"Booking for {formatted_phone_number} found in cache")
+        await result_callback(format_booking(booking))
+        return
+
+    international = "44" + formatted_phone_number[1:]
+    params = lookup_params(
+        f'OR(SEARCH("{formatted_phone_number}",{{Contact_Number}}),'
+        f'SEARCH("{international}",{{Contact_Number}}))'
     )
 
-    headers = {"Authorization": f"Bearer {AIRTABLE_API_KEY}"}
+    headers = airtable_headers()
 
-    async with aiohttp.ClientSession() as session:
-        try:
-            async with session.get(url, headers=headers) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    if data["records"]:
-                        record = data["records"][0]["fields"]
-                        # Process and return the booking information
-                        # You may want to adjust this part based on your specific needs
-                        result = {
-                            "found": True,
-                            "booking": record,
-                        }
-                        await result_callback(json.dumps(result))
-                    else:
-                        logger.warning(
-                            f"No booking found for phone number: {formatted_phone_number}"
-                        )
-                        await result_callback(
-                            json.dumps(
-                                {
-                                    "found": False,
-                                    "error": f"No booking found for phone number {formatted_phone_number}.",
-                                }
-                            )
-                        )
+    async with airtable_session() as session:
+        await wait_for_airtable()
+        async with session.get(bookings_url(), params=params, headers=headers) as response:
+            if response.status == 200:
+                data = await response.json()
+                if data["records"]:
+                    booking = Booking.from_record(data["records"][0])
+                    # The caller will usually go on to use the registration.
+                    if booking.registration:
+                        await cache_booking(booking)
+                    await result_callback(format_booking(booking))
                 else:
-                    logger.error(f"Error response from Airtable: {response.status}")
+                    logger.warning(f"No booking found for phone number: {formatted_phone_number}")
                     await result_callback(
-                        json.dumps(
-                            {
-                                "found": False,
-                                "error": f"Failed to find booking. Status: {response.status}",
-                            }
-                        )
+                        {
+                            "found": False,
+                            "error": f"No booking found for phone number {formatted_phone_number}.",
+                        }
                     )
-        except Exception as error:
-            logger.error(f"Error finding booking by phone: {str(error)}")
-            await result_callback(
-                json.dumps(
-                    {"found": False, "error": f"Failed to find booking. Error: {str(error)}"}
+            else:
+                logger.error(f"Error response from Airtable: {response.status}")
+                await result_callback(
+                    {
+                        "found": False,
+                        "error": f"Failed to find booking. Status: {response.status}",
+                    }
                 )
-            )
@@ -0,0 +1,201 @@
+import asyncio
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from loguru import logger
+from prometheus_client import Counter, Gauge
+
+from breakers import breakers
+from tenants import Tenant, current_tenant, tenants
+
+from .airtable_config import (
+    BOOKING_CHANGED_SECS,
+    airtable_limiter,
+    airtable_session,
+    booking_changed_at,
+    lookup_params,
+    table_url,
+)
+from .booking import TIMEZONE, Booking, normalize_phone, normalize_registration
+
+HOT_BOOKINGS = Gauge("hot_bookings", "Bookings held in memory because they're due soon", ["tenant"])
+HOT_BOOKING_LOOKUPS = Counter(
+    "hot_booking_lookups_total",
+    "Booking lookups tried against the in-memory hot set, by what was looked up "
+    "(registration or phone) and result (hit or miss)",
+    ["key", "result"],
+)
+HOT_BOOKING_REFRESHES = Counter(
+    "hot_booking_refreshes_total", "Hot set reloads from Airtable, by result", ["tenant", "result"]
+)
+
+# Bookings changed this close to (or after) a reload aren't trusted from it,
+# allowing for clock differences between machines.
+CLOCK_SLACK_SECS = 5.0
+
+
+@dataclass(slots=True)
+class _Index:
+    loaded_at: float  # wall clock, when the reload was requested
+    by_registration: dict[str, Booking] = field(default_factory=dict)
+    by_phone: dict[str, Booking] = field(default_factory=dict)
+
+
+class HotBookings:
+    """Keeps the bookings due soon in memory, so most lookups skip Airtable.
+
+    Callers are only served within 6 hours of their drop-off or collection,
+    so nearly every lookup is for a booking in a small window around now.
+    Every `refresh_secs` the bookings whose Entry_Date_Time (or `end_field`,
+    for collections) is between `before_hours` ago and `after_hours` ahead
+    are reloaded for each tenant's table, and indexed by registration and
+    phone number. find_booking, find_booking_by_phone and whatsapp_message
+    look here first and only go to Airtable on a miss.
+
+    A booking changed through the functions or a bulk update is marked as
+    changed in the state store, on every machine, and isn't served from a
+    copy loaded before the change. An index that hasn't reloaded for three
+    refreshes (e.g. Airtable is down) isn't used. `refresh_secs=0` turns it off.
+    """
+
+    def __init__(
+        self,
+        *,
+        refresh_secs: float = 60.0,
+        before_hours: float = 2.0,
+        after_hours: float = 8.0,
+        end_field: str = "",
+    ):
+        self._refresh_secs = refresh_secs
+        self._before_hours = before_hours
+        self._after_hours = after_hours
+        self._end_field = end_field
+        self._max_age = min(3 * refresh_secs, BOOKING_CHANGED_SECS)
+        self._indexes = {}  # (base id, table) -> _Index
+        self._task = None
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._refresh_secs > 0
+
+    def start(self):
+        if self.enabled and not self._task:
+            self._task = asyncio.create_task(self._run())
+        return self._task
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def find(self, registration: str) -> Booking | None:
+        return await self._find("registration", normalize_registration(registration))
+
+    async def find_by_phone(self, phone_number: str) -> Booking | None:
+        return await self._find("phone", normalize_phone(phone_number))
+
+    async def _find(self, key: str, value: str) -> Booking | None:
+        if not self.enabled:
+            return None
+        tenant = current_tenant()
+        index = self._indexes.get((tenant.airtable_base_id, tenant.bookings_table))
+        booking = None
+        if index and time.time() - index.loaded_at < self._max_age:
+            found = (index.by_registration if key == "registration" else index.by_phone).get(value)
+            if found:
+                changed_at = await booking_changed_at(tenant, found.registration)
+                if changed_at is None or changed_at < index.loaded_at - CLOCK_SLACK_SECS:
+                    booking = found
+        if booking:
+            self.hits += 1
+        else:
+            self.misses += 1
+        HOT_BOOKING_LOOKUPS.labels(key=key, result="hit" if booking else "miss").inc()
+        return booking
+
+    def status(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "bookings": sum(len(index.by_registration) for index in self._indexes.values()),
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+        }
+
+    async def _run(self):
+        while True:
+            # Tenants sharing a table share its index.
+            tables = {}
+            for tenant in tenants:
+                if tenant.airtable_base_id and tenant.airtable_api_key:
+                    tables.setdefault((tenant.airtable_base_id, tenant.bookings_table), tenant)
+            await asyncio.gather(*(self._reload(tenant) for tenant in tables.values()))
+            await asyncio.sleep(self._refresh_secs)
+
+    async def _reload(self, tenant: Tenant):
+        try:
+            index = await self.load(tenant)
+        except Exception as error:
+            logger.warning(f"Couldn't reload hot bookings for {tenant.id}: {error!r}")
+            HOT_BOOKING_REFRESHES.labels(tenant=tenant.id, result="error").inc()
+            return
+        self._indexes[(tenant.airtable_base_id, tenant.bookings_table)] = index
+        HOT_BOOKINGS.labels(tenant=tenant.id).set(len(index.by_registration))
+        HOT_BOOKING_REFRESHES.labels(tenant=tenant.id, result="ok").inc()
+        logger.debug(f"Hot bookings for {tenant.id}: {len(index.by_registration)}")
+
+    async def load(self, tenant: Tenant) -> _Index:
+        """Reads the tenant's bookings in the window from Airtable."""
+        index = _Index(loaded_at=time.time())
+        params = lookup_params(self._formula(), max_records=None)
+        headers = {"Authorization": f"Bearer {tenant.airtable_api_key}"}
+        now = datetime.now(TIMEZONE)
+        offset = None
+        async with airtable_session() as session:
+            while True:
+                breakers["airtable"].check()
+                await airtable_limiter(tenant.airtable_base_id).wait()
+                page_params = params + [("offset", offset)] if offset else params
+                async with session.get(
+                    table_url(tenant), params=page_params, headers=headers
+                ) as response:
+                    if response.status != 200:
+                        raise RuntimeError(f"Airtable returned {response.status}")
+                    data = await response.json()
+                for record in data["records"]:
+                    self._add(index, Booking.from_record(record), now)
+                offset = data.get("offset")
+                if not offset:
+                    return index
+
+    def _add(self, index: _Index, booking: Booking, now: datetime):
+        if booking.registration:
+            index.by_registration[booking.registration] = booking
+        if booking.contact_number:
+            # A number with several bookings finds the one due nearest now.
+            other = index.by_phone.get(booking.contact_number)
+            if not other or _distance(booking, now) < _distance(other, now):
+                index.by_phone[booking.contact_number] = booking
+
+    def _formula(self) -> str:
+        windows = [
+            f"AND(IS_AFTER({{{name}}}, DATEADD(NOW(), -{self._before_hours:g}, 'hours')), "
+            f"IS_BEFORE({{{name}}}, DATEADD(NOW(), {self._after_hours:g}, 'hours')))"
+            for name in ("Entry_Date_Time", self._end_field)
+            if name
+        ]
+        return windows[0] if len(windows) == 1 else f"OR({', '.join(windows)})"
+
+
+def _distance(booking: Booking, now: datetime) -> float:
+    return abs((booking.entry - now).total_seconds()) if booking.entry else float("inf")
+
+
+hot_bookings = HotBookings(
+    refresh_secs=float(os.getenv("HOT_BOOKINGS_REFRESH_SECS", "60")),
+    before_hours=float(os.getenv("HOT_BOOKINGS_BEFORE_HOURS", "2")),
+    after_hours=float(os.getenv("HOT_BOOKINGS_AFTER_HOURS", "8")),
+    end_field=os.getenv("HOT_BOOKINGS_END_FIELD", ""),
+)
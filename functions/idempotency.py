@@ -0,0 +1,86 @@
+import asyncio
+import json
+import time
+
+from loguru import logger
+from prometheus_client import Counter
+
+TOOL_CALLS_DEDUPLICATED = Counter(
+    "tool_calls_deduplicated_total",
+    "Function calls answered from an earlier identical call instead of running again",
+    ["function", "source"],
+)
+
+
+def _normalize(value):
+    # Case and whitespace don't make a call different ("ve68 vep" is "VE68VEP").
+    if isinstance(value, str):
+        return "".join(value.split()).casefold()
+    if isinstance(value, dict):
+        return {key: _normalize(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_normalize(item) for item in value]
+    return value
+
+
+def is_error(result) -> bool:
+    try:
+        data = json.loads(result) if isinstance(result, str) else result
+    except ValueError:
+        return False
+    return isinstance(data, dict) and "error" in data
+
+
+class IdempotentTools:
+    """Makes function calls idempotent for the length of a call.
+
+    An interrupted or regenerated LLM turn can issue the same function call
+    again under a new tool_call_id. Calls are keyed by function name and
+    normalized arguments. A call that matches one still running waits for
+    that one's result. A call that matches one that succeeded in the last
+    `cache_secs` of its tool gets its result straight away. Either way the handler doesn't
+    run again, so a booking isn't PATCHed twice and staff don't get two
+    WhatsApp messages. Errors aren't cached, so a failed update can be
+    retried, and a successful call to a tool that isn't `read_only` clears
+    the cache, so a lookup after an update isn't answered stale.
+
+    Handlers run in their own task, so an interruption that cancels the LLM
+    turn doesn't cancel an update halfway through; the next identical call
+    picks up its result. Used as middleware (see functions.registry); create
+    one per call.
+    """
+
+    def __init__(self):
+        self._results = {}
+        self._in_flight = {}
+
+    async def __call__(self, tool, call, call_next):
+        key = (tool.name, json.dumps(_normalize(call.arguments), sort_keys=True))
+
+        cached = self._results.get(key)
+        if cached and cached[0] > time.monotonic():
+            logger.info(f"Reusing the result of an identical {tool.name} call")
+            TOOL_CALLS_DEDUPLICATED.labels(function=tool.name, source="cached").inc()
+            return cached[1]
+
+        task = self._in_flight.get(key)
+        if task:
+            logger.info(f"Waiting on an identical {tool.name} call already running")
+            TOOL_CALLS_DEDUPLICATED.labels(function=tool.name, source="in_flight").inc()
+        else:
+            task = asyncio.create_task(self._run(tool, key, call, call_next))
+            self._in_flight[key] = task
+
+        return await asyncio.shield(task)
+
+    async def _run(self, tool, key, call, call_next):
+        try:
+            result = await call_next(call)
+        finally:
+            del self._in_flight[key]
+
+        if result is not None and not is_error(result):
+            if not tool.read_only:
+                self._results.clear()
+            self._results[key] = (time.monotonic() + tool.cache_secs, result)
+        return result
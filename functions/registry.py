@@ -0,0 +1,219 @@
+"""Function tools and the middleware every function call goes through.
+
+Each function the LLM can call is declared once as a `Tool`: its name,
+description and arguments give the schema offered to the LLM, and
+`register_tools` registers its handler. A call goes through the middleware
+in order, then the handler:
+
+- `log_context`: the call's logs carry the tool name and tool_call_id
+- `timing`: `tool_run_seconds`, by function and result
+- `encode_result`: results that aren't already strings are JSON-encoded
+- `validate_arguments`: required arguments are present and text
+- `IdempotentTools`: repeated calls reuse the first one's result
+- `time_out`: the call is given up after the tool's `timeout_secs`
+- `map_errors`: exceptions become an error result for the LLM
+
+Handlers keep pipecat's signature, and pass a dict (or a string) to
+`result_callback`.
+"""
+
+import asyncio
+import json
+import time
+from dataclasses import dataclass, field, replace
+from typing import Any, Awaitable, Callable
+
+import aiohttp
+from loguru import logger
+from prometheus_client import Histogram
+
+from breakers import CircuitOpenError
+
+from .idempotency import IdempotentTools, is_error
+
+TOOL_RUN_SECONDS = Histogram(
+    "tool_run_seconds",
+    "Time a function call took from the LLM asking until its result, by function and "
+    "result: ok, error or cancelled",
+    ["function", "result"],
+    buckets=(0.005, 0.025, 0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 8.0, 15.0),
+)
+
+# Errors that mean an upstream is down or too slow, rather than that the
+# request was wrong.
+UPSTREAM_UNAVAILABLE = (CircuitOpenError, asyncio.TimeoutError, aiohttp.ClientConnectionError)
+
+
+@dataclass(frozen=True)
+class Tool:
+    """A function the LLM can call.
+
+    `parameters` maps each argument to its description; all of them are
+    required strings. `failure` is the error given to the LLM when the
+    handler raises, and `unavailable` the result when it raises because an
+    upstream is down (a breaker is open or it timed out). Results of
+    `read_only` tools are reused for `cache_secs`; any other tool's success
+    clears what's reused.
+    """
+
+    name: str
+    description: str
+    handler: Callable[..., Awaitable[None]]
+    parameters: dict[str, str] = field(default_factory=dict)
+    read_only: bool = False
+    cache_secs: float = 300.0
+    timeout_secs: float = 15.0
+    failure: str = "Something went wrong."
+    unavailable: str | dict | None = None
+
+    def schema(self) -> dict:
+        """The tool as OpenAI's ChatCompletionToolParam."""
+        return {
+            "type": "function",
+            "function": {
+                "name": self.name,
+                "description": self.description,
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        name: {"type": "string", "description": description}
+                        for name, description in self.parameters.items()
+                    },
+                    "required": list(self.parameters),
+                },
+            },
+        }
+
+
+@dataclass(frozen=True)
+class ToolCall:
+    function_name: str
+    tool_call_id: str
+    arguments: dict
+    llm: Any
+    context: Any
+
+
+# A middleware takes the tool, the call and the rest of the chain, and
+# returns the call's result.
+Next = Callable[[ToolCall], Awaitable[Any]]
+Middleware = Callable[[Tool, ToolCall, Next], Awaitable[Any]]
+
+
+async def log_context(tool: Tool, call: ToolCall, call_next: Next):
+    with logger.contextualize(tool=call.function_name, tool_call_id=call.tool_call_id):
+        return await call_next(call)
+
+
+async def timing(tool: Tool, call: ToolCall, call_next: Next):
+    start = time.monotonic()
+    outcome = "cancelled"
+    try:
+        result = await call_next(call)
+        outcome = "error" if is_error(result) else "ok"
+        return result
+    finally:
+        seconds = time.monotonic() - start
+        TOOL_RUN_SECONDS.labels(function=tool.name, result=outcome).observe(seconds)
+        logger.debug(f"{tool.name} took {seconds * 1000:.0f} ms ({outcome})")
+
+
+async def encode_result(tool: Tool, call: ToolCall, call_next: Next):
+    result = await call_next(call)
+    if result is None:
+        logger.error(f"{tool.name} returned no result")
+        result = {"error": tool.failure}
+    return result if isinstance(result, str) else json.dumps(result)
+
+
+async def validate_arguments(tool: Tool, call: ToolCall, call_next: Next):
+    arguments = dict(call.arguments or {})
+    for name in tool.parameters:
+        value = arguments.get(name)
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            # e.g. {"terminal": 2}
+            arguments[name] = value = str(value)
+        if not isinstance(value, str) or not value.strip():
+            logger.warning(f"{tool.name} called without a usable {name}: {value!r}")
+            return {
+                "error": f"{name} is missing.",
+                "instructions": f"Ask the caller for it, then call {tool.name} again.",
+            }
+    return await call_next(replace(call, arguments=arguments))
+
+
+async def time_out(tool: Tool, call: ToolCall, call_next: Next):
+    try:
+        async with asyncio.timeout(tool.timeout_secs):
+            return await call_next(call)
+    except TimeoutError:
+        logger.error(f"{tool.name} timed out after {tool.timeout_secs:g}s")
+        return tool.unavailable or {"error": f"{tool.failure} It took too long to respond."}
+
+
+async def map_errors(tool: Tool, call: ToolCall, call_next: Next):
+    try:
+        return await call_next(call)
+    except Exception as error:
+        if tool.unavailable is not None and isinstance(error, UPSTREAM_UNAVAILABLE):
+            logger.error(f"{tool.name} unavailable: {error!r}")
+            return tool.unavailable
+        logger.error(f"Error in {tool.name}: {error!r}")
+        return {"error": tool.failure, "details": str(error)}
+
+
+async def run_handler(tool: Tool, call: ToolCall):
+    results = []
+
+    async def capture(result):
+        results.append(result)
+
+    await tool.handler(
+        call.function_name, call.tool_call_id, call.arguments, call.llm, call.context, capture
+    )
+    return results[0] if results else None
+
+
+def call_middleware() -> list[Middleware]:
+    """The middleware for one call's function calls (IdempotentTools is per call)."""
+    return [
+        log_context,
+        timing,
+        encode_result,
+        validate_arguments,
+        IdempotentTools(),
+        time_out,
+        map_errors,
+    ]
+
+
+def chain(tool: Tool, middleware: list[Middleware]) -> Next:
+    """The tool's handler behind `middleware`, first one outermost."""
+
+    def bind(step: Middleware, call_next: Next) -> Next:
+        async def run(call: ToolCall):
+            return await step(tool, call, call_next)
+
+        return run
+
+    async def handler(call: ToolCall):
+        return await run_handler(tool, call)
+
+    run = handler
+    for step in reversed(middleware):
+        run = bind(step, run)
+    return run
+
+
+def register_tools(llm, tools, middleware: list[Middleware]):
+    """Registers each tool's handler, behind `middleware`, with the LLM service."""
+    for tool in tools:
+        run = chain(tool, middleware)
+
+        async def handler(
+            function_name, tool_call_id, arguments, llm, context, result_callback, run=run
+        ):
+            result = await run(ToolCall(function_name, tool_call_id, arguments, llm, context))
+            await result_callback(result)
+
+        llm.register_function(tool.name, handler)
@@ -0,0 +1,232 @@
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta
+from urllib.parse import urlencode
+
+import aiohttp
+from loguru import logger
+from prometheus_client import Counter, Histogram
+
+from breakers import breakers
+from state import StateStore, state_store
+
+from .booking import TIMEZONE
+
+STAFF_NOTIFICATIONS = Counter(
+    "staff_notifications_total",
+    "Booking notifications for staff, by whether they were sent at once or in a digest",
+    ["mode"],
+)
+STAFF_NOTIFICATION_MESSAGES = Counter(
+    "staff_notification_messages_total",
+    "WhatsApp messages sent to staff, by outcome (sent or error), and notifications given up "
+    "on after failing for too long (expired)",
+    ["result"],
+)
+STAFF_NOTIFICATION_CALLS_SAVED = Counter(
+    "staff_notification_api_calls_saved_total",
+    "Twilio API calls saved by sending several booking notifications in one message",
+)
+STAFF_NOTIFICATION_DELAY = Histogram(
+    "staff_notification_delay_seconds",
+    "Time from a booking notification being raised until Twilio accepted its message",
+    buckets=(0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 30.0, 60.0, 90.0, 120.0, 180.0),
+)
+
+# Twilio rejects WhatsApp bodies longer than this.
+MAX_MESSAGE_CHARS = 1600
+# How long past the digest window a claim on a group's timer is held, before
+# another machine may take it over.
+TIMER_GRACE_SECS = 30.0
+# Failed sends are retried after this, doubling each time up to the maximum.
+RETRY_SECS = 5.0
+MAX_RETRY_SECS = 120.0
+# Notifications that still haven't gone out after this are given up on: the
+# booking is outside the window callers are served in.
+MAX_NOTIFICATION_AGE_SECS = 6 * 3600.0
+
+
+class StaffNotifier:
+    """Coalesces booking notifications to staff WhatsApp groups into digests.
+
+    Notifications are grouped by WhatsApp group and terminal. The first one
+    in a group starts a `window_secs` timer, and everything that arrives
+    before it fires goes out as one message (split if it would be longer than
+    WhatsApp allows). A notification for a booking due within `urgent_mins`
+    is sent at once, taking anything already waiting for its group with it.
+    With `window_secs` at 0 every notification is sent at once.
+
+    Waiting notifications are queued in the state store, so with a shared
+    store the machines fill the same digests: whichever one claims a group's
+    timer sends the digest. If that machine stops before its timer fires,
+    the claim expires and the next notification for the group takes over.
+
+    Notifications are only taken off the queue for good once Twilio has
+    accepted their message. A batch that fails to send goes back on the
+    queue and is retried after `RETRY_SECS`, backing off to
+    `MAX_RETRY_SECS`.
+    """
+
+    def __init__(
+        self,
+        *,
+        window_secs: float = 60.0,
+        urgent_mins: float = 30.0,
+        store: StateStore | None = None,
+    ):
+        self._window_secs = window_secs
+        self._urgent = timedelta(minutes=urgent_mins)
+        self._store = store or state_store
+        self._timers = {}  # (group, terminal) -> this process's flush task
+        self._failures = {}  # (group, terminal) -> failed flushes in a row
+        self._keys = set()
+
+    def is_urgent(self, booking_time: datetime | None) -> bool:
+        return booking_time is not None and booking_time - datetime.now(TIMEZONE) <= self._urgent
+
+    async def notify(self, group: str, terminal: str, text: str, *, urgent: bool = False) -> bool:
+        """Queues `text` for the group's next digest, or sends it now if urgent.
+
+        Returns False only if an immediate send failed, in which case it's
+        retried with the rest of the queue.
+        """
+        key = (group, terminal)
+        self._keys.add(key)
+        await self._store.push(_queue_key(key), [time.time(), text])
+        if urgent or self._window_secs <= 0:
+            STAFF_NOTIFICATIONS.labels(mode="immediate").inc()
+            return await self._flush(key)
+
+        STAFF_NOTIFICATIONS.labels(mode="digest").inc()
+        await self._start_timer(key, self._window_secs)
+        return True
+
+    async def flush(self):
+        """Sends everything still waiting, e.g. before the server shuts down."""
+        await asyncio.gather(*(self._flush(key) for key in list(self._keys)))
+
+    async def _start_timer(self, key: tuple, delay: float):
+        if key not in self._timers and await self._store.add(
+            _timer_key(key), 1, ttl=delay + TIMER_GRACE_SECS
+        ):
+            self._timers[key] = asyncio.create_task(self._flush_after(key, delay))
+
+    async def _flush_after(self, key: tuple, delay: float):
+        await asyncio.sleep(delay)
+        self._timers.pop(key, None)
+        await self._flush(key, release_timer=True)
+
+    async def _flush(self, key: tuple, *, release_timer: bool = False) -> bool:
+        timer = self._timers.pop(key, None)
+        if timer:
+            timer.cancel()
+            release_timer = True
+        if release_timer:
+            await self._store.delete(_timer_key(key))
+        entries = await self._store.pop_all(_queue_key(key))
+        if not entries:
+            return True
+        # Retried entries went back on the end of the queue.
+        entries.sort(key=lambda entry: entry[0])
+
+        group, terminal = key
+        failed = []
+        async with breakers["twilio"].session() as session:
+            for batch in _batches(entries):
+                sent = await _send_whatsapp(session, group, _format_digest(terminal, batch))
+                STAFF_NOTIFICATION_MESSAGES.labels(result="sent" if sent else "error").inc()
+                if not sent:
+                    failed.extend(batch)
+                    continue
+                now = time.time()
+                for raised_at, _ in batch:
+                    STAFF_NOTIFICATION_DELAY.observe(now - raised_at)
+                STAFF_NOTIFICATION_CALLS_SAVED.inc(len(batch) - 1)
+                logger.info(
+                    f"Sent {len(batch)} booking notifications for {terminal}, "
+                    f"oldest waited {now - batch[0][0]:.1f}s"
+                )
+        if not failed:
+            self._failures.pop(key, None)
+            return True
+        await self._retry(key, failed)
+        return False
+
+    async def _retry(self, key: tuple, entries: list):
+        now = time.time()
+        expired = [entry for entry in entries if now - entry[0] > MAX_NOTIFICATION_AGE_SECS]
+        if expired:
+            logger.error(f"Giving up on {len(expired)} booking notifications for {key[1]}")
+            STAFF_NOTIFICATION_MESSAGES.labels(result="expired").inc(len(expired))
+        entries = [entry for entry in entries if entry not in expired]
+        if not entries:
+            return
+        for entry in entries:
+            await self._store.push(_queue_key(key), entry)
+        failures = self._failures.get(key, 0)
+        self._failures[key] = failures + 1
+        delay = min(RETRY_SECS * 2**failures, MAX_RETRY_SECS)
+        logger.warning(f"Retrying {len(entries)} booking notifications for {key[1]} in {delay:g}s")
+        await self._start_timer(key, delay)
+
+
+def _queue_key(key: tuple) -> str:
+    return "staff_digest:{}:{}".format(*key)
+
+
+def _timer_key(key: tuple) -> str:
+    return "staff_digest_timer:{}:{}".format(*key)
+
+
+def _format_digest(terminal: str, batch: list) -> str:
+    if len(batch) == 1:
+        return batch[0][1]
+    entries = "\n".join(f"{i}. {text.strip()}" for i, (_, text) in enumerate(batch, start=1))
+    return f"{len(batch)} bookings at {terminal} need a driver:\n\n{entries}"
+
+
+def _batches(entries: list):
+    # Splits entries so each digest fits in one WhatsApp message.
+    batch, size = [], 0
+    for entry in entries:
+        length = len(entry[1]) + 8
+        if batch and size + length > MAX_MESSAGE_CHARS - 64:
+            yield batch
+            batch, size = [], 0
+        batch.append(entry)
+        size += length
+    if batch:
+        yield batch
+
+
+async def _send_whatsapp(session, group: str, body: str) -> bool:
+    twilio_account_sid = os.getenv("TWILIO_ACCOUNT_SID")
+    twilio_url = f"https://api.twilio.com/2010-04-01/Accounts/{twilio_account_sid}/Messages.json"
+    auth = aiohttp.BasicAuth(twilio_account_sid, os.getenv("TWILIO_AUTH_TOKEN"))
+    data = {
+        "From": f"whatsapp:{os.getenv('TWILIO_WHATSAPP_NUMBER')}",
+        "To": f"whatsapp:{group}",
+        "Body": body,
+    }
+    try:
+        async with session.post(
+            twilio_url,
+            auth=auth,
+            data=urlencode(data),
+            headers={"Content-Type": "application/x-www-form-urlencoded"},
+        ) as response:
+            twilio_data = await response.json()
+        if response.status == 201:
+            logger.info(f'WhatsApp message sent successfully: {twilio_data.get("sid")}')
+            return True
+        logger.error(f'Failed to send WhatsApp message: {twilio_data.get("message", "Unknown error")}')
+    except Exception as error:
+        logger.error(f"Error sending WhatsApp message: {str(error)}")
+    return False
+
+
+staff_notifier = StaffNotifier(
+    window_secs=float(os.getenv("NOTIFY_DIGEST_SECS", "60")),
+    urgent_mins=float(os.getenv("NOTIFY_URGENT_MINS", "30")),
+)
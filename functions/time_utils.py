@@ -1,7 +1,5 @@
 import pytz
-from datetime import datetime, timedelta
-import re
-import json
+from datetime import datetime
 
 
 def get_current_time():
@@ -16,7 +14,7 @@ async def handle_get_current_time(
     function_name, tool_call_id, arguments, llm, context, result_callback
 ):
     current_time_info = get_current_time()
-    await result_callback(json.dumps(current_time_info))
+    await result_callback(current_time_info)
 
 
 def get_current_date():
@@ -31,33 +29,5 @@ async def handle_get_current_date(
     function_name, tool_call_id, arguments, llm, context, result_callback
 ):
     current_date_info = get_current_date()
-    await result_callback(json.dumps(current_date_info))
-
-
-def parse_eta(eta_string, current_time, timezone):
-    relative_regex = r"(\d+)\s*(minutes?|hours?)"
-    match = re.match(relative_regex, eta_string, re.IGNORECASE)
-    if match:
-        value = int(match.group(1))
-        unit = "hours" if match.group(2).lower().startswith("hour") else "minutes"
-        return current_time + timedelta(**{unit: value})
-
-    try:
-        parsed_time = datetime.strptime(eta_string, "%I:%M %p").time()
-        eta_datetime = datetime.combine(current_time.date(), parsed_time)
-        if parsed_time < current_time.time():
-            eta_datetime += timedelta(days=1)
-        return timezone.localize(eta_datetime)
-    except ValueError:
-        pass
-
-    try:
-        parsed_time = datetime.strptime(eta_string, "%H:%M").time()
-        eta_datetime = datetime.combine(current_time.date(), parsed_time)
-        if parsed_time < current_time.time():
-            eta_datetime += timedelta(days=1)
-        return timezone.localize(eta_datetime)
-    except ValueError:
-        pass
-
-    return None
+    await result_callback(current_date_info)
+
@@ -0,0 +1,115 @@
+from .airtable_config import unavailable_result
+from .find_booking import find_booking
+from .find_booking_by_phone import find_booking_by_phone
+from .registry import Tool
+from .time_utils import handle_get_current_date, handle_get_current_time
+from .transfer_call import TRANSFER_UNAVAILABLE, transfer_call
+from .update_eta import update_eta
+from .update_phone_number import update_phone_number
+from .update_registration import update_registration
+from .update_terminal import update_terminal
+from .whatsapp_message import whatsapp_message
+
+REGISTRATION = "The vehicle registration number"
+
+# Every function offered to the LLM, in the order they're offered.
+TOOLS = (
+    Tool(
+        name="find_booking",
+        description="Find a booking by registration number",
+        handler=find_booking,
+        parameters={"registration": REGISTRATION},
+        read_only=True,
+        timeout_secs=10.0,
+        failure="Failed to find booking.",
+        unavailable=unavailable_result(),
+    ),
+    Tool(
+        name="update_terminal",
+        description="Update the terminal for a booking",
+        handler=update_terminal,
+        parameters={
+            "registration": REGISTRATION,
+            "terminal": "The new terminal (e.g., 'Terminal 1', 'Terminal 2', 'Terminal 3')",
+        },
+        failure="Failed to update terminal.",
+        unavailable=unavailable_result(),
+    ),
+    Tool(
+        name="update_registration",
+        description="Update the registration number for a booking",
+        handler=update_registration,
+        parameters={
+            "old_registration": "The current vehicle registration number",
+            "new_registration": "The new vehicle registration number",
+        },
+        failure="Failed to update registration.",
+        unavailable=unavailable_result(),
+    ),
+    Tool(
+        name="update_phone_number",
+        description="Update the phone number for a booking",
+        handler=update_phone_number,
+        parameters={"registration": REGISTRATION, "phone_number": "The new phone number"},
+        failure="Failed to update phone number.",
+        unavailable=unavailable_result(),
+    ),
+    Tool(
+        name="transfer_call",
+        description="Transfer the current call to a human agent",
+        handler=transfer_call,
+        parameters={"call_sid": "The unique identifier for the current call"},
+        failure="Failed to transfer the call.",
+        unavailable=TRANSFER_UNAVAILABLE,
+    ),
+    Tool(
+        name="whatsapp_message",
+        description="Send a WhatsApp message to notify staff about a new booking",
+        handler=whatsapp_message,
+        parameters={"registration": REGISTRATION},
+        # Looks the booking up, then sends straight away if it's due soon.
+        timeout_secs=25.0,
+        failure="Failed to process the request.",
+        unavailable=unavailable_result(),
+    ),
+    Tool(
+        name="find_booking_by_phone",
+        description="Find a booking using the customer's phone number",
+        handler=find_booking_by_phone,
+        parameters={"phone_number": "The customer's phone number"},
+        read_only=True,
+        timeout_secs=10.0,
+        failure="Failed to find booking.",
+        unavailable=unavailable_result(),
+    ),
+    Tool(
+        name="update_eta",
+        description="Update the estimated time of arrival (ETA) for a booking",
+        handler=update_eta,
+        parameters={
+            "registration": REGISTRATION,
+            "customer_eta": "The customer's estimated time of arrival in their own words, e.g. "
+            "'half an hour', 'an hour and a half', 'quarter past four', 'twenty to six' or '16:30'",
+        },
+        failure="Failed to update ETA.",
+        unavailable=unavailable_result(),
+    ),
+    Tool(
+        name="get_current_time",
+        description="Get the current time in UK timezone",
+        handler=handle_get_current_time,
+        read_only=True,
+        cache_secs=15.0,
+        timeout_secs=1.0,
+    ),
+    Tool(
+        name="get_current_date",
+        description="Get the current date in UK timezone",
+        handler=handle_get_current_date,
+        read_only=True,
+        cache_secs=60.0,
+        timeout_secs=1.0,
+    ),
+)
+
+TOOLS_BY_NAME = {tool.name: tool for tool in TOOLS}
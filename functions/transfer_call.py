@@ -1,7 +1,16 @@
+import asyncio
 import os
-import json
 from twilio.rest import Client
 from loguru import logger
+from breakers import breakers
+from tenants import current_tenant
+
+# The result while Twilio is down or too slow to transfer the call.
+TRANSFER_UNAVAILABLE = {
+    "error": "The call can't be transferred right now.",
+    "unavailable": True,
+    "instructions": "Apologise and ask the caller to ring back in a few minutes.",
+}
 
 
 async def transfer_call(function_name, tool_call_id, arguments, llm, context, result_callback):
@@ -13,12 +22,11 @@ async def transfer_call(function_name, tool_call_id, arguments, llm, context, re
 
     logger.debug(f"Transferring call {call_sid}")
 
-    try:
-        client.calls(call_sid).update(
-            twiml=f'<Response><Dial>{os.getenv("TRANSFER_NUMBER")}</Dial></Response>'
+    # The Twilio client is synchronous.
+    async with breakers["twilio"].guard():
+        await asyncio.to_thread(
+            client.calls(call_sid).update,
+            twiml=f"<Response><Dial>{current_tenant().transfer_number}</Dial></Response>",
         )
-        result = "The call was transferred successfully, say goodbye to the customer."
-        await result_callback(json.dumps({"success": result}))
-    except Exception as error:
-        logger.error(f"Error transferring call: {str(error)}")
-        await result_callback(json.dumps({"error": str(error)}))
+    result = "The call was transferred successfully, say goodbye to the customer."
+    await result_callback({"success": result})
@@ -1,9 +1,15 @@
-import json
 import pytz
 from datetime import datetime
 from loguru import logger
-import aiohttp
-from .airtable_config import AIRTABLE_API_KEY, AIRTABLE_BASE_ID, AIRTABLE_BOOKINGS_TABLE
+from .airtable_config import (
+    airtable_headers,
+    airtable_session,
+    bookings_url,
+    forget_booking,
+    lookup_params,
+    wait_for_airtable,
+)
+from .booking import ID_FIELDS
 
 
 async def update_phone_number(
@@ -20,80 +26,64 @@ async def update_phone_number(
 
     formatted_registration = registration.replace(" ", "").upper()
 
-    url = (
-        f"https://api.airtable.com/v0/{AIRTABLE_BASE_ID}/{AIRTABLE_BOOKINGS_TABLE}?"
-        f'filterByFormula=UPPER({{Registration}})=UPPER("{formatted_registration}")&'
-        f"cellFormat=string&timeZone=Europe/London&userLocale=en-gb"
-    )
+    # Only the record id is needed.
+    params = lookup_params(f'UPPER({{Registration}})=UPPER("{formatted_registration}")', ID_FIELDS)
 
-    headers = {"Authorization": f"Bearer {AIRTABLE_API_KEY}"}
+    headers = airtable_headers()
 
-    async with aiohttp.ClientSession() as session:
-        try:
-            async with session.get(url, headers=headers) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    if not data["records"]:
-                        logger.warning(
-                            f"No booking found for registration: {formatted_registration}"
-                        )
-                        await result_callback(
-                            json.dumps({"error": "No booking found for this registration number."})
-                        )
-                        return
+    async with airtable_session() as session:
+        await wait_for_airtable()
+        async with session.get(bookings_url(), params=params, headers=headers) as response:
+            if response.status == 200:
+                data = await response.json()
+                if not data["records"]:
+                    logger.warning(f"No booking found for registration: {formatted_registration}")
+                    await result_callback(
+                        {"error": "No booking found for this registration number."}
+                    )
+                    return
 
-                    record = data["records"][0]
-                    record_id = record["id"]
+                record = data["records"][0]
+                record_id = record["id"]
 
-                    patch_url = (
-                        f"https://api.airtable.com/v0/{AIRTABLE_BASE_ID}/{AIRTABLE_BOOKINGS_TABLE}"
-                    )
-                    patch_data = {
-                        "records": [{"id": record_id, "fields": {"Contact_Number": phone_number}}],
-                        "typecast": True,
-                    }
+                patch_url = bookings_url()
+                patch_data = {
+                    "records": [{"id": record_id, "fields": {"Contact_Number": phone_number}}],
+                    "typecast": True,
+                }
 
-                    async with session.patch(
-                        patch_url, headers=headers, json=patch_data
-                    ) as patch_response:
-                        if patch_response.status == 200:
-                            patch_data = await patch_response.json()
-                            logger.info(
-                                f"Phone number updated successfully. New number: {phone_number}"
-                            )
-                            await result_callback(
-                                json.dumps(
-                                    {
-                                        "success": "Phone number updated successfully.",
-                                        "updatedRecord": patch_data["records"][0],
-                                        "updatedPhoneNumber": phone_number,
-                                    }
-                                )
-                            )
-                        else:
-                            error_text = await patch_response.text()
-                            logger.error(f"Error updating phone number: {error_text}")
-                            await result_callback(
-                                json.dumps(
-                                    {
-                                        "error": "Failed to update phone number.",
-                                        "details": error_text,
-                                    }
-                                )
-                            )
-                else:
-                    error_text = await response.text()
-                    logger.error(f"Error response from Airtable: {response.status}")
-                    await result_callback(
-                        json.dumps(
+                await wait_for_airtable()
+                async with session.patch(
+                    patch_url, headers=headers, json=patch_data
+                ) as patch_response:
+                    if patch_response.status == 200:
+                        patch_data = await patch_response.json()
+                        await forget_booking(formatted_registration)
+                        logger.info(
+                            f"Phone number updated successfully. New number: {phone_number}"
+                        )
+                        await result_callback(
+                            {
+                                "success": "Phone number updated successfully.",
+                                "updatedRecord": patch_data["records"][0],
+                                "updatedPhoneNumber": phone_number,
+                            }
+                        )
+                    else:
+                        error_text = await patch_response.text()
+                        logger.error(f"Error updating phone number: {error_text}")
+                        await result_callback(
                             {
-                                "error": f"Failed to find booking. Status: {response.status}",
+                                "error": "Failed to update phone number.",
                                 "details": error_text,
                             }
                         )
-                    )
-        except Exception as error:
-            logger.error(f"Error updating phone number: {str(error)}")
-            await result_callback(
-                json.dumps({"error": "Failed to update phone number.", "details": str(error)})
-            )
+            else:
+                error_text = await response.text()
+                logger.error(f"Error response from Airtable: {response.status}")
+                await result_callback(
+                    {
+                        "error": f"Failed to find booking. Status: {response.status}",
+                        "details": error_text,
+                    }
+                )
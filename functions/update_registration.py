@@ -1,9 +1,15 @@
-import json
 import pytz
 from datetime import datetime
 from loguru import logger
-import aiohttp
-from .airtable_config import AIRTABLE_API_KEY, AIRTABLE_BASE_ID, AIRTABLE_BOOKINGS_TABLE
+from .airtable_config import (
+    airtable_headers,
+    airtable_session,
+    bookings_url,
+    forget_booking,
+    lookup_params,
+    wait_for_airtable,
+)
+from .booking import ID_FIELDS
 
 
 async def update_registration(
@@ -21,86 +27,75 @@ async def update_registration(
     formatted_old_registration = old_registration.replace(" ", "").upper()
     formatted_new_registration = new_registration.replace(" ", "").upper()
 
-    url = (
-        f"https://api.airtable.com/v0/{AIRTABLE_BASE_ID}/{AIRTABLE_BOOKINGS_TABLE}?"
-        f'filterByFormula=UPPER({{Registration}})=UPPER("{formatted_old_registration}")&'
-        f"cellFormat=string&timeZone=Europe/London&userLocale=en-gb"
+    # Only the record id is needed.
+    params = lookup_params(
+        f'UPPER({{Registration}})=UPPER("{formatted_old_registration}")', ID_FIELDS
     )
 
-    headers = {"Authorization": f"Bearer {AIRTABLE_API_KEY}"}
+    headers = airtable_headers()
 
-    async with aiohttp.ClientSession() as session:
-        try:
-            async with session.get(url, headers=headers) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    if not data["records"]:
-                        logger.warning(
-                            f"No booking found for registration: {formatted_old_registration}"
-                        )
-                        await result_callback(
-                            json.dumps({"error": "No booking found for this registration number."})
-                        )
-                        return
+    async with airtable_session() as session:
+        await wait_for_airtable()
+        async with session.get(bookings_url(), params=params, headers=headers) as response:
+            if response.status == 200:
+                data = await response.json()
+                if not data["records"]:
+                    logger.warning(
+                        f"No booking found for registration: {formatted_old_registration}"
+                    )
+                    await result_callback(
+                        {"error": "No booking found for this registration number."}
+                    )
+                    return
 
-                    record = data["records"][0]
-                    record_id = record["id"]
+                record = data["records"][0]
+                record_id = record["id"]
 
-                    patch_url = (
-                        f"https://api.airtable.com/v0/{AIRTABLE_BASE_ID}/{AIRTABLE_BOOKINGS_TABLE}"
-                    )
-                    patch_data = {
-                        "records": [
+                patch_url = bookings_url()
+                patch_data = {
+                    "records": [
+                        {
+                            "id": record_id,
+                            "fields": {"Registration": formatted_new_registration},
+                        }
+                    ],
+                    "typecast": True,
+                }
+
+                await wait_for_airtable()
+                async with session.patch(
+                    patch_url, headers=headers, json=patch_data
+                ) as patch_response:
+                    if patch_response.status == 200:
+                        patch_data = await patch_response.json()
+                        await forget_booking(formatted_old_registration)
+                        await forget_booking(formatted_new_registration)
+                        logger.info(
+                            f"Registration updated successfully. New registration: {formatted_new_registration}"
+                        )
+                        await result_callback(
                             {
-                                "id": record_id,
-                                "fields": {"Registration": formatted_new_registration},
+                                "success": "Registration updated successfully.",
+                                "updatedRecord": patch_data["records"][0],
+                                "oldRegistration": formatted_old_registration,
+                                "newRegistration": formatted_new_registration,
                             }
-                        ],
-                        "typecast": True,
-                    }
-
-                    async with session.patch(
-                        patch_url, headers=headers, json=patch_data
-                    ) as patch_response:
-                        if patch_response.status == 200:
-                            patch_data = await patch_response.json()
-                            logger.info(
-                                f"Registration updated successfully. New registration: {formatted_new_registration}"
-                            )
-                            await result_callback(
-                                json.dumps(
-                                    {
-                                        "success": "Registration updated successfully.",
-                                        "updatedRecord": patch_data["records"][0],
-                                        "oldRegistration": formatted_old_registration,
-                                        "newRegistration": formatted_new_registration,
-                                    }
-                                )
-                            )
-                        else:
-                            error_text = await patch_response.text()
-                            logger.error(f"Error updating registration: {error_text}")
-                            await result_callback(
-                                json.dumps(
-                                    {
-                                        "error": "Failed to update registration.",
-                                        "details": error_text,
-                                    }
-                                )
-                            )
-                else:
-                    error_text = await response.text()
-                    logger.error(f"Error response from Airtable: {response.status}")
-                    await result_callback(
-                        json.dumps(
+                        )
+                    else:
+                        error_text = await patch_response.text()
+                        logger.error(f"Error updating registration: {error_text}")
+                        await result_callback(
                             {
-                                "error": f"Failed to find booking. Status: {response.status}",
+                                "error": "Failed to update registration.",
                                 "details": error_text,
                             }
                         )
-                    )
-        except Exception as error:
-            logger.error(f"Error updating registration: {str(error)}")
-            await result_callback(
-                json.dumps({"error": "Failed to update registration.", "details": str(error)})
-            )
+            else:
+                error_text = await response.text()
+                logger.error(f"Error response from Airtable: {response.status}")
+                await result_callback(
+                    {
+                        "error": f"Failed to find booking. Status: {response.status}",
+                        "details": error_text,
+                    }
+                )
@@ -1,53 +1,59 @@
+import hashlib
 import os
-import json
-import aiohttp
-from urllib.parse import urlencode
 from loguru import logger
 from .airtable_config import (
-    AIRTABLE_API_KEY,
-    AIRTABLE_BASE_ID,
-    AIRTABLE_BOOKINGS_TABLE,
+    airtable_headers,
+    airtable_session,
+    bookings_url,
+    cached_booking,
+    lookup_params,
+    wait_for_airtable,
 )
+from .booking import Booking
+from .hot_bookings import hot_bookings
+from .staff_notifications import staff_notifier
+from state import state_store
+from tenants import current_tenant
+
+# A notification identical to one sent within this long is dropped, whichever
+# call or machine sent the first (e.g. a caller who rings back and repeats
+# themselves).
+NOTIFY_DEDUP_SECS = float(os.getenv("NOTIFY_DEDUP_SECS", "900"))
 
 
 async def whatsapp_message(function_name, tool_call_id, arguments, llm, context, result_callback):
     registration = arguments.get("registration")
     is_arrival = arguments.get("is_arrival", False)
 
-    table_name = AIRTABLE_BOOKINGS_TABLE
-    twilio_account_sid = os.getenv("TWILIO_ACCOUNT_SID")
-    twilio_auth_token = os.getenv("TWILIO_AUTH_TOKEN")
-    twilio_whatsapp_number = os.getenv("TWILIO_WHATSAPP_NUMBER")
-    manager_whatsapp_group = os.getenv("MANAGER_WHATSAPP_GROUP")
+    manager_whatsapp_group = current_tenant().manager_whatsapp_group
 
     formatted_registration = registration.replace(" ", "").upper()
 
-    airtable_url = (
-        f"https://api.airtable.com/v0/{AIRTABLE_BASE_ID}/{table_name}?"
-        f'filterByFormula=UPPER({{Registration}})=UPPER("{formatted_registration}")&'
-        f"cellFormat=string&timeZone=Europe/London&userLocale=en-gb"
-    )
+    params = lookup_params(f'UPPER({{Registration}})=UPPER("{formatted_registration}")')
 
-    async with aiohttp.ClientSession() as session:
-        try:
+    async with airtable_session() as session:
+        booking = await hot_bookings.find(formatted_registration)
+        if not booking:
+            booking = await cached_booking(formatted_registration)
+        if not booking:
+            await wait_for_airtable()
             async with session.get(
-                airtable_url, headers={"Authorization": f"Bearer {AIRTABLE_API_KEY}"}
+                bookings_url(), params=params, headers=airtable_headers()
             ) as response:
-                airtable_data = await response.json()
-
-            if airtable_data["records"]:
-                record = airtable_data["records"][0]["fields"]
+                data = await response.json()
+            booking = Booking.from_record(data["records"][0]) if data["records"] else None
 
-                vehicle_make = record.get("Vehicle_Make", "N/A")
-                name = record.get("Name", "N/A")
-                contact_number = record.get("Contact_Number", "N/A")
-                entry_date_time = record.get("Entry_Date_Time", "N/A")
-                terminal = record.get("Terminal", "N/A")
-                estimated_eta = record.get("Current_ETA", "N/A")
+        if booking:
+            vehicle_make = booking.vehicle_make or "N/A"
+            name = booking.name or "N/A"
+            contact_number = booking.contact_number or "N/A"
+            entry_date_time = booking.entry_text or "N/A"
+            terminal = booking.terminal or "N/A"
+            estimated_eta = booking.current_eta_text or "N/A"
 
-                booking_type = "Arrival (Pick-up)" if is_arrival else "(Drop-off)"
+            booking_type = "Arrival (Pick-up)" if is_arrival else "(Drop-off)"
 
-                message = f"""
+            message = f"""
 New {booking_type} Booking Requires Driver Assignment:
 - Vehicle: {vehicle_make}
 - Registration: {registration}
@@ -60,56 +66,31 @@ New {booking_type} Booking Requires Driver Assignment:
 Please assign a driver for this {"pick-up" if is_arrival else "drop-off"}.
 """
 
-                logger.debug(f"WhatsApp message content: {message}")
+            logger.trace(f"WhatsApp message content: {message}")
 
-                twilio_url = (
-                    f"https://api.twilio.com/2010-04-01/Accounts/{twilio_account_sid}/Messages.json"
+            digest = hashlib.sha256(message.encode()).hexdigest()[:32]
+            dedup_key = f"notified:{manager_whatsapp_group}:{digest}"
+            if not await state_store.add(dedup_key, 1, ttl=NOTIFY_DEDUP_SECS):
+                logger.info(f"Staff already notified about {formatted_registration}")
+                await result_callback(
+                    {"success": "Manager notified successfully.", "isArrival": is_arrival}
                 )
-                auth = aiohttp.BasicAuth(twilio_account_sid, twilio_auth_token)
-                data = {
-                    "From": f"whatsapp:{twilio_whatsapp_number}",
-                    "To": f"whatsapp:{manager_whatsapp_group}",
-                    "Body": message,
-                }
-
-                async with session.post(
-                    twilio_url,
-                    auth=auth,
-                    data=urlencode(data),
-                    headers={"Content-Type": "application/x-www-form-urlencoded"},
-                ) as twilio_response:
-                    twilio_data = await twilio_response.json()
+                return
 
-                if twilio_response.status == 201:
-                    if "sid" in twilio_data:
-                        logger.info(f'WhatsApp message sent successfully: {twilio_data["sid"]}')
-                        await result_callback(
-                            json.dumps(
-                                {
-                                    "success": "Manager notified successfully.",
-                                    "messageId": twilio_data["sid"],
-                                    "isArrival": is_arrival,
-                                }
-                            )
-                        )
-                    else:
-                        logger.warning("WhatsApp message sent, but no SID returned")
-                        await result_callback(
-                            json.dumps(
-                                {
-                                    "success": "Manager notified, but no message ID available.",
-                                    "isArrival": is_arrival,
-                                }
-                            )
-                        )
-                else:
-                    error_message = twilio_data.get("message", "Unknown error")
-                    logger.error(f"Failed to send WhatsApp message: {error_message}")
-                    await result_callback(
-                        json.dumps({"error": f"Failed to send WhatsApp message: {error_message}"})
-                    )
-        except Exception as error:
-            logger.error(f"Error in whatsappMessage function: {str(error)}")
-            await result_callback(
-                json.dumps({"error": "Failed to process the request.", "details": str(error)})
+            # Coalesced with other notifications for the same terminal
+            # unless the booking is due soon.
+            notified = await staff_notifier.notify(
+                manager_whatsapp_group,
+                terminal,
+                message,
+                urgent=staff_notifier.is_urgent(booking.entry),
             )
+            if notified:
+                await result_callback(
+                    {"success": "Manager notified successfully.", "isArrival": is_arrival}
+                )
+            else:
+                # Still queued, and retried until Twilio takes it.
+                await result_callback(
+                    {"success": "The manager will be notified shortly.", "isArrival": is_arrival}
+                )
@@ -0,0 +1,152 @@
+import os
+import queue
+import sys
+import threading
+import time
+import traceback
+from collections import defaultdict
+
+import orjson
+from loguru import logger
+from prometheus_client import Counter, Gauge
+
+LOG_RECORDS = Counter("log_records_total", "Log records written", ["level"])
+LOG_RECORDS_SAMPLED_OUT = Counter(
+    "log_records_sampled_out_total", "Debug and trace records skipped by sampling"
+)
+LOG_RECORDS_DROPPED = Counter(
+    "log_records_dropped_total", "Log records dropped because the writer fell behind"
+)
+LOG_QUEUE_DEPTH = Gauge("log_queue_depth", "Log records waiting for the writer thread")
+
+# Records from a single DEBUG/TRACE call site beyond `LOG_SAMPLE_BURST` per
+# second are sampled, keeping one in `LOG_SAMPLE_EVERY`.
+SAMPLED_LEVELS = {"TRACE", "DEBUG"}
+
+# The writer thread wakes at most this often, so bursts are written in batches.
+WRITER_INTERVAL_SECS = 0.02
+
+TEXT_FORMAT = "{time:HH:mm:ss.SSS} | {level: <8} | {name}:{function}:{line} - {message}"
+
+
+class BackgroundSink:
+    """A loguru sink that hands formatted records to a writer thread.
+
+    The event loop only pays for a non-blocking put on a bounded queue. If the
+    writer can't keep up (e.g. stderr is a slow pipe) records are dropped and
+    counted instead of stalling the loop.
+    """
+
+    def __init__(self, stream, maxsize: int = 10000):
+        self._stream = stream
+        self._queue = queue.Queue(maxsize)
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+        LOG_QUEUE_DEPTH.set_function(self._queue.qsize)
+
+    def write(self, message: str):
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            self.dropped += 1
+            LOG_RECORDS_DROPPED.inc()
+
+    def stop(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        running = True
+        while running:
+            # Drain whatever is queued and write it in one go, so the writer
+            # takes the GIL once per batch rather than once per record.
+            batch = [self._queue.get()]
+            while len(batch) < 1024:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                batch = batch[: batch.index(None)]
+                running = False
+            if batch:
+                self._stream.write("".join(batch))
+                self._stream.flush()
+            if running:
+                time.sleep(WRITER_INTERVAL_SECS)
+
+
+class Sampler:
+    """Per-call-site rate sampling for hot-path debug messages."""
+
+    def __init__(self, burst: int, every: int):
+        self._burst = burst
+        self._every = every
+        self._window = int(time.monotonic())
+        self._counts = defaultdict(int)
+
+    def __call__(self, record) -> bool:
+        if record["level"].name in SAMPLED_LEVELS and self._every > 1:
+            window = int(time.monotonic())
+            if window != self._window:
+                self._window = window
+                self._counts.clear()
+            key = (record["name"], record["line"])
+            self._counts[key] += 1
+            count = self._counts[key]
+            if count > self._burst and count % self._every:
+                LOG_RECORDS_SAMPLED_OUT.inc()
+                return False
+        LOG_RECORDS.labels(level=record["level"].name).inc()
+        return True
+
+
+def _format_json(record) -> str:
+    entry = {
+        "time": record["time"].isoformat(),
+        "level": record["level"].name,
+        "message": record["message"],
+        "logger": f"{record['name']}:{record['function']}:{record['line']}",
+    }
+    entry.update(record["extra"])
+    if record["exception"]:
+        exception = record["exception"]
+        entry["exception"] = "".join(
+            traceback.format_exception(exception.type, exception.value, exception.traceback)
+        )
+    record["extra"]["_line"] = orjson.dumps(entry, default=str).decode("utf-8")
+    return "{extra[_line]}\n"
+
+
+def _format_text(record) -> str:
+    context = " ".join(f"{key}={value}" for key, value in record["extra"].items())
+    record["extra"]["_context"] = f" [{context}]" if context else ""
+    return TEXT_FORMAT + "{extra[_context]}\n{exception}"
+
+
+def setup_logging(stream=sys.stderr) -> BackgroundSink:
+    """Replaces loguru's default handler with the background JSON sink.
+
+    Configured with LOG_LEVEL (default DEBUG), LOG_FORMAT (`json` or `text`),
+    LOG_SAMPLE_BURST and LOG_SAMPLE_EVERY.
+    """
+    level = os.getenv("LOG_LEVEL", "DEBUG")
+    json_format = os.getenv("LOG_FORMAT", "json") == "json"
+    sampler = Sampler(
+        burst=int(os.getenv("LOG_SAMPLE_BURST", "20")),
+        every=int(os.getenv("LOG_SAMPLE_EVERY", "10")),
+    )
+
+    sink = BackgroundSink(stream)
+    logger.remove()
+    logger.add(
+        sink.write,
+        level=level,
+        format=_format_json if json_format else _format_text,
+        filter=sampler,
+        colorize=False,
+        backtrace=False,
+        diagnose=False,
+    )
+    return sink
@@ -0,0 +1,19 @@
+from .idle_reaper import IdleCallReaper
+from .phone_text_aggregator import PhoneTextAggregator
+from .scripted_dialog import ScriptedConfirmations
+from .tool_filler import ToolLatencyFiller
+from .turn_completion import TurnCompletionDetector
+from .turn_latency import TimeToFirstAudioObserver
+from .twilio_playout import TwilioPlayoutTracker, TwilioAudioPacer, TwilioMarkSender
+
+__all__ = [
+    "IdleCallReaper",
+    "PhoneTextAggregator",
+    "ScriptedConfirmations",
+    "ToolLatencyFiller",
+    "TurnCompletionDetector",
+    "TimeToFirstAudioObserver",
+    "TwilioPlayoutTracker",
+    "TwilioAudioPacer",
+    "TwilioMarkSender",
+]
@@ -0,0 +1,178 @@
+import asyncio
+import time
+
+from loguru import logger
+from prometheus_client import Counter, Gauge, Histogram
+
+from pipecat.frames.frames import (
+    EndTaskFrame,
+    Frame,
+    OutputAudioRawFrame,
+    StartFrame,
+    TTSSpeakFrame,
+    UserStartedSpeakingFrame,
+    UserStoppedSpeakingFrame,
+)
+from pipecat.processors.frame_processor import FrameDirection
+from pipecat.processors.user_idle_processor import UserIdleProcessor
+
+from services.phrase_cache import PhraseCache
+
+CALLS_ACTIVE = Gauge("calls_active", "Calls currently running a pipeline")
+CALLS_REAPED = Counter(
+    "calls_reaped_total",
+    "Calls ended by the bot because the caller went silent or the call ran too long",
+    ["reason"],
+)
+CALL_IDLE_SECONDS_REAPED = Counter(
+    "call_idle_seconds_reaped_total",
+    "Seconds the caller had been silent on calls ended for being idle, up to the goodbye",
+)
+CALL_TEARDOWN = Histogram(
+    "call_teardown_seconds",
+    "Time from the bot ending a call until its pipeline was torn down",
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 10.0),
+)
+CALL_TEARDOWN_FORCED = Counter(
+    "call_teardown_forced_total",
+    "Calls whose pipeline had to be cancelled because it didn't stop in time",
+)
+
+CHECK_IN_PHRASE = "Are you still there?"
+IDLE_GOODBYE_PHRASE = (
+    "I haven't heard from you for a while, so I'll end the call now. "
+    "Please call back if you need any help. Goodbye!"
+)
+MAX_DURATION_GOODBYE_PHRASE = (
+    "I'm sorry, but I need to end the call now. "
+    "Please call back if there's anything else I can help with. Goodbye!"
+)
+PHRASES = (CHECK_IN_PHRASE, IDLE_GOODBYE_PHRASE, MAX_DURATION_GOODBYE_PHRASE)
+
+# Extra time after a goodbye clip before ending, so Twilio can play out its
+# buffer before the stream is closed.
+GOODBYE_TAIL_SECS = 0.5
+# Speaking rate used to estimate how long a phrase takes when it isn't cached.
+WORDS_PER_SEC = 2.5
+
+
+class IdleCallReaper(UserIdleProcessor):
+    """Ends calls where the caller has gone silent, or that run too long.
+
+    Goes where `user_idle` would, right after the STT service. After
+    `idle_secs` without the caller or the bot speaking it plays a check-in
+    prompt. If the caller stays silent for another `idle_secs` it plays a
+    goodbye and ends the call with an EndFrame. Any speech from the caller
+    starts the sequence over. Calls longer than `max_call_secs` are ended the
+    same way.
+
+    Prompts are played from the phrase cache (spoken by the TTS service if a
+    clip isn't rendered yet), so ending a call never waits on the LLM. If the
+    pipeline hasn't been torn down `teardown_secs` after the EndFrame, the
+    `on_teardown_timeout` event fires so the owner can cancel the task.
+    """
+
+    def __init__(
+        self,
+        phrases: PhraseCache,
+        *,
+        idle_secs: float = 10.0,
+        max_call_secs: float = 900.0,
+        teardown_secs: float = 5.0,
+        **kwargs,
+    ):
+        super().__init__(callback=self._on_idle, timeout=idle_secs, **kwargs)
+        self._phrases = phrases
+        self._max_call_secs = max_call_secs
+        self._teardown_secs = teardown_secs
+
+        self._idle_stage = 0
+        self._started_at = None
+        self._caller_silent_since = None
+        self._ending = False
+        self._end_requested_at = None
+        self._max_duration_task = None
+        self._watchdog_task = None
+
+        self._register_event_handler("on_teardown_timeout")
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+
+        if isinstance(frame, StartFrame):
+            self._started_at = self._caller_silent_since = time.monotonic()
+            CALLS_ACTIVE.inc()
+            loop = self.get_event_loop()
+            loop.create_task(self._phrases.preload(PHRASES))
+            self._max_duration_task = loop.create_task(self._max_duration_task_handler())
+        elif isinstance(frame, UserStartedSpeakingFrame):
+            self._idle_stage = 0
+            self._caller_silent_since = None
+        elif isinstance(frame, UserStoppedSpeakingFrame):
+            self._caller_silent_since = time.monotonic()
+
+    async def cleanup(self):
+        await super().cleanup()
+        for task in (self._max_duration_task, self._watchdog_task):
+            if task and task is not asyncio.current_task():
+                task.cancel()
+        if self._end_requested_at:
+            CALL_TEARDOWN.observe(time.monotonic() - self._end_requested_at)
+        if self._started_at:
+            CALLS_ACTIVE.dec()
+            self._started_at = None
+
+    async def _on_idle(self, _):
+        if self._ending:
+            return
+        self._idle_stage += 1
+        if self._idle_stage == 1:
+            logger.debug("Caller is idle, checking in")
+            await self._say(CHECK_IN_PHRASE)
+        else:
+            await self._end_call("idle", IDLE_GOODBYE_PHRASE)
+
+    async def _max_duration_task_handler(self):
+        try:
+            await asyncio.sleep(self._max_call_secs)
+            await self._end_call("max_duration", MAX_DURATION_GOODBYE_PHRASE)
+        except asyncio.CancelledError:
+            pass
+
+    async def _end_call(self, reason: str, goodbye: str):
+        if self._ending:
+            return
+        self._ending = True
+
+        elapsed = time.monotonic() - self._started_at
+        logger.info(f"Ending call after {elapsed:.0f}s ({reason})")
+        CALLS_REAPED.labels(reason=reason).inc()
+        if reason == "idle" and self._caller_silent_since:
+            CALL_IDLE_SECONDS_REAPED.inc(time.monotonic() - self._caller_silent_since)
+
+        duration = await self._say(goodbye)
+        await asyncio.sleep(duration + GOODBYE_TAIL_SECS)
+
+        self._end_requested_at = time.monotonic()
+        await self.push_frame(EndTaskFrame(), FrameDirection.UPSTREAM)
+        self._watchdog_task = self.get_event_loop().create_task(self._watchdog_task_handler())
+
+    async def _watchdog_task_handler(self):
+        try:
+            await asyncio.sleep(self._teardown_secs)
+            logger.warning(f"Pipeline still running {self._teardown_secs}s after ending the call")
+            CALL_TEARDOWN_FORCED.inc()
+            await self._call_event_handler("on_teardown_timeout")
+        except asyncio.CancelledError:
+            pass
+
+    async def _say(self, text: str) -> float:
+        """Plays `text` and returns roughly how long it takes to speak."""
+        audio = self._phrases.get(text)
+        if audio:
+            sample_rate = self._phrases.sample_rate
+            await self.push_frame(OutputAudioRawFrame(audio, sample_rate, 1))
+            return len(audio) / (sample_rate * 2)
+
+        await self.push_frame(TTSSpeakFrame(text))
+        return len(text.split()) / WORDS_PER_SEC
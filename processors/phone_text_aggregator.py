@@ -0,0 +1,132 @@
+import re
+import time
+
+from prometheus_client import Histogram
+
+from pipecat.frames.frames import (
+    EndFrame,
+    Frame,
+    InterimTranscriptionFrame,
+    LLMFullResponseEndFrame,
+    LLMFullResponseStartFrame,
+    StartInterruptionFrame,
+    TextFrame,
+    TranscriptionFrame,
+    TTSSpeakFrame,
+)
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+
+FIRST_CLAUSE_DELAY = Histogram(
+    "tts_first_clause_delay_seconds",
+    "Time from the start of an LLM response until its first clause was sent to TTS",
+    buckets=(0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0),
+)
+
+# A complete word: a run of non-space characters followed by whitespace.
+WORD_RE = re.compile(r"(\S+)\s+")
+
+# Tokens that may be part of a spelled registration or phone number, e.g.
+# "V", "E6", "0798", "V-E-6-8" or "0798-4334-455". We never cut right after
+# one of these, in case the next token continues the sequence.
+SPELLED_RE = re.compile(
+    r"^(?:[A-Za-z0-9]{1,2}|[A-Za-z0-9]*\d[A-Za-z0-9]*|[A-Za-z0-9]+(?:-[A-Za-z0-9]+)+)$"
+)
+
+CLAUSE_END = (",", ";", ":", ".", "!", "?", "—")
+SENTENCE_END = (".", "!", "?")
+
+
+def _is_spelled(word: str) -> bool:
+    return bool(SPELLED_RE.match(word.rstrip(",;:.!?—\"')")))
+
+
+class PhoneTextAggregator(FrameProcessor):
+    """Groups streamed LLM text into chunks for TTS, tuned for phone calls.
+
+    The first chunk of each response is released as soon as there's a
+    speakable clause: at the first clause punctuation after
+    `first_min_words` words, or after `first_max_words` words regardless.
+    Later text goes out in larger chunks, at sentence ends once at least
+    `chunk_min_words` words are buffered. A cut is never made right after a
+    token that looks like part of a spelled registration or phone number.
+
+    Chunks are pushed as TTSSpeakFrames, so the TTS service speaks them as-is
+    instead of re-aggregating them into sentences.
+    """
+
+    def __init__(
+        self,
+        *,
+        first_min_words: int = 2,
+        first_max_words: int = 8,
+        chunk_min_words: int = 12,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self._first_min_words = first_min_words
+        self._first_max_words = first_max_words
+        self._chunk_min_words = chunk_min_words
+        self._reset()
+
+    def _reset(self):
+        self._text = ""
+        self._first_released = False
+        self._response_start = None
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+
+        if (
+            direction == FrameDirection.DOWNSTREAM
+            and isinstance(frame, TextFrame)
+            and not isinstance(frame, (TranscriptionFrame, InterimTranscriptionFrame))
+        ):
+            self._text += frame.text
+            await self._release()
+        elif isinstance(frame, LLMFullResponseStartFrame):
+            self._reset()
+            self._response_start = time.monotonic()
+            await self.push_frame(frame, direction)
+        elif isinstance(frame, (LLMFullResponseEndFrame, EndFrame)):
+            await self._push_chunk(self._text)
+            self._reset()
+            await self.push_frame(frame, direction)
+        elif isinstance(frame, StartInterruptionFrame):
+            self._reset()
+            await self.push_frame(frame, direction)
+        else:
+            await self.push_frame(frame, direction)
+
+    async def _release(self):
+        cut = self._find_cut()
+        if cut:
+            chunk = self._text[:cut]
+            self._text = self._text[cut:]
+            await self._push_chunk(chunk)
+
+    def _find_cut(self) -> int:
+        words = 0
+        cut = 0
+        for match in WORD_RE.finditer(self._text):
+            word = match.group(1)
+            words += 1
+            if _is_spelled(word):
+                continue
+            if not self._first_released:
+                if words >= self._first_max_words or (
+                    words >= self._first_min_words and word.endswith(CLAUSE_END)
+                ):
+                    return match.end(1)
+            elif words >= self._chunk_min_words and word.endswith(SENTENCE_END):
+                cut = match.end(1)
+        return cut
+
+    async def _push_chunk(self, text: str):
+        text = text.strip()
+        if not text:
+            return
+        if not self._first_released:
+            self._first_released = True
+            if self._response_start:
+                FIRST_CLAUSE_DELAY.observe(time.monotonic() - self._response_start)
+        await self.push_frame(TTSSpeakFrame(text))
@@ -0,0 +1,243 @@
+import json
+import re
+from datetime import datetime, timedelta
+
+from loguru import logger
+from prometheus_client import Counter
+
+from pipecat.frames.frames import (
+    BotStoppedSpeakingFrame,
+    CancelFrame,
+    EndFrame,
+    Frame,
+    LLMFullResponseEndFrame,
+    LLMFullResponseStartFrame,
+    StartInterruptionFrame,
+    TextFrame,
+)
+from pipecat.processors.aggregators.openai_llm_context import OpenAILLMContextFrame
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+
+from functions.booking import TIMEZONE, parse_spoken_time
+
+DIALOG_TURNS = Counter(
+    "dialog_turns_total",
+    "Caller turns answered by the local confirmation script or by the LLM",
+    ["handler"],
+)
+DIALOG_HANDOFFS = Counter(
+    "dialog_handoffs_total",
+    "Times the confirmation script handed the conversation back to the LLM",
+    ["reason"],
+)
+
+# Words a caller uses to say yes, and words that may come with them without
+# changing the meaning ("yes that's right thanks"). A reply is only taken as
+# a yes if every word is in one of the two sets and at least one is a yes.
+AFFIRMATIVE_WORDS = {
+    "yes", "yeah", "yea", "yep", "yup", "aye", "correct", "right", "sure",
+    "absolutely", "exactly", "indeed", "perfect", "ok", "okay", "fine", "great",
+    "lovely", "brilliant", "definitely", "certainly", "affirmative", "uh-huh",
+}
+FILLER_WORDS = {
+    "that's", "thats", "that", "it's", "its", "it", "is", "was", "all", "thank",
+    "thanks", "you", "please", "cheers", "mate", "love", "oh", "um", "uh", "erm",
+    "so", "spot", "on", "the", "one", "same", "still", "good", "very", "much",
+    "that'll", "be", "do", "does", "sir", "madam",
+}
+NEGATIVE_WORDS = {"no", "nope", "nah", "not", "wrong", "incorrect", "isn't", "isnt", "wasn't"}
+
+# How the caller says what they're calling about, in answer to "Are you
+# dropping off a car or collecting one?".
+DROP_OFF = re.compile(r"\bdrop(ping|ped)?[ -]?off\b|\bdropping\b")
+COLLECTION = re.compile(r"\b(collect\w*|pick(ing)?[ -]?up|landed|luggage|return\w*)\b")
+# Drop-offs are only handled from this long before the booking time (the
+# prompt's call-back rule) until this long after it (running late).
+CALL_WINDOW_BEFORE = timedelta(hours=6)
+CALL_WINDOW_AFTER = timedelta(hours=2)
+
+NAME_LINE = "I've found your booking. The name we have is {customerName}. Is that correct?"
+DATE_LINE = "Your drop-off date is {bookingTime}. Is that correct?"
+TERMINAL_LINE = "You're booked for {terminal}. Is that correct?"
+PHONE_LINE = (
+    "Your contact phone number is {contactNumber}. Is that still the best number to reach you?"
+)
+# (booking field, line) in the order the system prompt confirms them.
+STEPS = (
+    ("customerName", NAME_LINE),
+    ("bookingTime", DATE_LINE),
+    ("terminal", TERMINAL_LINE),
+    ("contactNumber", PHONE_LINE),
+)
+# Values find_booking uses for a field it couldn't fill in.
+MISSING_VALUES = {"", "Not provided", "Date format error"}
+
+
+def classify_reply(text: str) -> str | None:
+    """Returns "yes" or "no" for a simple confirmation reply, otherwise None."""
+    words = re.findall(r"[a-z'\-]+", text.lower())
+    if not words:
+        return None
+    if any(word in NEGATIVE_WORDS for word in words):
+        return "no"
+    if all(word in AFFIRMATIVE_WORDS or word in FILLER_WORDS for word in words) and any(
+        word in AFFIRMATIVE_WORDS for word in words
+    ):
+        return "yes"
+    return None
+
+
+class ScriptedConfirmations(FrameProcessor):
+    """Runs the booking confirmation script locally instead of through the LLM.
+
+    Goes between the user context aggregator and the LLM. When a successful
+    `find_booking` result comes back, it asks the caller to confirm the name,
+    drop-off time, terminal and phone number one at a time, from templates,
+    and moves on after each plain "yes". Only drop-offs the caller has said
+    are drop-offs, due within the next 6 hours (or up to 2 hours late), are
+    scripted. Collections, and bookings the caller has to be told to call
+    back about, are left to the LLM. The lines are pushed as if the LLM
+    had said them, so they go through TTS and are added to the context as
+    assistant messages. Anything else (a "no", a question, a barge-in over a
+    question, a field the booking doesn't have) passes the context to the LLM,
+    which carries on from the full conversation, and the script stays off for
+    the rest of the call. The last "yes" also goes to the LLM, which moves on
+    to the next step.
+
+    Turns answered locally and by the LLM are counted either way, so with
+    `enabled=False` it reports the LLM-only baseline.
+    """
+
+    def __init__(self, *, enabled: bool = True, **kwargs):
+        super().__init__(**kwargs)
+        self._enabled = enabled
+        self._booking = None
+        self._step = 0
+        self._speaking = False
+        self._done = False
+        self._local_turns = 0
+        self._llm_turns = 0
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+
+        if isinstance(frame, OpenAILLMContextFrame):
+            if not await self._handle_context(frame):
+                self._llm_turns += 1
+                DIALOG_TURNS.labels(handler="llm").inc()
+                await self.push_frame(frame, direction)
+            return
+
+        if isinstance(frame, BotStoppedSpeakingFrame):
+            self._speaking = False
+        elif isinstance(frame, StartInterruptionFrame) and self._booking and self._speaking:
+            # The caller talked over a question, so a "yes" may not be an
+            # answer to it.
+            self._hand_off("barge_in")
+        elif isinstance(frame, (EndFrame, CancelFrame)):
+            logger.info(
+                f"Dialog turns: {self._local_turns} handled locally, {self._llm_turns} by the LLM"
+            )
+
+        await self.push_frame(frame, direction)
+
+    async def _handle_context(self, frame: OpenAILLMContextFrame) -> bool:
+        # Returns True if the turn was answered locally.
+        if not self._enabled or self._done:
+            return False
+
+        messages = frame.context.messages
+        if self._booking is None:
+            booking = _find_booking_result(messages)
+            if booking:
+                reason = _not_scriptable(booking, messages)
+                if reason:
+                    self._hand_off(reason)
+                    return False
+                self._booking = booking
+                self._step = 0
+                return await self._ask()
+            return False
+
+        last = messages[-1] if messages else {}
+        if last.get("role") != "user":
+            self._hand_off("unexpected_message")
+            return False
+        reply = classify_reply(last.get("content") or "")
+        if reply != "yes":
+            self._hand_off("negative" if reply == "no" else "unrecognised")
+            return False
+
+        self._step += 1
+        if self._step == len(STEPS):
+            self._hand_off("completed")
+            return False
+        return await self._ask()
+
+    async def _ask(self) -> bool:
+        field, line = STEPS[self._step]
+        value = str(self._booking.get(field, "")).strip()
+        if value in MISSING_VALUES:
+            self._hand_off("missing_field")
+            return False
+        if field == "terminal" and not value.lower().startswith("terminal"):
+            value = f"Terminal {value}"
+        elif field == "contactNumber":
+            value = "-".join(value.split())
+
+        text = line.format(**{field: value})
+        logger.debug(f"Scripted confirmation: {text}")
+        self._speaking = True
+        self._local_turns += 1
+        DIALOG_TURNS.labels(handler="local").inc()
+        await self.push_frame(LLMFullResponseStartFrame())
+        await self.push_frame(TextFrame(text))
+        await self.push_frame(LLMFullResponseEndFrame())
+        return True
+
+    def _hand_off(self, reason: str):
+        logger.debug(f"Scripted confirmations handing off to the LLM: {reason}")
+        DIALOG_HANDOFFS.labels(reason=reason).inc()
+        self._booking = None
+        self._done = True
+
+
+def _not_scriptable(booking: dict, messages: list) -> str | None:
+    # Why the confirmations for this booking are left to the LLM, if they are.
+    said = " ".join(
+        message.get("content") or ""
+        for message in messages
+        if message.get("role") == "user" and isinstance(message.get("content"), str)
+    ).lower()
+    if COLLECTION.search(said) or not DROP_OFF.search(said):
+        return "not_drop_off"
+    now = datetime.now(TIMEZONE)
+    booking_time = parse_spoken_time(str(booking.get("bookingTime", "")), now)
+    if not booking_time:
+        return "missing_field"
+    if not now - CALL_WINDOW_AFTER <= booking_time <= now + CALL_WINDOW_BEFORE:
+        return "out_of_window"
+    return None
+
+
+def _find_booking_result(messages: list) -> dict | None:
+    # The booking, if the newest message is a successful find_booking result.
+    if len(messages) < 2 or messages[-1].get("role") != "tool":
+        return None
+    tool_call_id = messages[-1].get("tool_call_id")
+    for tool_call in messages[-2].get("tool_calls") or []:
+        if tool_call.get("id") == tool_call_id:
+            if tool_call["function"]["name"] != "find_booking":
+                return None
+            break
+    else:
+        return None
+
+    try:
+        result = json.loads(messages[-1]["content"])
+        # The aggregator JSON-encodes the result string a second time.
+        if isinstance(result, str):
+            result = json.loads(result)
+    except (TypeError, ValueError):
+        return None
+    return result if isinstance(result, dict) and result.get("found") else None
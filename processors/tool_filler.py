@@ -0,0 +1,179 @@
+import asyncio
+import time
+
+import numpy as np
+from loguru import logger
+from prometheus_client import Counter, Histogram
+
+from pipecat.frames.frames import (
+    CancelFrame,
+    EndFrame,
+    Frame,
+    FunctionCallInProgressFrame,
+    FunctionCallResultFrame,
+    OutputAudioRawFrame,
+    StartFrame,
+    StartInterruptionFrame,
+    TTSStartedFrame,
+    TTSStoppedFrame,
+)
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+
+from services.phrase_cache import PhraseCache
+
+TOOL_LATENCY = Histogram(
+    "tool_call_latency_seconds",
+    "Time from a function call starting until its result was returned",
+    ["function"],
+    buckets=(0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 8.0, 15.0),
+)
+TOOL_FILLER_PLAYED = Counter(
+    "tool_filler_played_total",
+    "Filler clips played to mask a slow function call",
+    ["function"],
+)
+
+DEFAULT_FILLER_PHRASES = (
+    "Just a moment.",
+    "One moment, please.",
+    "Bear with me a second.",
+)
+
+# Filler audio is pushed in chunks of this length, in real time.
+CHUNK_SECS = 0.02
+# When a result arrives mid-clip, the clip is faded out over this long.
+FADE_SECS = 0.06
+
+
+class ToolLatencyFiller(FrameProcessor):
+    """Plays a short filler clip when a function call is slow to return.
+
+    Goes right after the TTS service. If a function call hasn't returned
+    within `threshold_secs`, and the bot isn't already speaking, one of
+    `phrases` is played from the phrase cache, and again every `repeat_secs`
+    while the call is still running. The clip is pushed in real time, so when
+    the result arrives it is cut at the next chunk and faded out rather than
+    played to the end.
+
+    Filler is pushed as plain OutputAudioRawFrames, not TTS audio, so it isn't
+    counted as the start of the bot's reply.
+    """
+
+    def __init__(
+        self,
+        phrases: PhraseCache,
+        *,
+        texts=DEFAULT_FILLER_PHRASES,
+        threshold_secs: float = 1.0,
+        repeat_secs: float = 5.0,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self._phrases = phrases
+        self._texts = texts
+        self._threshold_secs = threshold_secs
+        self._repeat_secs = repeat_secs
+
+        # tool_call_id -> (function_name, start time)
+        self._calls: dict[str, tuple[str, float]] = {}
+        self._bot_speaking = False
+        self._next_text = 0
+        self._filler_task = None
+        self._playing = False
+        self._fade_out = False
+
+        # Per-call totals.
+        self.tool_calls = 0
+        self.fillers_played = 0
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+
+        if isinstance(frame, StartFrame):
+            self.get_event_loop().create_task(self._phrases.preload(self._texts))
+        elif isinstance(frame, FunctionCallInProgressFrame):
+            self._calls[frame.tool_call_id] = (frame.function_name, time.monotonic())
+            self.tool_calls += 1
+            if not self._filler_task:
+                self._filler_task = self.get_event_loop().create_task(self._filler_task_handler())
+        elif isinstance(frame, FunctionCallResultFrame):
+            call = self._calls.pop(frame.tool_call_id, None)
+            if call:
+                TOOL_LATENCY.labels(function=call[0]).observe(time.monotonic() - call[1])
+            if not self._calls:
+                await self._stop_filler()
+        elif isinstance(frame, TTSStartedFrame):
+            self._bot_speaking = True
+            await self._stop_filler()
+        elif isinstance(frame, TTSStoppedFrame):
+            self._bot_speaking = False
+        elif isinstance(frame, (StartInterruptionFrame, EndFrame, CancelFrame)):
+            self._bot_speaking = False
+            self._calls.clear()
+            await self._stop_filler(fade=False)
+
+        await self.push_frame(frame, direction)
+
+    async def cleanup(self):
+        await self._stop_filler(fade=False)
+        if self.tool_calls:
+            logger.info(f"Tools: {self.tool_calls} calls, {self.fillers_played} fillers played")
+
+    async def _stop_filler(self, fade: bool = True):
+        if not self._filler_task:
+            return
+        task = self._filler_task
+        self._filler_task = None
+        if fade and self._playing:
+            # Let the clip finish its fade-out instead of cutting it dead.
+            self._fade_out = True
+        else:
+            task.cancel()
+        await task
+
+    async def _filler_task_handler(self):
+        self._fade_out = False
+        try:
+            await asyncio.sleep(self._threshold_secs)
+            while self._calls:
+                if not self._bot_speaking:
+                    self._playing = True
+                    await self._play_filler()
+                    self._playing = False
+                    if self._fade_out:
+                        break
+                await asyncio.sleep(self._repeat_secs)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self._playing = False
+
+    async def _play_filler(self):
+        text = self._texts[self._next_text % len(self._texts)]
+        self._next_text += 1
+        audio = self._phrases.get(text)
+        if not audio:
+            logger.warning(f"Filler phrase '{text}' isn't rendered yet, skipping")
+            return
+
+        function_name = next(iter(self._calls.values()))[0]
+        TOOL_FILLER_PLAYED.labels(function=function_name).inc()
+        self.fillers_played += 1
+        logger.debug(f"Playing filler '{text}' while {function_name} runs")
+
+        sample_rate = self._phrases.sample_rate
+        chunk_size = int(sample_rate * CHUNK_SECS) * 2
+        for i in range(0, len(audio), chunk_size):
+            if self._fade_out:
+                await self._push_fade(audio[i : i + int(sample_rate * FADE_SECS) * 2], sample_rate)
+                break
+            await self.push_frame(OutputAudioRawFrame(audio[i : i + chunk_size], sample_rate, 1))
+            await asyncio.sleep(CHUNK_SECS)
+
+    async def _push_fade(self, audio: bytes, sample_rate: int):
+        if not audio:
+            return
+        samples = np.frombuffer(audio, dtype=np.int16)
+        ramp = np.linspace(1.0, 0.0, samples.size, dtype=np.float32)
+        faded = (samples * ramp).astype(np.int16).tobytes()
+        await self.push_frame(OutputAudioRawFrame(faded, sample_rate, 1))
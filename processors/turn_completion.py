@@ -0,0 +1,211 @@
+import asyncio
+import re
+import time
+
+from loguru import logger
+from prometheus_client import Counter, Histogram
+
+from pipecat.frames.frames import (
+    CancelFrame,
+    EndFrame,
+    Frame,
+    TranscriptionFrame,
+    UserStartedSpeakingFrame,
+    UserStoppedSpeakingFrame,
+)
+from pipecat.processors.aggregators.openai_llm_context import OpenAILLMContext
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+
+TURN_HOLDS = Counter(
+    "turn_holds_total",
+    "Caller turns held open because the input looked unfinished, by what ended the hold",
+    ["reason", "outcome"],
+)
+TURN_HOLD_SECONDS = Histogram(
+    "turn_hold_seconds",
+    "Extra time a caller turn was held open before it was released or resumed",
+    buckets=(0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 4.0),
+)
+
+# Current-style UK registrations are two letters, two digits, three letters
+# (e.g. VE68VEP). Something that is a strict prefix of that is unfinished.
+PARTIAL_REGISTRATION_RE = re.compile(r"[A-Z]{1,2}|[A-Z]{2}\d{1,2}|[A-Z]{2}\d{2}[A-Z]{1,2}")
+# UK numbers are 11 digits starting with 0, or 12 starting with 44.
+PHONE_DIGITS = {"0": 11, "4": 12}
+
+DIGIT_WORDS = {
+    "zero": "0", "oh": "0", "o": "0", "one": "1", "two": "2", "three": "3", "four": "4",
+    "five": "5", "six": "6", "seven": "7", "eight": "8", "nine": "9",
+}
+NATO_WORDS = {
+    "alpha": "A", "alfa": "A", "bravo": "B", "charlie": "C", "delta": "D", "echo": "E",
+    "foxtrot": "F", "golf": "G", "hotel": "H", "india": "I", "juliet": "J", "kilo": "K",
+    "lima": "L", "mike": "M", "november": "N", "oscar": "O", "papa": "P", "quebec": "Q",
+    "romeo": "R", "sierra": "S", "tango": "T", "uniform": "U", "victor": "V",
+    "whiskey": "W", "whisky": "W", "xray": "X", "x-ray": "X", "yankee": "Y", "zulu": "Z",
+}
+REPEAT_WORDS = {"double": 2, "triple": 3}
+# A turn ending on one of these has usually been cut off mid-sentence.
+DANGLING_WORDS = {"and", "um", "uh", "erm", "er", "the", "it's", "its", "is", "so", "a", "my"}
+
+
+def _registration_chars(words: list) -> str:
+    # The spelled characters at the end of the turn: single letters, short
+    # alphanumeric chunks, digit words and NATO alphabet words.
+    chars = []
+    for word in reversed(words):
+        if word in NATO_WORDS:
+            chars.append(NATO_WORDS[word])
+        elif word in DIGIT_WORDS and word not in ("o", "oh"):
+            chars.append(DIGIT_WORDS[word])
+        elif word.isalnum() and (len(word) == 1 or (len(word) <= 4 and not word.isalpha())):
+            chars.append(word.upper())
+        else:
+            break
+    return "".join(reversed(chars))
+
+
+def _phone_digits(words: list) -> str:
+    digits = []
+    repeat = 1
+    for word in words:
+        if word in REPEAT_WORDS:
+            repeat = REPEAT_WORDS[word]
+            continue
+        if word.isdigit():
+            digits.append(word if repeat == 1 else word * repeat)
+        elif word in DIGIT_WORDS:
+            digits.append(DIGIT_WORDS[word] * repeat)
+        repeat = 1
+    return "".join(digits)
+
+
+class TurnCompletionDetector(FrameProcessor):
+    """Holds the end of a caller turn open while the input is clearly unfinished.
+
+    Goes right before the user context aggregator. When VAD reports the
+    caller stopped speaking, the turn's transcript is checked against what
+    the bot last asked for:
+
+    - a registration: the spelled characters so far are a strict prefix of a
+      UK registration (e.g. "V E 6 8"),
+    - a phone number: some digits, but fewer than a UK number has,
+    - anything: the turn ends on a dangling word like "and" or "um".
+
+    If so, the UserStoppedSpeakingFrame is held back for `hold_secs` (or
+    `dangling_hold_secs`), so no LLM request is made on the partial input.
+    If the caller carries on within that time, the held frame and the new
+    UserStartedSpeakingFrame are both dropped, and the aggregator keeps
+    collecting one turn. Once the input looks complete, or the hold runs
+    out, the frame is released. Holds are capped at `max_hold_secs` per turn.
+    Everything else, including a plain "yes", is passed straight through.
+    """
+
+    def __init__(
+        self,
+        context: OpenAILLMContext,
+        *,
+        hold_secs: float = 1.5,
+        dangling_hold_secs: float = 0.8,
+        max_hold_secs: float = 4.0,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self._context = context
+        self._hold_secs = hold_secs
+        self._dangling_hold_secs = dangling_hold_secs
+        self._max_hold_secs = max_hold_secs
+        self._transcript = []
+        self._held = None
+        self._held_reason = None
+        self._held_at = 0.0
+        self._held_total = 0.0
+        self._release_task = None
+        self.resumed_turns = 0
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+
+        if isinstance(frame, UserStartedSpeakingFrame):
+            if self._held:
+                # The caller carried on: keep aggregating the same turn.
+                self._end_hold("resumed")
+                self.resumed_turns += 1
+                return
+            self._transcript = []
+            self._held_total = 0.0
+        elif isinstance(frame, TranscriptionFrame):
+            self._transcript.append(frame.text)
+            if self._held and not self._unfinished():
+                await self.push_frame(frame, direction)
+                await self._release("completed")
+                return
+        elif isinstance(frame, UserStoppedSpeakingFrame):
+            reason = self._unfinished()
+            remaining = self._max_hold_secs - self._held_total
+            if reason and remaining > 0:
+                hold = self._hold_secs if reason != "dangling" else self._dangling_hold_secs
+                self._hold(frame, reason, min(hold, remaining))
+                return
+        elif isinstance(frame, (EndFrame, CancelFrame)):
+            self._cancel_release()
+            if self.resumed_turns:
+                logger.info(f"Turn completion: {self.resumed_turns} turns held open and resumed")
+
+        await self.push_frame(frame, direction)
+
+    def _unfinished(self) -> str | None:
+        # Why the turn looks unfinished, or None if it looks complete.
+        text = " ".join(self._transcript).lower()
+        words = re.findall(r"[a-z0-9'\-]+", text)
+        if not words:
+            return None
+
+        prompt = self._last_prompt()
+        if "registration" in prompt and "?" in prompt:
+            chars = _registration_chars(words)
+            if chars and PARTIAL_REGISTRATION_RE.fullmatch(chars):
+                return "registration"
+        elif "number" in prompt and "?" in prompt:
+            digits = _phone_digits(words)
+            if digits and len(digits) < PHONE_DIGITS.get(digits[0], 11):
+                return "phone"
+        if words[-1] in DANGLING_WORDS:
+            return "dangling"
+        return None
+
+    def _last_prompt(self) -> str:
+        for message in reversed(self._context.messages):
+            if message.get("role") == "assistant" and isinstance(message.get("content"), str):
+                return message["content"].lower()
+        return ""
+
+    def _hold(self, frame: UserStoppedSpeakingFrame, reason: str, secs: float):
+        logger.debug(f"Holding turn open for {secs:.1f}s ({reason}): {' '.join(self._transcript)}")
+        self._held = frame
+        self._held_reason = reason
+        self._held_at = time.monotonic()
+        self._release_task = self.get_event_loop().create_task(self._release_after(secs))
+
+    async def _release_after(self, secs: float):
+        await asyncio.sleep(secs)
+        self._release_task = None
+        await self._release("expired")
+
+    async def _release(self, outcome: str):
+        frame = self._held
+        self._end_hold(outcome)
+        await self.push_frame(frame)
+
+    def _end_hold(self, outcome: str):
+        held_for = time.monotonic() - self._held_at
+        self._held_total += held_for
+        TURN_HOLDS.labels(reason=self._held_reason, outcome=outcome).inc()
+        TURN_HOLD_SECONDS.observe(held_for)
+        self._held = None
+        self._cancel_release()
+
+    def _cancel_release(self):
+        if self._release_task:
+            self._release_task.cancel()
+            self._release_task = None
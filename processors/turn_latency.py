@@ -0,0 +1,99 @@
+import time
+
+from loguru import logger
+from prometheus_client import Counter, Histogram
+
+from pipecat.frames.frames import (
+    CancelFrame,
+    EndFrame,
+    Frame,
+    LLMFullResponseEndFrame,
+    LLMFullResponseStartFrame,
+    StartInterruptionFrame,
+    TTSAudioRawFrame,
+    TTSStartedFrame,
+    UserStoppedSpeakingFrame,
+)
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+
+TIME_TO_FIRST_AUDIO = Histogram(
+    "time_to_first_audio_seconds",
+    "Time from the caller finishing a turn until the first bot audio for the reply",
+    buckets=(0.25, 0.5, 0.75, 1.0, 1.25, 1.5, 2.0, 2.5, 3.0, 4.0, 6.0),
+)
+LLM_REQUESTS_ABANDONED = Counter(
+    "llm_requests_abandoned_total",
+    "LLM responses the caller talked over before any of their audio was produced: "
+    "cancelled while still streaming, or wasted after they finished",
+    ["outcome"],
+)
+
+
+class TimeToFirstAudioObserver(FrameProcessor):
+    """Measures time-to-first-audio for every caller turn.
+
+    Goes right after the TTS service. A turn starts when the caller stops
+    speaking and ends at the first TTS audio frame that follows. If the
+    caller barges in before any audio arrives the turn is discarded.
+
+    It also counts LLM responses thrown away that way, usually because the
+    turn was ended on a pause and the caller carried on: `cancelled` if the
+    response was still streaming, `wasted` if it had finished and was
+    waiting on TTS. Responses that are only a function call aren't counted.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._turn_start = None
+        self._response_started = False
+        self._response_streaming = False
+        self._response_spoken = False
+        self._response_audio = False
+        self.turns = 0
+        self.cancelled_requests = 0
+        self.wasted_requests = 0
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+
+        if isinstance(frame, UserStoppedSpeakingFrame):
+            self._turn_start = time.monotonic()
+        elif isinstance(frame, LLMFullResponseStartFrame):
+            self._response_started = True
+            self._response_streaming = True
+            self._response_spoken = False
+            self._response_audio = False
+        elif isinstance(frame, TTSStartedFrame) and self._response_started:
+            self._response_spoken = True
+        elif isinstance(frame, LLMFullResponseEndFrame):
+            self._response_streaming = False
+        elif isinstance(frame, StartInterruptionFrame):
+            self._turn_start = None
+            self._count_abandoned()
+        elif isinstance(frame, TTSAudioRawFrame):
+            self._response_audio = True
+            if self._turn_start:
+                elapsed = time.monotonic() - self._turn_start
+                self._turn_start = None
+                self.turns += 1
+                TIME_TO_FIRST_AUDIO.observe(elapsed)
+                logger.debug(f"Time to first audio: {elapsed:.3f}s (turn {self.turns})")
+        elif isinstance(frame, (EndFrame, CancelFrame)):
+            logger.info(
+                f"LLM requests abandoned: {self.cancelled_requests} cancelled, "
+                f"{self.wasted_requests} wasted, over {self.turns} turns"
+            )
+
+        await self.push_frame(frame, direction)
+
+    def _count_abandoned(self):
+        if not self._response_audio:
+            if self._response_streaming:
+                self.cancelled_requests += 1
+                LLM_REQUESTS_ABANDONED.labels(outcome="cancelled").inc()
+            elif self._response_spoken:
+                self.wasted_requests += 1
+                LLM_REQUESTS_ABANDONED.labels(outcome="wasted").inc()
+        self._response_started = False
+        self._response_streaming = False
+        self._response_spoken = False
@@ -0,0 +1,314 @@
+import asyncio
+import json
+import time
+from collections import deque
+
+from loguru import logger
+from prometheus_client import Counter, Histogram
+from starlette.websockets import WebSocketState
+
+from pipecat.frames.frames import (
+    CancelFrame,
+    EndFrame,
+    Frame,
+    OutputAudioRawFrame,
+    StartInterruptionFrame,
+    SystemFrame,
+    TTSStoppedFrame,
+)
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+
+from serializers import FastTwilioFrameSerializer
+
+BARGE_IN_TO_SILENCE = Histogram(
+    "barge_in_to_silence_seconds",
+    "Time from a confirmed interruption until Twilio acknowledged its audio buffer was empty",
+    buckets=(0.05, 0.1, 0.15, 0.2, 0.3, 0.5, 0.75, 1.0, 2.0),
+)
+BARGE_IN_UNPLAYED = Histogram(
+    "barge_in_unplayed_audio_seconds",
+    "Bot audio already sent to Twilio but not yet played when the caller barged in",
+    buckets=(0.05, 0.1, 0.2, 0.3, 0.5, 1.0, 2.0, 5.0),
+)
+TTS_WASTED_BYTES = Counter(
+    "tts_wasted_bytes_total",
+    "TTS audio bytes generated but never played because of an interruption",
+    ["stage"],
+)
+
+# Audio is released to the transport in chunks of this length.
+CHUNK_SECS = 0.02
+
+
+def _duration(frame: OutputAudioRawFrame) -> float:
+    return len(frame.audio) / (frame.sample_rate * frame.num_channels * 2)
+
+
+class TwilioPlayoutTracker:
+    """Paces bot audio to Twilio and tracks what the caller has actually heard.
+
+    `pacer()` goes right before `transport.output()` and releases audio in
+    20 ms chunks, keeping at most `lookahead_secs` buffered at Twilio so an
+    interruption has little to flush. `marker()` goes right after
+    `transport.output()` and sends a Twilio `mark` every `mark_interval_secs`
+    of written audio. Twilio echoes a mark once the audio before it has been
+    played, which tells us the real playback position.
+
+    On an interruption with audio still unplayed, the tracker sends the only
+    `clear` (the serializer doesn't) followed by a probe mark. The
+    probe is echoed once Twilio's buffer is empty, which gives the
+    barge-in-to-silence latency (including one network round trip).
+    """
+
+    def __init__(
+        self,
+        websocket,
+        stream_sid: str,
+        serializer: FastTwilioFrameSerializer,
+        *,
+        lookahead_secs: float = 0.2,
+        mark_interval_secs: float = 0.1,
+    ):
+        self._websocket = websocket
+        self._stream_sid = stream_sid
+        self._lookahead_secs = lookahead_secs
+        self._mark_interval_secs = mark_interval_secs
+
+        serializer.set_mark_handler(self._handle_mark)
+
+        # Audio released by the pacer and audio written to the websocket.
+        self._sent_bytes = 0
+        self._sent_secs = 0.0
+        self._written_bytes = 0
+        self._written_secs = 0.0
+        self._unmarked_secs = 0.0
+        # Playback position confirmed by Twilio marks.
+        self._played_bytes = 0
+        self._played_secs = 0.0
+        # Monotonic time at which Twilio should run out of buffered audio.
+        self._play_until = 0.0
+
+        self._mark_seq = 0
+        self._pending_marks: deque = deque()
+        self._probe_mark = None
+        self._barge_in_time = None
+
+        # Per-call totals, logged at the end of the call.
+        self.barge_ins = 0
+        self.wasted_bytes = 0
+
+        self._pacer = TwilioAudioPacer(self)
+        self._marker = TwilioMarkSender(self)
+
+    def pacer(self) -> "TwilioAudioPacer":
+        return self._pacer
+
+    def marker(self) -> "TwilioMarkSender":
+        return self._marker
+
+    @property
+    def connected(self) -> bool:
+        return self._websocket.client_state == WebSocketState.CONNECTED
+
+    def buffered_secs(self) -> float:
+        """Estimated audio queued at Twilio that has not been played yet."""
+        return max(0.0, self._play_until - time.monotonic())
+
+    def release_delay(self) -> float:
+        return self.buffered_secs() - self._lookahead_secs
+
+    def audio_sent(self, frame: OutputAudioRawFrame):
+        duration = _duration(frame)
+        self._sent_bytes += len(frame.audio)
+        self._sent_secs += duration
+        self._play_until = max(self._play_until, time.monotonic()) + duration
+
+    async def audio_written(self, frame: OutputAudioRawFrame):
+        duration = _duration(frame)
+        self._written_bytes += len(frame.audio)
+        self._written_secs += duration
+        self._unmarked_secs += duration
+        if self._unmarked_secs >= self._mark_interval_secs:
+            await self.send_mark()
+
+    async def send_mark(self):
+        if not self._unmarked_secs:
+            return
+        self._unmarked_secs = 0.0
+        name = await self._send_mark()
+        if name:
+            self._pending_marks.append((name, self._written_bytes, self._written_secs))
+
+    async def interrupted(self, dropped_bytes: int):
+        unplayed_bytes = self._sent_bytes - self._played_bytes
+        unplayed_secs = max(self._sent_secs - self._played_secs, self.buffered_secs())
+
+        # Everything sent so far is either played or flushed by the clear.
+        self._played_bytes = self._sent_bytes = self._written_bytes
+        self._played_secs = self._sent_secs = self._written_secs
+        self._unmarked_secs = 0.0
+        self._play_until = 0.0
+        self._pending_marks.clear()
+
+        if not dropped_bytes and not unplayed_bytes:
+            return
+
+        self.barge_ins += 1
+        self.wasted_bytes += dropped_bytes + unplayed_bytes
+        TTS_WASTED_BYTES.labels(stage="pacer").inc(dropped_bytes)
+        TTS_WASTED_BYTES.labels(stage="twilio").inc(unplayed_bytes)
+        BARGE_IN_UNPLAYED.observe(unplayed_secs)
+
+        if unplayed_bytes:
+            self._barge_in_time = time.monotonic()
+            await self._send({"event": "clear", "streamSid": self._stream_sid})
+            self._probe_mark = await self._send_mark()
+        else:
+            BARGE_IN_TO_SILENCE.observe(0.0)
+
+    def log_summary(self):
+        logger.info(
+            f"Playout: {self._written_secs:.1f}s written, {self.barge_ins} barge-ins, "
+            f"{self.wasted_bytes} TTS bytes wasted"
+        )
+
+    def _handle_mark(self, name: str):
+        if name == self._probe_mark:
+            BARGE_IN_TO_SILENCE.observe(time.monotonic() - self._barge_in_time)
+            self._probe_mark = None
+            return
+
+        while self._pending_marks:
+            mark_name, written_bytes, written_secs = self._pending_marks.popleft()
+            if mark_name == name:
+                self._played_bytes = written_bytes
+                self._played_secs = written_secs
+                # If Twilio is behind our estimate, push the estimate out.
+                remaining = self._sent_secs - written_secs
+                self._play_until = max(self._play_until, time.monotonic() + remaining)
+                return
+
+    async def _send_mark(self) -> str | None:
+        self._mark_seq += 1
+        name = str(self._mark_seq)
+        sent = await self._send(
+            {"event": "mark", "streamSid": self._stream_sid, "mark": {"name": name}}
+        )
+        return name if sent else None
+
+    async def _send(self, message: dict) -> bool:
+        if not self.connected:
+            return False
+        await self._websocket.send_text(json.dumps(message))
+        return True
+
+
+class TwilioAudioPacer(FrameProcessor):
+    """Releases bot audio to the output transport in near real time.
+
+    Non-system frames are queued behind the audio so things like
+    TTSStoppedFrame still reach the transport in order. On an interruption all
+    queued frames (except an EndFrame) are dropped.
+    """
+
+    def __init__(self, tracker: TwilioPlayoutTracker, **kwargs):
+        super().__init__(**kwargs)
+        self._tracker = tracker
+        self._queued_bytes = 0
+        self._create_pace_task()
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+
+        if direction == FrameDirection.UPSTREAM:
+            await self.push_frame(frame, direction)
+        elif isinstance(frame, StartInterruptionFrame):
+            await self._handle_interruption()
+            await self.push_frame(frame, direction)
+        elif isinstance(frame, CancelFrame):
+            await self._cancel_pace_task()
+            await self.push_frame(frame, direction)
+        elif isinstance(frame, SystemFrame):
+            await self.push_frame(frame, direction)
+        elif isinstance(frame, OutputAudioRawFrame):
+            await self._queue_audio(frame)
+        else:
+            await self._pace_queue.put(frame)
+
+    async def cleanup(self):
+        await self._cancel_pace_task()
+        self._tracker.log_summary()
+
+    async def _queue_audio(self, frame: OutputAudioRawFrame):
+        chunk_size = int(frame.sample_rate * CHUNK_SECS) * frame.num_channels * 2
+        audio = frame.audio
+        for i in range(0, len(audio), chunk_size):
+            chunk = frame.__class__(
+                audio=audio[i : i + chunk_size],
+                sample_rate=frame.sample_rate,
+                num_channels=frame.num_channels,
+            )
+            self._queued_bytes += len(chunk.audio)
+            await self._pace_queue.put(chunk)
+
+    async def _handle_interruption(self):
+        await self._cancel_pace_task()
+
+        pending = []
+        while not self._pace_queue.empty():
+            frame = self._pace_queue.get_nowait()
+            if isinstance(frame, EndFrame):
+                pending.append(frame)
+
+        dropped_bytes = self._queued_bytes
+        self._queued_bytes = 0
+        await self._tracker.interrupted(dropped_bytes)
+
+        self._create_pace_task()
+        for frame in pending:
+            await self._pace_queue.put(frame)
+
+    def _create_pace_task(self):
+        self._pace_queue = asyncio.Queue()
+        self._pace_task = self.get_event_loop().create_task(self._pace_task_handler())
+
+    async def _cancel_pace_task(self):
+        if self._pace_task:
+            self._pace_task.cancel()
+            await self._pace_task
+            self._pace_task = None
+
+    async def _pace_task_handler(self):
+        running = True
+        while running:
+            try:
+                frame = await self._pace_queue.get()
+                if isinstance(frame, OutputAudioRawFrame):
+                    delay = self._tracker.release_delay()
+                    if delay > 0 and self._tracker.connected:
+                        await asyncio.sleep(delay)
+                    self._queued_bytes -= len(frame.audio)
+                    self._tracker.audio_sent(frame)
+                await self.push_frame(frame)
+                running = not isinstance(frame, EndFrame)
+                self._pace_queue.task_done()
+            except asyncio.CancelledError:
+                break
+
+
+class TwilioMarkSender(FrameProcessor):
+    """Sends Twilio marks for audio the output transport has written."""
+
+    def __init__(self, tracker: TwilioPlayoutTracker, **kwargs):
+        super().__init__(**kwargs)
+        self._tracker = tracker
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+
+        if isinstance(frame, OutputAudioRawFrame):
+            await self._tracker.audio_written(frame)
+        elif isinstance(frame, TTSStoppedFrame):
+            await self._tracker.send_mark()
+
+        await self.push_frame(frame, direction)
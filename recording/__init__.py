@@ -0,0 +1,12 @@
+from .audio import AudioTap, CallAudioRecorder
+from .log import RecordingWriter, read_recording
+from .recorder import CallRecorder, RecorderTap
+
+__all__ = [
+    "AudioTap",
+    "CallAudioRecorder",
+    "CallRecorder",
+    "RecorderTap",
+    "RecordingWriter",
+    "read_recording",
+]
@@ -0,0 +1,214 @@
+import os
+import queue
+import struct
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+from loguru import logger
+from prometheus_client import Counter
+
+from pipecat.frames.frames import Frame, InputAudioRawFrame, OutputAudioRawFrame
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+
+from serializers import FastTwilioFrameSerializer
+from serializers.twilio import PCM_TO_ULAW, ULAW_TO_PCM
+
+CALL_AUDIO_FRAMES_DROPPED = Counter(
+    "call_audio_frames_dropped_total",
+    "Call audio frames left out of recordings because the writer fell behind",
+    ["channel"],
+)
+
+CHANNELS = ("caller", "bot")
+SAMPLE_RATE = 8000
+ULAW_SILENCE = 0xFF
+WAVE_FORMAT_MULAW = 7
+# Audio is written this far behind real time, so a frame that arrives a little
+# late still lands in its place on the timeline.
+WRITE_LAG_SECS = 1.0
+# A frame arriving less than this after the end of the audio before it on its
+# channel follows on directly; a longer gap is kept as silence.
+GAP_SAMPLES = SAMPLE_RATE // 10
+WRITER_INTERVAL_SECS = 0.25
+
+
+class CallAudioRecorder:
+    """Records a call's audio, as the caller said and heard it, to a WAV file.
+
+    Opt-in: only enabled when CALL_AUDIO_DIR is set. `tap("caller")` goes
+    right after `transport.input()` and `tap("bot")` right before
+    `transport.output()`, after the pacer, so bot audio is recorded as it was
+    released to Twilio. The taps only put frames on a bounded queue; a
+    background thread converts them to 8 kHz μ-law, lines the two channels up
+    on the call's timeline and appends them to the file. If the disk can't
+    keep up, frames are dropped and counted rather than holding up the call.
+
+    The file is a μ-law WAV (8 KB a second per channel), stereo with the
+    caller on the left and the bot on the right, or both mixed to mono with
+    `stereo=False`. Its header sizes are filled in when the call ends.
+    """
+
+    def __init__(self, path: str | None, *, stereo: bool = True, maxsize: int = 500):
+        self.path = path
+        self.dropped = 0
+        self._stereo = stereo
+        self._queue = queue.Queue(maxsize) if path else None
+        self._start = time.monotonic()
+        self._closed = threading.Event()
+        self._thread = None
+        if path:
+            self._thread = threading.Thread(target=self._run, name="call-audio", daemon=True)
+            self._thread.start()
+
+    @classmethod
+    def from_env(cls, stream_sid: str) -> "CallAudioRecorder":
+        directory = os.getenv("CALL_AUDIO_DIR")
+        path = None
+        if directory:
+            stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+            path = os.path.join(directory, f"{stamp}-{stream_sid}.wav")
+        return cls(path, stereo=os.getenv("CALL_AUDIO_CHANNELS", "2") != "1")
+
+    @property
+    def enabled(self) -> bool:
+        return self._queue is not None
+
+    def tap(self, channel: str) -> "AudioTap | None":
+        if channel not in CHANNELS:
+            raise ValueError(f"Unknown audio channel {channel}")
+        return AudioTap(self, channel) if self._queue else None
+
+    def add(self, channel: str, audio: bytes, sample_rate: int):
+        try:
+            self._queue.put_nowait((channel, time.monotonic(), audio, sample_rate))
+        except queue.Full:
+            self.dropped += 1
+            CALL_AUDIO_FRAMES_DROPPED.labels(channel=channel).inc()
+
+    def close(self):
+        """Stops recording. The writer thread writes out what's left and
+        finishes the file on its own, so this never waits on the disk."""
+        if self._thread:
+            self._closed.set()
+
+    def join(self):
+        if self._thread:
+            self._thread.join()
+
+    def _run(self):
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            f = open(self.path, "wb")
+        except OSError as error:
+            logger.error(f"Error opening call audio {self.path}: {str(error)}")
+            return
+        channels = 2 if self._stereo else 1
+        f.write(_wav_header(channels, 0))
+        timeline = _Timeline(self._start)
+        written = 0
+        while True:
+            closing = self._closed.is_set()
+            while True:
+                try:
+                    timeline.add(*self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            until = None if closing else time.monotonic() - self._start - WRITE_LAG_SECS
+            caller, bot = timeline.take(until)
+            if len(caller):
+                f.write(self._frames(caller, bot))
+                f.flush()
+                written += len(caller)
+            if closing:
+                break
+            time.sleep(WRITER_INTERVAL_SECS)
+        f.seek(0)
+        f.write(_wav_header(channels, written))
+        f.close()
+        if self.dropped:
+            logger.warning(f"Call audio {self.path} dropped {self.dropped} frames")
+
+    def _frames(self, caller: np.ndarray, bot: np.ndarray) -> bytes:
+        if self._stereo:
+            out = np.empty(2 * len(caller), dtype=np.uint8)
+            out[0::2] = caller
+            out[1::2] = bot
+            return out.tobytes()
+        mixed = ULAW_TO_PCM[caller].astype(np.int32) + ULAW_TO_PCM[bot]
+        mixed = np.clip(mixed, -32768, 32767).astype(np.int16)
+        return PCM_TO_ULAW[mixed.view(np.uint16)].tobytes()
+
+
+class _Timeline:
+    # Each channel's μ-law audio not yet written, starting at the same sample.
+
+    def __init__(self, start: float):
+        self._start = start
+        self._base = 0
+        self._pending = {channel: bytearray() for channel in CHANNELS}
+        # Each channel has its own encoder, which carries state between frames.
+        self._encoders = {channel: FastTwilioFrameSerializer("") for channel in CHANNELS}
+
+    def add(self, channel: str, arrived: float, audio: bytes, sample_rate: int):
+        ulaw = self._encoders[channel].encode_audio(audio, sample_rate)
+        pending = self._pending[channel]
+        # The frame's audio ends when it arrived.
+        starts_at = round((arrived - self._start) * SAMPLE_RATE) - len(ulaw) - self._base
+        gap = starts_at - len(pending)
+        if gap > GAP_SAMPLES:
+            pending.extend(bytes([ULAW_SILENCE]) * gap)
+        pending.extend(ulaw)
+
+    def take(self, until: float | None) -> tuple[np.ndarray, np.ndarray]:
+        """Both channels up to `until` seconds into the call (everything if
+        None), padded with silence to the same length."""
+        if until is None:
+            end = max(len(pending) for pending in self._pending.values())
+        else:
+            end = max(0, round(until * SAMPLE_RATE) - self._base)
+        out = []
+        for channel in CHANNELS:
+            pending = self._pending[channel]
+            if len(pending) < end:
+                pending.extend(bytes([ULAW_SILENCE]) * (end - len(pending)))
+            out.append(np.frombuffer(bytes(pending[:end]), dtype=np.uint8))
+            del pending[:end]
+        self._base += end
+        return out[0], out[1]
+
+
+def _wav_header(channels: int, frames: int) -> bytes:
+    data_size = frames * channels
+    fmt = struct.pack(
+        "<HHIIHHH", WAVE_FORMAT_MULAW, channels, SAMPLE_RATE, SAMPLE_RATE * channels, channels, 8, 0
+    )
+    return (
+        b"RIFF"
+        + struct.pack("<I", 4 + (8 + len(fmt)) + (8 + 4) + (8 + data_size))
+        + b"WAVE"
+        + b"fmt "
+        + struct.pack("<I", len(fmt))
+        + fmt
+        + b"fact"
+        + struct.pack("<II", 4, frames)
+        + b"data"
+        + struct.pack("<I", data_size)
+    )
+
+
+class AudioTap(FrameProcessor):
+    """Pass-through processor that hands one side's audio to a CallAudioRecorder."""
+
+    def __init__(self, recorder: CallAudioRecorder, channel: str, **kwargs):
+        super().__init__(**kwargs)
+        self._recorder = recorder
+        self._channel = channel
+        self._frame_type = InputAudioRawFrame if channel == "caller" else OutputAudioRawFrame
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+        if direction == FrameDirection.DOWNSTREAM and isinstance(frame, self._frame_type):
+            self._recorder.add(self._channel, frame.audio, frame.sample_rate)
+        await self.push_frame(frame, direction)
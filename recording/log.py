@@ -0,0 +1,116 @@
+import os
+import queue
+import struct
+import threading
+import time
+
+import orjson
+from loguru import logger
+from prometheus_client import Counter
+
+RECORDING_EVENTS_DROPPED = Counter(
+    "recording_events_dropped_total",
+    "Call recording events dropped because the writer fell behind",
+)
+
+# File layout: MAGIC, then records of HEADER (kind, seconds since the start of
+# the call, payload length) followed by the payload. AUDIO payloads are raw
+# 8 kHz μ-law, EVENT payloads are JSON objects with the event name in "e".
+MAGIC = b"CALLREC1\n"
+HEADER = struct.Struct("<BdI")
+AUDIO = 1
+EVENT = 2
+
+# The writer thread wakes at most this often, so records are written in batches.
+WRITER_INTERVAL_SECS = 0.1
+
+
+class RecordingWriter:
+    """Appends records to a call recording from a background thread.
+
+    `audio()` and `event()` only encode the record and do a non-blocking put
+    on a bounded queue, so they're safe to call from the event loop. If the
+    disk can't keep up records are dropped and counted.
+    """
+
+    def __init__(self, path: str, maxsize: int = 5000):
+        self.path = path
+        self._start = time.monotonic()
+        self._queue = queue.Queue(maxsize)
+        self.dropped = 0
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="call-recorder", daemon=True)
+        self._thread.start()
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self._start
+
+    def audio(self, ulaw: bytes):
+        self._put(AUDIO, ulaw)
+
+    def event(self, name: str, **fields):
+        fields["e"] = name
+        self._put(EVENT, orjson.dumps(fields, default=str))
+
+    def close(self):
+        """Stops recording. The writer thread writes out what's left and
+        closes the file on its own, so this never waits on the disk."""
+        self._closed.set()
+
+    def join(self):
+        self._thread.join()
+
+    def _put(self, kind: int, payload: bytes):
+        record = HEADER.pack(kind, self.elapsed(), len(payload)) + payload
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            RECORDING_EVENTS_DROPPED.inc()
+
+    def _run(self):
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            f = open(self.path, "wb")
+        except OSError as error:
+            logger.error(f"Error opening recording {self.path}: {str(error)}")
+            return
+        f.write(MAGIC)
+        while True:
+            # Everything queued before close() is written before stopping.
+            closing = self._closed.is_set()
+            batch = []
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if batch:
+                f.write(b"".join(batch))
+                f.flush()
+            if closing:
+                break
+            time.sleep(WRITER_INTERVAL_SECS)
+        f.close()
+        if self.dropped:
+            logger.warning(f"Recording {self.path} dropped {self.dropped} records")
+
+
+def read_recording(path: str):
+    """Yields `(seconds, kind, payload)` for every record in a recording.
+
+    EVENT payloads are decoded to dicts. A record cut short at the end of the
+    file (e.g. the process died mid-write) is ignored.
+    """
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a call recording")
+        while True:
+            header = f.read(HEADER.size)
+            if len(header) < HEADER.size:
+                return
+            kind, seconds, length = HEADER.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length:
+                return
+            yield seconds, kind, orjson.loads(payload) if kind == EVENT else payload
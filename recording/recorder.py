@@ -0,0 +1,159 @@
+import os
+from datetime import datetime, timezone
+
+from pipecat.frames.frames import (
+    Frame,
+    FunctionCallInProgressFrame,
+    FunctionCallResultFrame,
+    InputAudioRawFrame,
+    LLMFullResponseEndFrame,
+    LLMFullResponseStartFrame,
+    StartInterruptionFrame,
+    TextFrame,
+    TranscriptionFrame,
+    TTSAudioRawFrame,
+    TTSSpeakFrame,
+    TTSStartedFrame,
+    TTSStoppedFrame,
+    UserStartedSpeakingFrame,
+    UserStoppedSpeakingFrame,
+)
+from pipecat.processors.aggregators.openai_llm_context import OpenAILLMContextFrame
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+
+from serializers import FastTwilioFrameSerializer
+
+from .log import RecordingWriter
+
+# Where taps go in the pipeline, and what each one records.
+TAPS = ("input", "stt", "llm_in", "llm_out", "tts_in", "tts_out")
+
+
+class CallRecorder:
+    """Records what happens during a call to an append-only event log.
+
+    Opt-in: only enabled when RECORDINGS_DIR is set. `tap(name)` returns a
+    pass-through processor for one point in the pipeline, or None when
+    recording is off so the pipeline doesn't pay for it. The taps record
+    inbound audio (as 8 kHz μ-law), VAD events, transcriptions, the messages
+    added to the LLM context for each request, LLM output, function calls and
+    results, and TTS requests and output timings. Recordings are written by
+    a background thread and can be replayed with `recording.replay`.
+    """
+
+    def __init__(self, path: str | None, stream_sid: str, call_sid: str | None = None):
+        self._writer = RecordingWriter(path) if path else None
+        self._encoder = FastTwilioFrameSerializer(stream_sid) if path else None
+        self._context_messages = 0
+        self._tts_audio_secs = 0.0
+        self._tts_first_audio = False
+        if self._writer:
+            self._writer.event(
+                "start",
+                stream_sid=stream_sid,
+                call_sid=call_sid,
+                started_at=datetime.now(timezone.utc).isoformat(),
+            )
+
+    @classmethod
+    def from_env(cls, stream_sid: str, call_sid: str | None = None) -> "CallRecorder":
+        directory = os.getenv("RECORDINGS_DIR")
+        path = None
+        if directory:
+            stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+            path = os.path.join(directory, f"{stamp}-{stream_sid}.callrec")
+        return cls(path, stream_sid, call_sid)
+
+    @property
+    def enabled(self) -> bool:
+        return self._writer is not None
+
+    @property
+    def path(self) -> str | None:
+        return self._writer.path if self._writer else None
+
+    def tap(self, name: str) -> "RecorderTap | None":
+        if name not in TAPS:
+            raise ValueError(f"Unknown recorder tap {name}")
+        return RecorderTap(self, name) if self._writer else None
+
+    def close(self):
+        if self._writer:
+            self._writer.event("end")
+            self._writer.close()
+            self._writer = None
+
+    def record(self, tap: str, frame: Frame):
+        writer = self._writer
+        if not writer:
+            return
+
+        if tap == "input":
+            if isinstance(frame, InputAudioRawFrame):
+                writer.audio(self._encoder.encode_audio(frame.audio, frame.sample_rate))
+            elif isinstance(frame, UserStartedSpeakingFrame):
+                writer.event("user_started")
+            elif isinstance(frame, UserStoppedSpeakingFrame):
+                writer.event("user_stopped")
+            elif isinstance(frame, StartInterruptionFrame):
+                writer.event("interruption")
+        elif tap == "stt":
+            if isinstance(frame, TranscriptionFrame):
+                writer.event("stt", text=frame.text)
+        elif tap == "llm_in":
+            if isinstance(frame, OpenAILLMContextFrame):
+                # Only the messages added since the last request, so the
+                # system prompt isn't written out on every turn.
+                messages = frame.context.messages
+                writer.event("llm_request", messages=messages[self._context_messages :])
+                self._context_messages = len(messages)
+        elif tap == "llm_out":
+            if isinstance(frame, LLMFullResponseStartFrame):
+                writer.event("llm_start")
+            elif isinstance(frame, LLMFullResponseEndFrame):
+                writer.event("llm_end")
+            elif isinstance(frame, FunctionCallInProgressFrame):
+                writer.event(
+                    "tool_call",
+                    id=frame.tool_call_id,
+                    name=frame.function_name,
+                    arguments=frame.arguments,
+                )
+            elif isinstance(frame, FunctionCallResultFrame):
+                writer.event(
+                    "tool_result", id=frame.tool_call_id, name=frame.function_name, result=frame.result
+                )
+            elif isinstance(frame, TextFrame):
+                writer.event("llm_text", text=frame.text)
+        elif tap == "tts_in":
+            if isinstance(frame, TTSSpeakFrame):
+                writer.event("tts_request", text=frame.text)
+        elif tap == "tts_out":
+            if isinstance(frame, TTSStartedFrame):
+                self._tts_audio_secs = 0.0
+                self._tts_first_audio = True
+                writer.event("tts_started")
+            elif isinstance(frame, TTSAudioRawFrame):
+                if self._tts_first_audio:
+                    self._tts_first_audio = False
+                    writer.event("tts_first_audio")
+                self._tts_audio_secs += len(frame.audio) / (
+                    frame.sample_rate * frame.num_channels * 2
+                )
+            elif isinstance(frame, TTSStoppedFrame):
+                writer.event("tts_stopped", audio_secs=round(self._tts_audio_secs, 3))
+
+
+class RecorderTap(FrameProcessor):
+    """Pass-through processor that hands frames to a CallRecorder."""
+
+    def __init__(self, recorder: CallRecorder, tap: str, **kwargs):
+        super().__init__(**kwargs)
+        self._recorder = recorder
+        self._tap = tap
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+        if direction == FrameDirection.DOWNSTREAM:
+            self._recorder.record(self._tap, frame)
+        await self.push_frame(frame, direction)
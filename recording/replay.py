@@ -0,0 +1,336 @@
+import asyncio
+import binascii
+import json
+import statistics
+import time
+from dataclasses import dataclass, field
+
+import orjson
+from openai.types.chat import ChatCompletionChunk
+from openai.types.chat.chat_completion_chunk import (
+    Choice,
+    ChoiceDelta,
+    ChoiceDeltaToolCall,
+    ChoiceDeltaToolCallFunction,
+)
+from prometheus_client import REGISTRY
+from starlette.websockets import WebSocketState
+
+from pipecat.frames.frames import (
+    AudioRawFrame,
+    Frame,
+    StartFrame,
+    TranscriptionFrame,
+    TTSAudioRawFrame,
+    TTSStartedFrame,
+)
+from pipecat.processors.frame_processor import FrameDirection, FrameProcessor
+from pipecat.services.ai_services import TTSService
+from pipecat.services.openai import OpenAILLMService
+
+from .log import AUDIO, read_recording
+
+# Used when a recording has no TTS timings, or a response wasn't recorded.
+DEFAULT_TTS_TTFB_SECS = 0.3
+WORDS_PER_SEC = 2.5
+# How long replay keeps the call open after the last recorded event.
+TAIL_SECS = 3.0
+# Histograms reported per replayed call, as (count, sum) deltas.
+REPORTED_HISTOGRAMS = (
+    "time_to_first_audio_seconds",
+    "tts_first_clause_delay_seconds",
+    "barge_in_to_silence_seconds",
+)
+
+
+@dataclass
+class LLMResponse:
+    # (seconds after the request, text) and (seconds after the request,
+    # tool_call_id, function name, arguments) in the order they were produced.
+    text: list = field(default_factory=list)
+    tool_calls: list = field(default_factory=list)
+
+
+@dataclass
+class Recording:
+    path: str
+    stream_sid: str = "MZreplay"
+    call_sid: str | None = None
+    duration: float = 0.0
+    # (seconds, μ-law) for every inbound audio frame.
+    audio: list = field(default_factory=list)
+    # (seconds, text) for every final transcription.
+    transcriptions: list = field(default_factory=list)
+    responses: list = field(default_factory=list)
+    # tool_call_id -> (latency, result)
+    tool_results: dict = field(default_factory=dict)
+    tts_ttfb: float = DEFAULT_TTS_TTFB_SECS
+
+    @classmethod
+    def load(cls, path: str) -> "Recording":
+        recording = cls(path)
+        request_time = None
+        response = None
+        tool_calls = {}
+        tts_requests = []
+        tts_ttfbs = []
+
+        for seconds, kind, payload in read_recording(path):
+            recording.duration = seconds
+            if kind == AUDIO:
+                recording.audio.append((seconds, payload))
+                continue
+
+            event = payload["e"]
+            if event == "start":
+                recording.stream_sid = payload.get("stream_sid") or recording.stream_sid
+                recording.call_sid = payload.get("call_sid")
+            elif event == "stt":
+                recording.transcriptions.append((seconds, payload["text"]))
+            elif event == "llm_request":
+                request_time = seconds
+                response = LLMResponse()
+                recording.responses.append(response)
+            elif event == "llm_text" and response:
+                response.text.append((seconds - request_time, payload["text"]))
+            elif event == "tool_call":
+                tool_calls[payload["id"]] = seconds
+                if response:
+                    response.tool_calls.append(
+                        (seconds - request_time, payload["id"], payload["name"], payload["arguments"])
+                    )
+            elif event == "tool_result":
+                started = tool_calls.get(payload["id"], seconds)
+                recording.tool_results[payload["id"]] = (seconds - started, payload["result"])
+            elif event == "tts_request":
+                tts_requests.append(seconds)
+            elif event == "tts_first_audio" and tts_requests:
+                tts_ttfbs.append(seconds - tts_requests.pop(0))
+
+        if tts_ttfbs:
+            recording.tts_ttfb = statistics.median(tts_ttfbs)
+        return recording
+
+
+class ReplayWebSocket:
+    """Stands in for Twilio's media stream websocket.
+
+    Plays the recorded inbound audio at the recorded times and plays out
+    whatever the bot sends back in real time, echoing `mark` messages once
+    the audio before them has been "played" and flushing on `clear`, like
+    Twilio does.
+    """
+
+    def __init__(self, recording: Recording, speed: float = 1.0):
+        self._recording = recording
+        self._speed = speed
+        self._inbound: asyncio.Queue = asyncio.Queue()
+        self._play_until = 0.0
+        self._mark_tasks = set()
+        self.client_state = WebSocketState.CONNECTED
+        self.audio_out_secs = 0.0
+
+    async def iter_text(self):
+        feeder = asyncio.create_task(self._feed())
+        try:
+            while True:
+                message = await self._inbound.get()
+                if message is None:
+                    break
+                yield message
+        finally:
+            feeder.cancel()
+            self.client_state = WebSocketState.DISCONNECTED
+
+    async def send_text(self, data: str):
+        message = orjson.loads(data)
+        event = message["event"]
+        now = time.monotonic()
+        if event == "media":
+            secs = len(binascii.a2b_base64(message["media"]["payload"])) / 8000
+            self.audio_out_secs += secs
+            self._play_until = max(self._play_until, now) + secs
+        elif event == "clear":
+            self._play_until = now
+            for task in self._mark_tasks:
+                task.cancel()
+        elif event == "mark":
+            task = asyncio.create_task(self._echo_mark(message["mark"]["name"]))
+            self._mark_tasks.add(task)
+            task.add_done_callback(self._mark_tasks.discard)
+
+    async def close(self):
+        self.client_state = WebSocketState.DISCONNECTED
+        await self._inbound.put(None)
+
+    async def _echo_mark(self, name: str):
+        try:
+            await asyncio.sleep(max(0.0, self._play_until - time.monotonic()))
+        except asyncio.CancelledError:
+            pass
+        await self._inbound.put(json.dumps({"event": "mark", "mark": {"name": name}}))
+
+    async def _feed(self):
+        start = time.monotonic()
+        sid = self._recording.stream_sid
+        for seconds, ulaw in self._recording.audio:
+            delay = start + seconds / self._speed - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            payload = binascii.b2a_base64(ulaw, newline=False).decode("ascii")
+            await self._inbound.put(
+                json.dumps({"event": "media", "streamSid": sid, "media": {"payload": payload}})
+            )
+        end = start + (self._recording.duration + TAIL_SECS) / self._speed
+        await asyncio.sleep(max(0.0, end - time.monotonic()))
+        await self._inbound.put(None)
+
+
+class ReplaySTTService(FrameProcessor):
+    """Emits the recorded transcriptions at the recorded times."""
+
+    def __init__(self, recording: Recording, speed: float = 1.0, **kwargs):
+        super().__init__(**kwargs)
+        self._recording = recording
+        self._speed = speed
+        self._task = None
+
+    async def process_frame(self, frame: Frame, direction: FrameDirection):
+        await super().process_frame(frame, direction)
+
+        if isinstance(frame, StartFrame):
+            self._task = self.get_event_loop().create_task(self._transcribe())
+        if not isinstance(frame, AudioRawFrame):
+            await self.push_frame(frame, direction)
+
+    async def cleanup(self):
+        if self._task:
+            self._task.cancel()
+
+    async def _transcribe(self):
+        start = time.monotonic()
+        for seconds, text in self._recording.transcriptions:
+            await asyncio.sleep(max(0.0, start + seconds / self._speed - time.monotonic()))
+            await self.push_frame(TranscriptionFrame(text, "", ""))
+
+
+class ReplayLLMService(OpenAILLMService):
+    """Replays the recorded LLM responses, in order, with recorded timing.
+
+    Function calls are answered with the recorded results after the recorded
+    latency instead of running the real handlers.
+    """
+
+    def __init__(self, recording: Recording, speed: float = 1.0, **kwargs):
+        super().__init__(api_key="replay", model="replay", **kwargs)
+        self._recording = recording
+        self._speed = speed
+        self._next_response = 0
+        self.unmatched_requests = 0
+        self.register_function(None, self._replay_function)
+
+    async def get_chat_completions(self, context, messages):
+        if self._next_response < len(self._recording.responses):
+            response = self._recording.responses[self._next_response]
+        else:
+            response = LLMResponse()
+            self.unmatched_requests += 1
+        self._next_response += 1
+        return self._stream(response)
+
+    async def _stream(self, response: LLMResponse):
+        start = time.monotonic()
+        chunks = [(offset, ChoiceDelta(content=text)) for offset, text in response.text]
+        for index, (offset, tool_call_id, name, arguments) in enumerate(response.tool_calls):
+            tool_call = ChoiceDeltaToolCall(
+                index=index,
+                id=tool_call_id,
+                type="function",
+                function=ChoiceDeltaToolCallFunction(name=name, arguments=json.dumps(arguments)),
+            )
+            chunks.append((offset, ChoiceDelta(tool_calls=[tool_call])))
+
+        for offset, delta in chunks:
+            await asyncio.sleep(max(0.0, start + offset / self._speed - time.monotonic()))
+            yield ChatCompletionChunk(
+                id="replay",
+                object="chat.completion.chunk",
+                created=0,
+                model="replay",
+                choices=[Choice(index=0, delta=delta)],
+            )
+
+    async def _replay_function(
+        self, function_name, tool_call_id, arguments, llm, context, result_callback
+    ):
+        latency, result = self._recording.tool_results.get(tool_call_id, (0.0, "{}"))
+        await asyncio.sleep(latency / self._speed)
+        await result_callback(result)
+
+
+class ReplayTTSService(TTSService):
+    """Produces silence as long as the text would take to say.
+
+    Every request waits the recording's median TTS time-to-first-byte.
+    """
+
+    def __init__(self, recording: Recording, speed: float = 1.0, **kwargs):
+        super().__init__(push_stop_frames=True, sample_rate=16000, **kwargs)
+        self._recording = recording
+        self._speed = speed
+
+    def can_generate_metrics(self) -> bool:
+        return True
+
+    async def run_tts(self, text: str):
+        await self.start_ttfb_metrics()
+        await asyncio.sleep(self._recording.tts_ttfb / self._speed)
+        await self.stop_ttfb_metrics()
+        yield TTSStartedFrame()
+        secs = max(len(text.split()), 1) / WORDS_PER_SEC
+        audio = b"\0\0" * int(self.sample_rate * secs)
+        chunk_size = self.sample_rate // 5 * 2
+        for i in range(0, len(audio), chunk_size):
+            yield TTSAudioRawFrame(audio[i : i + chunk_size], self.sample_rate, 1)
+
+
+async def replay_call(path: str, speed: float = 1.0) -> dict:
+    """Replays a recording through `run_bot`'s pipeline.
+
+    Returns the wall time, the latency histograms the pipeline reported during
+    the call, and how many LLM requests had no recorded response (a sign the
+    pipeline under test behaves differently from the recording). Only one call
+    should be replayed at a time in a process, as the histograms are global.
+    """
+    from bot import run_bot
+
+    before = _histogram_totals()
+    recording = Recording.load(path)
+    websocket = ReplayWebSocket(recording, speed)
+    llm = ReplayLLMService(recording, speed)
+    services = (ReplaySTTService(recording, speed), llm, ReplayTTSService(recording, speed))
+
+    start = time.monotonic()
+    await run_bot(websocket, recording.stream_sid, services=services)
+    after = _histogram_totals()
+    return {
+        "wall_secs": time.monotonic() - start,
+        "recorded_secs": recording.duration,
+        "llm_requests": llm._next_response,
+        "recorded_llm_requests": len(recording.responses),
+        "unmatched_llm_requests": llm.unmatched_requests,
+        "audio_out_secs": websocket.audio_out_secs,
+        **{
+            name: (after[name][0] - before[name][0], after[name][1] - before[name][1])
+            for name in REPORTED_HISTOGRAMS
+        },
+    }
+
+
+def _histogram_totals() -> dict:
+    totals = {}
+    for name in REPORTED_HISTOGRAMS:
+        count = REGISTRY.get_sample_value(f"{name}_count") or 0.0
+        total = REGISTRY.get_sample_value(f"{name}_sum") or 0.0
+        totals[name] = (count, total)
+    return totals
@@ -0,0 +1,5 @@
+from .twilio import FastTwilioFrameSerializer
+
+__all__ = [
+    "FastTwilioFrameSerializer",
+]
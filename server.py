@@ -1,23 +1,82 @@
+import time
+
+# Taken before anything else is imported, for the cold-start metrics.
+BOOT_TIME = time.monotonic()
+
 import json
+from urllib.parse import parse_qsl
+from xml.sax.saxutils import escape, quoteattr
 from loguru import logger
 import uvicorn
-from fastapi import FastAPI, WebSocket
+from fastapi import FastAPI, Request, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
-from starlette.responses import HTMLResponse
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from starlette.responses import HTMLResponse, Response
 
-from bot import run_bot
 import os
-from twilio.rest import Client
+import sys
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+
+from breakers import breakers, voice_unavailable
+from bulk_updates import router as bulk_updates_router
+from campaigns import campaign_booking, router as campaigns_router
+from log_config import setup_logging
+from tenants import tenants
+from warmup import warmup
 
-# Set up Twilio client
-twilio_client = Client(os.environ["TWILIO_ACCOUNT_SID"], os.environ["TWILIO_AUTH_TOKEN"])
+setup_logging()
+
+# With FAST_START on (the default) the port is bound straight away and the
+# call pipeline is loaded in the background. With it off, startup waits for
+# the warm-up to finish.
+FAST_START = os.getenv("FAST_START", "1") != "0"
 
 app = FastAPI()
+app.include_router(bulk_updates_router)
+app.include_router(campaigns_router)
+
+
+@app.on_event("startup")
+async def startup():
+    task = warmup.start(BOOT_TIME)
+    if not FAST_START:
+        await task
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    # Sends staff notifications still waiting for their digest. Only loaded
+    # once a call has used it.
+    notifications = sys.modules.get("functions.staff_notifications")
+    if notifications:
+        await notifications.staff_notifier.flush()
+    hot = sys.modules.get("functions.hot_bookings")
+    if hot:
+        await hot.hot_bookings.stop()
 
 
 @app.get("/health")
 async def health():
-    return {"status": "ok"}
+    # Degraded while any upstream's circuit breaker is turning requests away.
+    upstreams = {name: breaker.status() for name, breaker in breakers.items()}
+    degraded = any(breaker.is_open for breaker in breakers.values())
+    status = {
+        "status": "degraded" if degraded else "ok",
+        "warm": warmup.ready,
+        "upstreams": upstreams,
+    }
+    # Loaded by the warm-up.
+    hot = sys.modules.get("functions.hot_bookings")
+    if hot and hot.hot_bookings.enabled:
+        status["hot_bookings"] = hot.hot_bookings.status()
+    return status
+
+
+@app.get("/metrics")
+async def metrics():
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
 
 # Existing endpoints and bot logic
@@ -31,10 +90,38 @@ app.add_middleware(
 )
 
 
+BUSY_TWIML = (
+    '<Response><Say language="en-GB">Sorry, all our lines are busy right now. '
+    "Please call back in a few minutes.</Say><Hangup/></Response>"
+)
+UNAVAILABLE_TWIML = (
+    '<Response><Say language="en-GB">Sorry, our automated assistant is unavailable right now. '
+    "Putting you through to a member of staff.</Say><Dial>{number}</Dial></Response>"
+)
+
+
 @app.post("/start_call")
-async def start_call():
-    print("POST TwiML")
-    return HTMLResponse(content=open("templates/streams.xml").read(), media_type="application/xml")
+async def start_call(request: Request):
+    logger.debug("POST TwiML")
+    # Twilio posts the call's details form-encoded. The tenant is picked by
+    # the number that was dialled and passed on to /ws.
+    call = dict(parse_qsl((await request.body()).decode()))
+    tenant = tenants.for_number(call.get("To"))
+    if not tenants.admit(tenant):
+        logger.warning(f"Turning away a call for {tenant.id}: {tenant.max_calls} calls running")
+        return HTMLResponse(content=BUSY_TWIML, media_type="application/xml")
+    # A call the bot couldn't hear, answer or speak on goes straight to staff.
+    down = voice_unavailable(tenant.tts_providers)
+    if down:
+        logger.warning(f"{', '.join(down)} unavailable, passing a call for {tenant.id} to staff")
+        if not tenant.transfer_number:
+            return HTMLResponse(content=BUSY_TWIML, media_type="application/xml")
+        content = UNAVAILABLE_TWIML.format(number=escape(tenant.transfer_number))
+        return HTMLResponse(content=content, media_type="application/xml")
+
+    parameters = f'<Parameter name="tenant" value={quoteattr(tenant.id)}/>'
+    content = open("templates/streams.xml").read().format(parameters=parameters)
+    return HTMLResponse(content=content, media_type="application/xml")
 
 
 @app.websocket("/ws")
@@ -43,14 +130,29 @@ async def websocket_endpoint(websocket: WebSocket):
     start_data = websocket.iter_text()
     await start_data.__anext__()
     call_data = json.loads(await start_data.__anext__())
-    print(call_data, flush=True)
     stream_sid = call_data["start"]["streamSid"]
-    print("WebSocket connection accepted")
-    try:
-        await run_bot(websocket, stream_sid)
-    except Exception as e:
-        logger.error(f"Error running bot: {str(e)}")
-        await websocket.close()
+    call_sid = call_data["start"].get("callSid")
+    parameters = call_data["start"].get("customParameters") or {}
+    tenant = tenants.get(parameters.get("tenant"))
+    with logger.contextualize(call_sid=call_sid, stream_sid=stream_sid, tenant=tenant.id):
+        logger.info("WebSocket connection accepted")
+        # Checked again here, as calls can arrive between /start_call and /ws.
+        if not tenants.try_acquire(tenant):
+            logger.warning(f"Closing call for {tenant.id}: {tenant.max_calls} calls running")
+            await websocket.close()
+            return
+        try:
+            # Set on outbound campaign calls, which start with the booking
+            # loaded. Taken only once the call has a slot, as it can only be
+            # taken once.
+            booking = await campaign_booking(parameters.get("campaignCallId"))
+            run_bot = await warmup.load_bot()
+            await run_bot(websocket, stream_sid, call_sid, booking=booking, tenant=tenant)
+        except Exception as e:
+            logger.error(f"Error running bot: {str(e)}")
+            await websocket.close()
+        finally:
+            tenants.release(tenant)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,14 @@
+from .hedged_tts import CartesiaStream, ElevenLabsStream, HedgedTTSService
+from .model_router import RoutedOpenAILLMService, TurnRouter
+from .phrase_cache import PhraseCache, phrase_cache, phrase_cache_for
+
+__all__ = [
+    "CartesiaStream",
+    "ElevenLabsStream",
+    "HedgedTTSService",
+    "PhraseCache",
+    "RoutedOpenAILLMService",
+    "TurnRouter",
+    "phrase_cache",
+    "phrase_cache_for",
+]
@@ -0,0 +1,322 @@
+import asyncio
+import time
+from typing import AsyncGenerator
+
+import aiohttp
+from loguru import logger
+from prometheus_client import Counter, Histogram
+
+from pipecat.frames.frames import (
+    CancelFrame,
+    EndFrame,
+    Frame,
+    StartFrame,
+    StartInterruptionFrame,
+    TTSAudioRawFrame,
+    TTSStartedFrame,
+    TTSStoppedFrame,
+)
+from pipecat.processors.frame_processor import FrameDirection
+from pipecat.services.ai_services import TTSService
+
+from breakers import CircuitBreaker, CircuitOpenError
+
+from .phrase_cache import ELEVENLABS_API_URL
+
+CARTESIA_API_URL = "https://api.cartesia.ai/tts/bytes"
+CARTESIA_VERSION = "2024-06-10"
+
+TTS_TTFB = Histogram(
+    "tts_ttfb_seconds",
+    "Time from a TTS request until its first audio, by provider",
+    ["provider"],
+    buckets=(0.1, 0.15, 0.2, 0.3, 0.4, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0),
+)
+TTS_UTTERANCES = Counter(
+    "tts_utterances_total",
+    "Sentences spoken, by the provider that spoke them and how it was chosen: "
+    "primary, hedge_lost (hedged but the primary answered first), hedge_won, "
+    "failover (the other provider failed or its breaker was open) or sticky "
+    "(the provider already speaking this response)",
+    ["provider", "how"],
+)
+
+# Audio is passed on in 100 ms chunks at 16 kHz.
+CHUNK_BYTES = 3200
+
+
+class ElevenLabsStream:
+    """Requests for ElevenLabs' HTTP streaming endpoint."""
+
+    name = "elevenlabs"
+
+    def __init__(self, *, api_key: str, voice_id: str, model: str = "eleven_turbo_v2_5"):
+        self._api_key = api_key
+        self.voice_id = voice_id
+        self._model = model
+
+    def request(self, text: str, sample_rate: int) -> tuple[str, dict, dict]:
+        url = f"{ELEVENLABS_API_URL}/{self.voice_id}/stream?output_format=pcm_{sample_rate}"
+        return url, {"xi-api-key": self._api_key}, {"text": text, "model_id": self._model}
+
+
+class CartesiaStream:
+    """Requests for Cartesia's streaming bytes endpoint."""
+
+    name = "cartesia"
+
+    def __init__(self, *, api_key: str, voice_id: str, model: str = "sonic-english"):
+        self._api_key = api_key
+        self.voice_id = voice_id
+        self._model = model
+
+    def request(self, text: str, sample_rate: int) -> tuple[str, dict, dict]:
+        headers = {"X-API-Key": self._api_key, "Cartesia-Version": CARTESIA_VERSION}
+        payload = {
+            "model_id": self._model,
+            "transcript": text,
+            "voice": {"mode": "id", "id": self.voice_id},
+            "output_format": {
+                "container": "raw",
+                "encoding": "pcm_s16le",
+                "sample_rate": sample_rate,
+            },
+            "language": "en",
+        }
+        return CARTESIA_API_URL, headers, payload
+
+
+class _Attempt:
+    # One provider rendering one sentence. Audio goes on `queue`, ending with
+    # None; `first` resolves True at the first audio, False if none came.
+
+    def __init__(self, session, provider, breaker: CircuitBreaker, text: str, sample_rate: int):
+        self.provider = provider
+        self.queue = asyncio.Queue()
+        self.first = asyncio.get_running_loop().create_future()
+        self.start = time.monotonic()
+        self._breaker = breaker
+        self._task = asyncio.create_task(self._run(session, text, sample_rate))
+
+    async def _run(self, session, text: str, sample_rate: int):
+        url, headers, payload = self.provider.request(text, sample_rate)
+        try:
+            async with session.post(url, headers=headers, json=payload) as response:
+                if response.status != 200:
+                    raise Exception(f"{self.provider.name} returned status {response.status}")
+                odd = b""
+                async for chunk in response.content.iter_chunked(CHUNK_BYTES):
+                    # Keep whole 16-bit samples only.
+                    chunk = odd + chunk
+                    odd = chunk[len(chunk) & ~1 :]
+                    chunk = chunk[: len(chunk) & ~1]
+                    if not chunk:
+                        continue
+                    if not self.first.done():
+                        ttfb = time.monotonic() - self.start
+                        TTS_TTFB.labels(provider=self.provider.name).observe(ttfb)
+                        self._breaker.record(True, ttfb)
+                        self.first.set_result(True)
+                    self.queue.put_nowait(chunk)
+        except asyncio.CancelledError:
+            if not self.first.done():
+                # Lost the race or interrupted: only counts against the
+                # provider if it was already slow.
+                elapsed = time.monotonic() - self.start
+                if elapsed > self._breaker.slow_call_secs:
+                    self._breaker.record(True, elapsed)
+                else:
+                    self._breaker.release()
+        except Exception as e:
+            logger.warning(f"{self.provider.name} TTS failed: {e!r}")
+            if not self.first.done():
+                self._breaker.record(False, time.monotonic() - self.start)
+        finally:
+            if not self.first.done():
+                self.first.set_result(False)
+            self.queue.put_nowait(None)
+
+    def cancel(self):
+        self._task.cancel()
+
+
+class HedgedTTSService(TTSService):
+    """TTS that hedges a slow primary provider with a secondary one.
+
+    Each sentence goes to the primary (ElevenLabs). If no audio has arrived
+    within `hedge_secs`, the same sentence is also sent to the secondary
+    (Cartesia), whichever starts streaming first is played and the other
+    request is cancelled. With `hedge=False` the secondary is only used when
+    the primary fails or its circuit breaker is open (failover only).
+
+    So the voice doesn't change halfway through a reply, the provider that
+    spoke the first sentence speaks the rest of it, until the bot stops
+    speaking or is interrupted; only a failure switches provider mid-reply.
+
+    Both are used through their HTTP streaming APIs, so each sentence is a
+    request that can be raced and cancelled. `tts_ttfb_seconds` has each
+    provider's time to first audio and `tts_utterances_total` how often each
+    one spoke and why.
+    """
+
+    def __init__(
+        self,
+        *,
+        primary: ElevenLabsStream,
+        secondary: CartesiaStream,
+        breakers: dict,
+        hedge_secs: float = 0.5,
+        hedge: bool = True,
+        sample_rate: int = 16000,
+        **kwargs,
+    ):
+        # Like ElevenLabsTTSService: a TTSStoppedFrame follows a short gap in
+        # the audio, rather than each sentence.
+        super().__init__(
+            aggregate_sentences=True,
+            push_stop_frames=True,
+            stop_frame_timeout_s=2.0,
+            sample_rate=sample_rate,
+            **kwargs,
+        )
+        self._primary = primary
+        self._secondary = secondary
+        self._breakers = breakers
+        self._hedge_secs = hedge_secs
+        self._hedge = hedge
+        self._session = None
+        self._attempts = set()
+        # The provider speaking the current reply, and whether TTSStartedFrame was sent.
+        self._speaking = None
+        self._started = False
+        self.set_voice(primary.voice_id)
+
+    def can_generate_metrics(self) -> bool:
+        return True
+
+    async def set_model(self, model: str):
+        self.set_model_name(model)
+
+    def set_voice(self, voice: str):
+        self._voice_id = voice
+
+    async def flush_audio(self):
+        pass
+
+    async def start(self, frame: StartFrame):
+        await super().start(frame)
+        # No total timeout: a long sentence streams for as long as it takes.
+        timeout = aiohttp.ClientTimeout(sock_connect=5.0, sock_read=5.0)
+        self._session = aiohttp.ClientSession(timeout=timeout)
+
+    async def stop(self, frame: EndFrame):
+        await super().stop(frame)
+        await self._close()
+
+    async def cancel(self, frame: CancelFrame):
+        await super().cancel(frame)
+        await self._close()
+
+    async def _close(self):
+        self._cancel_attempts()
+        if self._session:
+            await self._session.close()
+            self._session = None
+
+    async def push_frame(self, frame: Frame, direction: FrameDirection = FrameDirection.DOWNSTREAM):
+        await super().push_frame(frame, direction)
+        if isinstance(frame, (TTSStoppedFrame, StartInterruptionFrame)):
+            self._started = False
+            self._speaking = None
+
+    async def _handle_interruption(self, frame: StartInterruptionFrame, direction: FrameDirection):
+        self._cancel_attempts()
+        await super()._handle_interruption(frame, direction)
+
+    def _cancel_attempts(self):
+        for attempt in self._attempts:
+            attempt.cancel()
+        self._attempts.clear()
+
+    def _start(self, provider, text: str) -> _Attempt | None:
+        # None while the provider's circuit breaker is open.
+        breaker = self._breakers[provider.name]
+        try:
+            breaker.acquire()
+        except CircuitOpenError:
+            return None
+        attempt = _Attempt(self._session, provider, breaker, text, self.sample_rate)
+        self._attempts.add(attempt)
+        return attempt
+
+    def _other(self, provider):
+        return self._secondary if provider is self._primary else self._primary
+
+    async def _choose(self, text: str) -> tuple[_Attempt | None, str]:
+        # Starts the sentence and returns the attempt that produced audio
+        # first, with how its provider was chosen.
+        provider = self._speaking or self._primary
+        how = "sticky" if self._speaking else "primary"
+        attempt = self._start(provider, text)
+        if attempt is None:
+            how = "failover"
+            attempt = self._start(self._other(provider), text)
+            if attempt is None:
+                return None, how
+        attempts = [attempt]
+        hedging = how == "primary" and self._hedge
+
+        while True:
+            waiting = [attempt.first for attempt in attempts if not attempt.first.done()]
+            if waiting:
+                timeout = self._hedge_secs if hedging and len(attempts) == 1 else None
+                await asyncio.wait(waiting, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            winner = next((a for a in attempts if a.first.done() and a.first.result()), None)
+            if winner:
+                break
+            if len(attempts) == 2:
+                if not waiting:
+                    return None, how
+                continue
+            # The only attempt so far failed, or is past the hedge deadline.
+            failed = attempts[0].first.done()
+            second = self._start(self._other(attempts[0].provider), text)
+            if second is None:
+                if failed:
+                    return None, how
+                hedging = False
+                continue
+            how = "failover" if failed else "hedge"
+            attempts.append(second)
+
+        for attempt in attempts:
+            if attempt is not winner:
+                attempt.cancel()
+                self._attempts.discard(attempt)
+        if how == "hedge":
+            how = "hedge_won" if winner is attempts[1] else "hedge_lost"
+        return winner, how
+
+    async def run_tts(self, text: str) -> AsyncGenerator[Frame, None]:
+        logger.debug(f"Generating TTS: [{text}]")
+        if not self._started:
+            await self.start_ttfb_metrics()
+            yield TTSStartedFrame()
+            self._started = True
+
+        winner = None
+        try:
+            winner, how = await self._choose(text)
+            if not winner:
+                logger.error(f"No TTS provider could speak: [{text}]")
+                return
+            await self.stop_ttfb_metrics()
+            TTS_UTTERANCES.labels(provider=winner.provider.name, how=how).inc()
+            if how != "primary":
+                logger.debug(f"Speaking with {winner.provider.name} ({how})")
+            self._speaking = winner.provider
+            await self.start_tts_usage_metrics(text)
+            while (chunk := await winner.queue.get()) is not None:
+                yield TTSAudioRawFrame(chunk, self.sample_rate, 1)
+        finally:
+            self._cancel_attempts()
@@ -0,0 +1,278 @@
+import asyncio
+import json
+import re
+import time
+
+from loguru import logger
+from openai import APIError
+from prometheus_client import Counter, Histogram
+
+from pipecat.frames.frames import TTSSpeakFrame
+from pipecat.processors.aggregators.openai_llm_context import OpenAILLMContext
+from pipecat.services.openai import OpenAILLMService
+
+from breakers import CircuitBreaker, CircuitOpenError
+
+LLM_ROUTES = Counter(
+    "llm_routes_total",
+    "LLM turns by the model they were routed to and why",
+    ["model", "reason"],
+)
+LLM_FALLBACKS = Counter(
+    "llm_route_fallbacks_total",
+    "Turns routed to the fast model that were re-run on the large model",
+    ["reason"],
+)
+LLM_TOOL_CALLS_DROPPED = Counter(
+    "llm_tool_calls_dropped_total",
+    "Bad function calls from the fast model dropped because it had already spoken, so the "
+    "turn couldn't be re-run",
+)
+LLM_FAILED_TURNS = Counter(
+    "llm_failed_turns_total",
+    "Turns answered with the apology because OpenAI was down, too slow or failed mid-reply",
+    ["reason"],
+)
+LLM_TTFB = Histogram(
+    "llm_ttfb_seconds",
+    "Time from an LLM request until its first streamed chunk",
+    ["model"],
+    buckets=(0.1, 0.2, 0.3, 0.4, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0),
+)
+LLM_RESPONSE = Histogram(
+    "llm_response_seconds",
+    "Time from an LLM request until its response finished streaming",
+    ["model"],
+    buckets=(0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 8.0),
+)
+LLM_TOKENS = Counter("llm_tokens_total", "LLM tokens used", ["model", "kind"])
+
+# Words in the caller's turn that usually mean a function call is next: an
+# ETA, a change to the booking, or a request to speak to someone.
+TOOL_CUE_WORDS = {
+    "minutes", "minute", "hour", "hours", "o'clock", "am", "pm", "half", "quarter",
+    "past", "tonight", "tomorrow", "noon", "midday",
+    "change", "changed", "update", "wrong", "different", "new", "transfer",
+    "person", "human", "someone", "manager", "registration", "reg", "plate",
+}
+# Phrases in the bot's last line whose "yes" triggers a function call:
+# confirming a registration (find_booking) or an ETA (update_eta).
+TOOL_CUE_PROMPTS = ("registration", "arrival time")
+# Said instead of a reply when OpenAI is down or doesn't answer in time.
+UNAVAILABLE_REPLY = (
+    "I'm sorry, I'm having some trouble at the moment. Please try again in a moment, "
+    "or call back in a few minutes."
+)
+
+
+class ToolSchemaError(Exception):
+    pass
+
+
+class TurnRouter:
+    """Picks the model for a turn from cheap signals in the context.
+
+    A turn goes to the fast model only when the router is confident it's a
+    plain conversational step: the booking has been looked up, the caller's
+    turn is short, and nothing in it or in the bot's last line suggests a
+    function call. Everything else, including function results that need
+    interpreting, goes to the large model. Returns `(model, reason)`.
+    """
+
+    def __init__(self, *, fast_model: str, large_model: str, max_fast_words: int = 12):
+        self.fast_model = fast_model
+        self.large_model = large_model
+        self._max_fast_words = max_fast_words
+
+    def choose(self, messages: list) -> tuple[str, str]:
+        if not messages or messages[-1].get("role") != "user":
+            return self.large_model, "tool_result"
+        if not _booking_looked_up(messages):
+            # Before the booking is found the turn is usually collecting or
+            # confirming the registration for find_booking.
+            return self.large_model, "pre_lookup"
+
+        text = messages[-1].get("content") or ""
+        if not isinstance(text, str):
+            return self.large_model, "tool_likely"
+        words = re.findall(r"[a-z0-9'\-]+", text.lower())
+        if len(words) > self._max_fast_words:
+            return self.large_model, "long_turn"
+        if any(word in TOOL_CUE_WORDS or any(c.isdigit() for c in word) for word in words):
+            return self.large_model, "tool_likely"
+
+        prompt = _last_assistant_text(messages).lower()
+        if any(cue in prompt for cue in TOOL_CUE_PROMPTS):
+            return self.large_model, "tool_likely"
+        return self.fast_model, "fast"
+
+
+class RoutedOpenAILLMService(OpenAILLMService):
+    """OpenAI LLM service that routes each turn to a fast or a large model.
+
+    `model` is the large model and the default. With a `fast_model` every
+    turn is routed by `TurnRouter`. When a fast model turn fails before it has
+    streamed any text, it is re-run on the large model. That covers an API
+    error, and a function call that doesn't match the tool schemas (an
+    unknown function, bad JSON, or missing required arguments). Function call
+    chunks from the fast model are held back until the response ends and they
+    validate, so a bad call never reaches a handler; one that comes after
+    spoken text is dropped rather than re-running the turn.
+
+    With a `breaker`, each request has until the breaker's timeout to start
+    streaming and its outcome is recorded. A turn whose request fails that
+    way, or that the open breaker turns away, gets a short spoken apology
+    instead of silence, as does one whose request fails after it has started
+    speaking. Either way the response is ended as usual.
+
+    Per-model TTFB, response time and token counts, and routing and fallback
+    counts, are exported on /metrics.
+    """
+
+    def __init__(
+        self,
+        *,
+        model: str,
+        fast_model: str | None = None,
+        breaker: CircuitBreaker | None = None,
+        **kwargs,
+    ):
+        super().__init__(model=model, **kwargs)
+        self._large_model = model
+        self._breaker = breaker
+        self._router = (
+            TurnRouter(fast_model=fast_model, large_model=model) if fast_model else None
+        )
+        self._streamed_text = False
+
+    async def get_chat_completions(self, context: OpenAILLMContext, messages):
+        model = self.model_name
+        start = time.monotonic()
+        if self._breaker:
+            async with self._breaker.guard():
+                stream = await super().get_chat_completions(context, messages)
+        else:
+            stream = await super().get_chat_completions(context, messages)
+        return self._observe(stream, context, model, start, validate=model != self._large_model)
+
+    async def _process_context(self, context: OpenAILLMContext):
+        try:
+            await self._route(context)
+        except (CircuitOpenError, asyncio.TimeoutError, APIError) as e:
+            # Handled here rather than raised, so the response still ends
+            # and a half-finished turn isn't merged into the next one.
+            logger.error(f"No reply from OpenAI: {e!r}")
+            LLM_FAILED_TURNS.labels(
+                reason="api_error" if isinstance(e, APIError) else "unavailable"
+            ).inc()
+            await self.push_frame(TTSSpeakFrame(UNAVAILABLE_REPLY))
+
+    async def _route(self, context: OpenAILLMContext):
+        if self._router:
+            model, reason = self._router.choose(context.messages)
+        else:
+            model, reason = self._large_model, "fixed"
+        LLM_ROUTES.labels(model=model, reason=reason).inc()
+
+        if model != self._large_model:
+            self.set_model_name(model)
+            self._streamed_text = False
+            try:
+                await super()._process_context(context)
+                return
+            except ToolSchemaError as e:
+                if self._streamed_text:
+                    # Re-running the turn would say it again (or something
+                    # else). The turn ends with what was said, and the LLM
+                    # picks up from there on the caller's reply.
+                    logger.warning(f"{model} made a bad function call after speaking: {e}")
+                    LLM_TOOL_CALLS_DROPPED.inc()
+                    return
+                fallback = "tool_schema"
+                logger.warning(
+                    f"{model} made a bad function call, retrying on {self._large_model}: {e}"
+                )
+            except (APIError, asyncio.TimeoutError) as e:
+                if self._streamed_text:
+                    # Can't be re-run without repeating what was said.
+                    raise
+                fallback = "api_error"
+                logger.warning(f"{model} request failed, retrying on {self._large_model}: {e!r}")
+            finally:
+                self.set_model_name(self._large_model)
+            LLM_FALLBACKS.labels(reason=fallback).inc()
+
+        await super()._process_context(context)
+
+    async def _observe(
+        self, stream, context: OpenAILLMContext, model: str, start: float, validate: bool
+    ):
+        first = True
+        held = []
+        async for chunk in stream:
+            if chunk.usage:
+                LLM_TOKENS.labels(model=model, kind="prompt").inc(chunk.usage.prompt_tokens)
+                LLM_TOKENS.labels(model=model, kind="completion").inc(chunk.usage.completion_tokens)
+            if chunk.choices:
+                if first:
+                    first = False
+                    LLM_TTFB.labels(model=model).observe(time.monotonic() - start)
+                if validate and chunk.choices[0].delta.tool_calls:
+                    held.append(chunk)
+                    continue
+                if chunk.choices[0].delta.content:
+                    self._streamed_text = True
+            yield chunk
+
+        if held:
+            _check_tool_calls(context, held)
+            for chunk in held:
+                yield chunk
+        LLM_RESPONSE.labels(model=model).observe(time.monotonic() - start)
+
+
+def _booking_looked_up(messages: list) -> bool:
+    for message in messages:
+        for tool_call in message.get("tool_calls") or []:
+            if tool_call["function"]["name"] in ("find_booking", "find_booking_by_phone"):
+                return True
+    return False
+
+
+def _last_assistant_text(messages: list) -> str:
+    for message in reversed(messages):
+        if message.get("role") == "assistant" and isinstance(message.get("content"), str):
+            return message["content"]
+    return ""
+
+
+def _check_tool_calls(context: OpenAILLMContext, chunks: list):
+    # Raises ToolSchemaError unless every streamed function call names a
+    # known tool and has valid JSON arguments with the required fields.
+    schemas = {}
+    if isinstance(context.tools, list):
+        for tool in context.tools:
+            function = tool["function"]
+            schemas[function["name"]] = function.get("parameters", {}).get("required", [])
+
+    calls = {}
+    for chunk in chunks:
+        for tool_call in chunk.choices[0].delta.tool_calls:
+            name, arguments = calls.get(tool_call.index, ("", ""))
+            if tool_call.function:
+                name += tool_call.function.name or ""
+                arguments += tool_call.function.arguments or ""
+            calls[tool_call.index] = (name, arguments)
+
+    for name, arguments in calls.values():
+        if name not in schemas:
+            raise ToolSchemaError(f"unknown function {name!r}")
+        try:
+            parsed = json.loads(arguments or "{}")
+        except ValueError:
+            raise ToolSchemaError(f"{name} arguments aren't valid JSON: {arguments!r}")
+        if not isinstance(parsed, dict):
+            raise ToolSchemaError(f"{name} arguments aren't an object: {arguments!r}")
+        missing = [field for field in schemas[name] if field not in parsed]
+        if missing:
+            raise ToolSchemaError(f"{name} is missing {', '.join(missing)}")
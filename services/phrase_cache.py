@@ -0,0 +1,122 @@
+import asyncio
+import hashlib
+import os
+
+import aiohttp
+from loguru import logger
+
+ELEVENLABS_API_URL = "https://api.elevenlabs.io/v1/text-to-speech"
+
+
+class PhraseCache:
+    """Pre-rendered TTS audio for short stock phrases.
+
+    Clips are rendered once per process with the ElevenLabs REST API as raw
+    16-bit mono PCM and kept in memory. If `cache_dir` is set they are also
+    written to disk, so a restarted machine doesn't have to render them again.
+    Missing clips are rendered in the background by `preload()`; `get()` never
+    waits on the network.
+    """
+
+    def __init__(
+        self,
+        *,
+        api_key: str,
+        voice_id: str,
+        model: str = "eleven_turbo_v2_5",
+        sample_rate: int = 16000,
+        cache_dir: str | None = None,
+    ):
+        self._api_key = api_key
+        self._voice_id = voice_id
+        self._model = model
+        self._sample_rate = sample_rate
+        self._cache_dir = cache_dir
+        self._clips: dict[str, bytes] = {}
+        self._lock = asyncio.Lock()
+
+    @property
+    def sample_rate(self) -> int:
+        return self._sample_rate
+
+    def get(self, text: str) -> bytes | None:
+        return self._clips.get(text)
+
+    async def preload(self, texts):
+        async with self._lock:
+            missing = [text for text in texts if text not in self._clips]
+            if not missing:
+                return
+
+            for text in missing:
+                audio = await asyncio.to_thread(self._read_file, text)
+                if audio:
+                    self._clips[text] = audio
+            missing = [text for text in missing if text not in self._clips]
+            if not missing:
+                return
+
+            async with aiohttp.ClientSession() as session:
+                for text in missing:
+                    try:
+                        audio = await self._render(session, text)
+                    except Exception as error:
+                        logger.error(f"Error rendering phrase '{text}': {str(error)}")
+                        continue
+                    self._clips[text] = audio
+                    await asyncio.to_thread(self._write_file, text, audio)
+                    logger.debug(f"Rendered phrase '{text}' ({len(audio)} bytes)")
+
+    async def _render(self, session: aiohttp.ClientSession, text: str) -> bytes:
+        url = f"{ELEVENLABS_API_URL}/{self._voice_id}?output_format=pcm_{self._sample_rate}"
+        headers = {"xi-api-key": self._api_key}
+        payload = {"text": text, "model_id": self._model}
+        async with session.post(url, headers=headers, json=payload) as response:
+            if response.status != 200:
+                raise Exception(f"ElevenLabs returned status {response.status}")
+            audio = await response.read()
+        # Keep whole 16-bit samples only.
+        return audio[: len(audio) & ~1]
+
+    def _path(self, text: str) -> str:
+        key = f"{self._voice_id}|{self._model}|{self._sample_rate}|{text}"
+        name = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self._cache_dir, f"{name}.pcm")
+
+    def _read_file(self, text: str) -> bytes | None:
+        if not self._cache_dir:
+            return None
+        try:
+            with open(self._path(text), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _write_file(self, text: str, audio: bytes):
+        if not self._cache_dir:
+            return
+        os.makedirs(self._cache_dir, exist_ok=True)
+        path = self._path(text)
+        with open(f"{path}.tmp", "wb") as f:
+            f.write(audio)
+        os.replace(f"{path}.tmp", path)
+
+
+# Shared by every call handled by this process.
+phrase_cache = PhraseCache(
+    api_key=os.getenv("ELEVENLABS_API_KEY", ""),
+    voice_id=os.getenv("ELEVENLABS_VOICE_ID", ""),
+    cache_dir=os.getenv("PHRASE_CACHE_DIR"),
+)
+_caches = {os.getenv("ELEVENLABS_VOICE_ID", ""): phrase_cache}
+
+
+def phrase_cache_for(voice_id: str) -> PhraseCache:
+    """The process-wide cache for a voice, e.g. a tenant's, created on first use."""
+    if voice_id not in _caches:
+        _caches[voice_id] = PhraseCache(
+            api_key=os.getenv("ELEVENLABS_API_KEY", ""),
+            voice_id=voice_id,
+            cache_dir=os.getenv("PHRASE_CACHE_DIR"),
+        )
+    return _caches[voice_id]
@@ -0,0 +1,14 @@
+from .store import SharedRateLimiter, StateStore, open_store, state_store
+from .memory_store import MemoryStore
+from .redis_store import RedisStore
+from .sqlite_store import SQLiteStore
+
+__all__ = [
+    "MemoryStore",
+    "RedisStore",
+    "SQLiteStore",
+    "SharedRateLimiter",
+    "StateStore",
+    "open_store",
+    "state_store",
+]
@@ -0,0 +1,66 @@
+import time
+from typing import Any
+
+from .store import StateStore
+
+# Expired keys are only noticed when read, so every this many writes the
+# whole table is swept (dedup keys, for one, are mostly written and never read
+# again).
+SWEEP_EVERY = 1000
+
+
+class MemoryStore(StateStore):
+    """A store in this process's memory, for a single machine."""
+
+    def __init__(self):
+        self._values = {}  # key -> (value, expires at or None)
+        self._queues = {}
+        self._writes = 0
+
+    def _live(self, key: str, now: float):
+        entry = self._values.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= now:
+            del self._values[key]
+            return None
+        return entry
+
+    def _write(self, key: str, value: Any, ttl: float | None, now: float):
+        self._values[key] = (value, now + ttl if ttl is not None else None)
+        self._writes += 1
+        if self._writes % SWEEP_EVERY == 0:
+            self._values = {
+                k: entry
+                for k, entry in self._values.items()
+                if entry[1] is None or entry[1] > now
+            }
+
+    async def get(self, key: str) -> Any | None:
+        entry = self._live(key, time.time())
+        return entry[0] if entry else None
+
+    async def set(self, key: str, value: Any, ttl: float | None = None):
+        self._write(key, value, ttl, time.time())
+
+    async def add(self, key: str, value: Any, ttl: float | None = None) -> bool:
+        now = time.time()
+        if self._live(key, now):
+            return False
+        self._write(key, value, ttl, now)
+        return True
+
+    async def delete(self, key: str):
+        self._values.pop(key, None)
+
+    async def reserve(self, key: str, per_sec: float) -> float:
+        now = time.time()
+        entry = self._live(key, now)
+        start = max(entry[0], now) if entry else now
+        next_free = start + 1.0 / per_sec
+        self._write(key, next_free, next_free - now, now)
+        return start - now
+
+    async def push(self, key: str, value: Any):
+        self._queues.setdefault(key, []).append(value)
+
+    async def pop_all(self, key: str) -> list:
+        return self._queues.pop(key, [])
@@ -0,0 +1,177 @@
+import asyncio
+import json
+import ssl
+import time
+from typing import Any
+from urllib.parse import unquote, urlparse
+
+from loguru import logger
+
+from .store import StateStore
+
+# LPOP with a count (Redis 6.2+) empties a queue in one atomic command.
+POP_ALL_COUNT = 100_000
+# A command (with connecting, if need be) that hasn't had its reply by then
+# is given up on, so a hung server can't hold up everything waiting on it.
+COMMAND_TIMEOUT_SECS = 2.0
+# `reserve()` in one round trip: moves the time a schedule is next free on by
+# one turn (ARGV[2] seconds) from whichever is later, that time or now
+# (ARGV[1]), and returns when the claimed turn starts.
+RESERVE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local start = math.max(tonumber(redis.call('GET', KEYS[1]) or 0), now)
+local next_free = start + tonumber(ARGV[2])
+redis.call('SET', KEYS[1], tostring(next_free), 'PX', math.ceil((next_free - now) * 1000))
+return tostring(start)
+"""
+
+
+class RedisError(Exception):
+    pass
+
+
+class RedisStore(StateStore):
+    """A store on a Redis-protocol server (Redis, Valkey, Upstash, ...),
+    shared by every machine that connects to it.
+
+    Speaks the protocol itself over one connection, with commands sent in
+    turn, so there's no client library to install. The connection is opened
+    on first use and reopened once if it drops. A command that's cancelled
+    or times out before its reply is read closes the connection, so the
+    reply can't be taken for the next command's.
+    """
+
+    def __init__(self, url: str, *, timeout_secs: float = COMMAND_TIMEOUT_SECS):
+        parsed = urlparse(url)
+        self._host = parsed.hostname or "localhost"
+        self._port = parsed.port or 6379
+        self._ssl = ssl.create_default_context() if parsed.scheme == "rediss" else None
+        self._username = unquote(parsed.username) if parsed.username else None
+        self._password = unquote(parsed.password) if parsed.password else None
+        self._db = int(parsed.path.lstrip("/") or 0)
+        self._timeout_secs = timeout_secs
+        self._reader = self._writer = None
+        self._lock = asyncio.Lock()
+
+    async def _connect(self):
+        self._reader, self._writer = await asyncio.open_connection(
+            self._host, self._port, ssl=self._ssl
+        )
+        try:
+            if self._password:
+                auth = [self._username, self._password] if self._username else [self._password]
+                await self._send("AUTH", *auth)
+            if self._db:
+                await self._send("SELECT", self._db)
+        except BaseException:
+            # Kept open, the next commands would run unauthenticated or on db 0.
+            self._close()
+            raise
+
+    async def _send(self, *args):
+        command = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            arg = arg if isinstance(arg, bytes) else str(arg).encode()
+            command.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        try:
+            self._writer.write(b"".join(command))
+            await self._writer.drain()
+            return await self._read_reply()
+        except RedisError:
+            # An error reply: the connection is still in step.
+            raise
+        except BaseException:
+            # Cancelled, timed out or disconnected with the reply unread.
+            self._close()
+            raise
+
+    async def _read_reply(self):
+        line = await self._reader.readline()
+        if not line:
+            raise ConnectionError("Connection closed by the state store")
+        kind, body = line[:1], line[1:-2]
+        if kind == b"+":
+            return body.decode()
+        if kind == b"-":
+            raise RedisError(body.decode())
+        if kind == b":":
+            return int(body)
+        if kind == b"$":
+            length = int(body)
+            if length < 0:
+                return None
+            data = await self._reader.readexactly(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            length = int(body)
+            if length < 0:
+                return None
+            try:
+                return [await self._read_reply() for _ in range(length)]
+            except RedisError:
+                # The rest of the array is still unread.
+                self._close()
+                raise
+        raise RedisError(f"Unexpected reply: {line!r}")
+
+    async def execute(self, *args):
+        async with self._lock:
+            for attempt in (1, 2):
+                try:
+                    async with asyncio.timeout(self._timeout_secs):
+                        if self._writer is None:
+                            await self._connect()
+                        return await self._send(*args)
+                except TimeoutError:
+                    # Not retried: the server is up but not answering.
+                    self._close()
+                    logger.warning(f"State store didn't answer {args[0]} in {self._timeout_secs}s")
+                    raise
+                except (ConnectionError, asyncio.IncompleteReadError, OSError) as error:
+                    self._close()
+                    if attempt == 2:
+                        raise
+                    logger.warning(f"State store connection lost ({error}), reconnecting")
+
+    def _close(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+    async def get(self, key: str) -> Any | None:
+        value = await self.execute("GET", key)
+        return json.loads(value) if value is not None else None
+
+    async def set(self, key: str, value: Any, ttl: float | None = None):
+        args = ["SET", key, json.dumps(value)]
+        if ttl is not None:
+            args += ["PX", max(1, round(ttl * 1000))]
+        await self.execute(*args)
+
+    async def add(self, key: str, value: Any, ttl: float | None = None) -> bool:
+        args = ["SET", key, json.dumps(value), "NX"]
+        if ttl is not None:
+            args += ["PX", max(1, round(ttl * 1000))]
+        return await self.execute(*args) is not None
+
+    async def delete(self, key: str):
+        await self.execute("DEL", key)
+
+    async def reserve(self, key: str, per_sec: float) -> float:
+        now = time.time()
+        start = await self.execute("EVAL", RESERVE_SCRIPT, 1, key, repr(now), repr(1.0 / per_sec))
+        return float(start) - now
+
+    async def push(self, key: str, value: Any):
+        await self.execute("RPUSH", key, json.dumps(value))
+
+    async def pop_all(self, key: str) -> list:
+        values = await self.execute("LPOP", key, POP_ALL_COUNT)
+        return [json.loads(value) for value in values or []]
+
+    async def close(self):
+        async with self._lock:
+            writer = self._writer
+            self._close()
+            if writer is not None:
+                await writer.wait_closed()
@@ -0,0 +1,118 @@
+import asyncio
+import json
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+from .store import StateStore
+
+SWEEP_EVERY = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL);
+CREATE TABLE IF NOT EXISTS queue (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT NOT NULL, value TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS queue_key ON queue (key, id);
+"""
+SET_SQL = (
+    "INSERT INTO kv (key, value, expires_at) VALUES (?, ?, ?) "
+    "ON CONFLICT (key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at"
+)
+# Only replaces a row that has expired, which counts as absent.
+ADD_SQL = SET_SQL + " WHERE kv.expires_at <= ?"
+# Moves the time a schedule is next free on by one turn (?3 seconds) from
+# whichever is later, that time or now (?2), and returns the new time.
+RESERVE_SQL = (
+    "INSERT INTO kv (key, value, expires_at) VALUES (?1, ?2 + ?3, ?2 + ?3) "
+    "ON CONFLICT (key) DO UPDATE SET "
+    "value = max(CAST(kv.value AS REAL), ?2) + ?3, "
+    "expires_at = max(CAST(kv.value AS REAL), ?2) + ?3 "
+    "RETURNING CAST(value AS REAL)"
+)
+
+
+class SQLiteStore(StateStore):
+    """A store in a SQLite file, shared by every process on the machine that
+    opens it.
+
+    Queries run one at a time on a worker thread, so they never block the
+    event loop. The database is in WAL mode and each operation is a single
+    statement, so processes don't hold locks on each other for long.
+    """
+
+    def __init__(self, path: str):
+        self._db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA busy_timeout=5000")
+        self._db.executescript(SCHEMA)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="state-sqlite")
+        self._writes = 0
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _wrote(self, now: float):
+        self._writes += 1
+        if self._writes % SWEEP_EVERY == 0:
+            self._db.execute("DELETE FROM kv WHERE expires_at <= ?", (now,))
+
+    def _get(self, key: str):
+        row = self._db.execute(
+            "SELECT value FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (key, time.time()),
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _set(self, key: str, value: Any, ttl: float | None, only_if_absent: bool) -> bool:
+        now = time.time()
+        params = (key, json.dumps(value), now + ttl if ttl is not None else None)
+        if only_if_absent:
+            cursor = self._db.execute(ADD_SQL, (*params, now))
+        else:
+            cursor = self._db.execute(SET_SQL, params)
+        self._wrote(now)
+        return cursor.rowcount == 1
+
+    def _reserve(self, key: str, per_sec: float) -> float:
+        now = time.time()
+        interval = 1.0 / per_sec
+        (next_free,) = self._db.execute(RESERVE_SQL, (key, now, interval)).fetchone()
+        self._wrote(now)
+        return next_free - interval - now
+
+    def _pop_all(self, key: str) -> list:
+        rows = self._db.execute(
+            "DELETE FROM queue WHERE key = ? RETURNING id, value", (key,)
+        ).fetchall()
+        return [json.loads(value) for _, value in sorted(rows)]
+
+    async def get(self, key: str) -> Any | None:
+        return await self._run(self._get, key)
+
+    async def set(self, key: str, value: Any, ttl: float | None = None):
+        await self._run(self._set, key, value, ttl, False)
+
+    async def add(self, key: str, value: Any, ttl: float | None = None) -> bool:
+        return await self._run(self._set, key, value, ttl, True)
+
+    async def delete(self, key: str):
+        await self._run(self._db.execute, "DELETE FROM kv WHERE key = ?", (key,))
+
+    async def reserve(self, key: str, per_sec: float) -> float:
+        return await self._run(self._reserve, key, per_sec)
+
+    async def push(self, key: str, value: Any):
+        await self._run(
+            self._db.execute,
+            "INSERT INTO queue (key, value) VALUES (?, ?)",
+            (key, json.dumps(value)),
+        )
+
+    async def pop_all(self, key: str) -> list:
+        return await self._run(self._pop_all, key)
+
+    async def close(self):
+        await self._run(self._db.close)
+        self._executor.shutdown()
@@ -0,0 +1,91 @@
+"""Shared state: caches, rate limits, dedup keys and queues.
+
+Anything that has to hold across machines goes through a `StateStore`
+rather than a dict in the process, since Fly starts and stops machines that
+share nothing. STATE_STORE picks the backend:
+
+    memory                       this process only (the default)
+    sqlite:///data/state.db      a file, shared by the processes on a machine
+    redis://[:password@]host:6379/0, rediss://...
+                                 any Redis-protocol server, shared by every machine
+
+Values are anything JSON can encode. Expiry uses the wall clock, so the
+machines sharing a store should keep their clocks in sync (Fly's do).
+"""
+
+import asyncio
+import os
+from typing import Any
+
+
+class StateStore:
+    """The operations every backend provides. All of them are coroutines."""
+
+    async def get(self, key: str) -> Any | None:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: Any, ttl: float | None = None):
+        raise NotImplementedError
+
+    async def add(self, key: str, value: Any, ttl: float | None = None) -> bool:
+        """Sets `key` only if it isn't set already. Returns whether it was."""
+        raise NotImplementedError
+
+    async def delete(self, key: str):
+        raise NotImplementedError
+
+    async def push(self, key: str, value: Any):
+        """Appends `value` to the queue at `key`."""
+        raise NotImplementedError
+
+    async def pop_all(self, key: str) -> list:
+        """Removes and returns everything in the queue at `key`, oldest first."""
+        raise NotImplementedError
+
+    async def reserve(self, key: str, per_sec: float) -> float:
+        """Claims the next free turn in a schedule of `per_sec` turns a second,
+        shared by everyone using the store. Returns the seconds to wait until
+        the turn starts.
+
+        `key` holds the time the schedule is next free, read and moved on by
+        1/`per_sec` in one atomic step, so every caller gets a turn of its own
+        however many are waiting. It expires once that time has passed.
+        """
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class SharedRateLimiter:
+    """Spaces out request starts to at most `per_sec` a second, counting
+    every process that shares `store` and `key`."""
+
+    def __init__(self, store: StateStore, key: str, per_sec: float):
+        self._store = store
+        self._key = key
+        self._per_sec = per_sec
+
+    async def wait(self):
+        delay = await self._store.reserve(self._key, self._per_sec)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def open_store(url: str) -> StateStore:
+    if url == "memory":
+        from .memory_store import MemoryStore
+
+        return MemoryStore()
+    if url.startswith("sqlite://"):
+        from .sqlite_store import SQLiteStore
+
+        return SQLiteStore(url.removeprefix("sqlite://"))
+    if url.startswith(("redis://", "rediss://")):
+        from .redis_store import RedisStore
+
+        return RedisStore(url)
+    raise ValueError(f"Unknown STATE_STORE: {url}")
+
+
+state_store = open_store(os.getenv("STATE_STORE") or "memory")
@@ -0,0 +1,152 @@
+"""Tenants: the car park businesses served by one deployment.
+
+Each tenant has its own phone numbers, prompt, tools, Airtable table, voice,
+staff WhatsApp group and transfer number. They're read from the JSON list in
+TENANTS_FILE, for example:
+
+    [{"id": "man", "business_name": "Manchester Airport Parking",
+      "numbers": ["+441610000000"], "airtable_base_id": "app...",
+      "bookings_table": "Bookings", "voice_id": "...", "max_calls": 20}]
+
+Fields that are left out fall back to the single-site environment variables
+(AIRTABLE_BASE_ID, ELEVENLABS_VOICE_ID, MANAGER_WHATSAPP_GROUP, ...). Without
+TENANTS_FILE there is one tenant, `default`, configured entirely from them.
+The first tenant in the file is the default, used for numbers that aren't
+listed.
+
+`/start_call` picks the tenant by the number that was dialled and passes its
+id to `/ws` as a stream parameter. `max_calls` caps each tenant's concurrent
+calls on one machine, so one busy site can't take every slot on a machine
+shared with the others.
+"""
+
+import json
+import os
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from loguru import logger
+from prometheus_client import Counter, Gauge
+
+TENANT_CALLS = Counter(
+    "tenant_calls_total",
+    "Calls by tenant, and whether they were taken or turned away by the tenant's quota",
+    ["tenant", "result"],
+)
+TENANT_CALLS_ACTIVE = Gauge("tenant_calls_active", "Calls running on this machine", ["tenant"])
+
+
+@dataclass(frozen=True)
+class Tenant:
+    id: str
+    business_name: str = "Manchester Airport Parking"
+    numbers: tuple[str, ...] = ()
+    airtable_api_key: str = field(default_factory=lambda: os.getenv("AIRTABLE_API_KEY", ""))
+    airtable_base_id: str = field(default_factory=lambda: os.getenv("AIRTABLE_BASE_ID", ""))
+    bookings_table: str = field(default_factory=lambda: os.getenv("AIRTABLE_BOOKINGS_TABLE", ""))
+    voice_id: str = field(default_factory=lambda: os.getenv("ELEVENLABS_VOICE_ID", ""))
+    # The Cartesia voice that stands in for `voice_id`. With `tts_fallback`
+    # "hedge", a sentence ElevenLabs is slow to start is also sent to Cartesia
+    # and whichever answers first is played; with "failover", Cartesia is only
+    # used when ElevenLabs fails; with "off", or no fallback voice, it never is.
+    fallback_voice_id: str = field(default_factory=lambda: os.getenv("CARTESIA_VOICE_ID", ""))
+    tts_fallback: str = field(default_factory=lambda: os.getenv("TTS_FALLBACK", "hedge"))
+    manager_whatsapp_group: str = field(
+        default_factory=lambda: os.getenv("MANAGER_WHATSAPP_GROUP", "")
+    )
+    transfer_number: str = field(default_factory=lambda: os.getenv("TRANSFER_NUMBER", ""))
+    # Concurrent calls on one machine; 0 for no limit.
+    max_calls: int = 0
+    # A file with the tenant's own system prompt, instead of the stock one.
+    prompt_file: str | None = None
+    greeting: str | None = None
+    # Names of the functions offered to the LLM; None for all of them.
+    tools: tuple[str, ...] | None = None
+
+    @property
+    def tts_providers(self) -> tuple[str, ...]:
+        """The TTS providers that can speak on the tenant's calls."""
+        if self.fallback_voice_id and self.tts_fallback != "off" and os.getenv("CARTESIA_API_KEY"):
+            return ("elevenlabs", "cartesia")
+        return ("elevenlabs",)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Tenant":
+        data = dict(data)
+        for key in ("numbers", "tools"):
+            if data.get(key) is not None:
+                data[key] = tuple(data[key])
+        return cls(**data)
+
+
+class TenantRegistry:
+    """Looks up tenants and keeps count of each one's calls on this machine."""
+
+    def __init__(self, tenants: list[Tenant]):
+        self.default = tenants[0]
+        self._by_id = {tenant.id: tenant for tenant in tenants}
+        self._by_number = {
+            _normalize_number(number): tenant for tenant in tenants for number in tenant.numbers
+        }
+        self._active = {tenant.id: 0 for tenant in tenants}
+
+    @classmethod
+    def from_env(cls) -> "TenantRegistry":
+        path = os.getenv("TENANTS_FILE")
+        if not path:
+            return cls([Tenant(id="default")])
+        with open(path) as f:
+            tenants = [Tenant.from_dict(data) for data in json.load(f)]
+        logger.info(f"Loaded {len(tenants)} tenants from {path}")
+        return cls(tenants)
+
+    def __iter__(self):
+        return iter(self._by_id.values())
+
+    def get(self, tenant_id: str | None) -> Tenant:
+        return self._by_id.get(tenant_id, self.default)
+
+    def for_number(self, number: str | None) -> Tenant:
+        return self._by_number.get(_normalize_number(number or ""), self.default)
+
+    def has_capacity(self, tenant: Tenant) -> bool:
+        return not tenant.max_calls or self._active[tenant.id] < tenant.max_calls
+
+    def admit(self, tenant: Tenant) -> bool:
+        """Whether to put a new call through, counting it if it's turned away."""
+        if self.has_capacity(tenant):
+            return True
+        TENANT_CALLS.labels(tenant=tenant.id, result="turned_away").inc()
+        return False
+
+    def try_acquire(self, tenant: Tenant) -> bool:
+        if not self.has_capacity(tenant):
+            TENANT_CALLS.labels(tenant=tenant.id, result="rejected").inc()
+            return False
+        TENANT_CALLS.labels(tenant=tenant.id, result="accepted").inc()
+        self._active[tenant.id] += 1
+        TENANT_CALLS_ACTIVE.labels(tenant=tenant.id).set(self._active[tenant.id])
+        return True
+
+    def release(self, tenant: Tenant):
+        self._active[tenant.id] -= 1
+        TENANT_CALLS_ACTIVE.labels(tenant=tenant.id).set(self._active[tenant.id])
+
+
+def _normalize_number(number: str) -> str:
+    return "".join(char for char in number if char.isdigit())
+
+
+tenants = TenantRegistry.from_env()
+
+# The tenant of the call running in this context. Set by run_bot, and read by
+# the function handlers through `current_tenant()`.
+_current_tenant: ContextVar[Tenant] = ContextVar("tenant")
+
+
+def current_tenant() -> Tenant:
+    return _current_tenant.get(tenants.default)
+
+
+def use_tenant(tenant: Tenant):
+    _current_tenant.set(tenant)
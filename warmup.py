@@ -0,0 +1,117 @@
+import asyncio
+import importlib
+import time
+
+from loguru import logger
+from prometheus_client import Gauge
+
+WARMUP_STEP_SECONDS = Gauge(
+    "warmup_step_seconds",
+    "Time taken by each background warm-up step after the server started",
+    ["step"],
+)
+WARMUP_SECONDS = Gauge(
+    "warmup_seconds",
+    "Time from the server module loading until the call pipeline was ready",
+)
+FIRST_CALL_SECONDS = Gauge(
+    "first_call_after_boot_seconds",
+    "Time from the server module loading until the first call was accepted",
+)
+
+# Imported in this order, heaviest providers first. `bot` comes last and
+# picks up whatever is left.
+PRELOAD_MODULES = (
+    "pipecat.services.openai",
+    "pipecat.vad.silero",
+    "pipecat.services.deepgram",
+    "pipecat.services.elevenlabs",
+    "pipecat.transports.network.fastapi_websocket",
+    "functions",
+    "bot",
+)
+
+
+class Warmup:
+    """Loads the call pipeline in the background once the server is up.
+
+    The server only imports FastAPI at boot, so the port is bound and health
+    checks pass straight away. `start()` then imports the provider modules and
+    `bot` in a worker thread, loads the Silero VAD model once so its files are
+    in the page cache, and renders the stock phrases. A call that arrives
+    before this has finished waits for the imports in `load_bot()`, but not
+    for the model or the phrases. Once the imports are done it also starts
+    loading the bookings due soon (functions.hot_bookings).
+    """
+
+    def __init__(self):
+        self._boot_time = time.monotonic()
+        self._import_task = None
+        self._task = None
+        self._first_call = True
+        self.ready = False
+
+    def start(self, boot_time: float | None = None):
+        if boot_time is not None:
+            self._boot_time = boot_time
+        if not self._task:
+            self._task = asyncio.create_task(self._run())
+        return self._task
+
+    async def load_bot(self):
+        """Returns `bot.run_bot`, importing it first if needed."""
+        if self._first_call:
+            self._first_call = False
+            FIRST_CALL_SECONDS.set(time.monotonic() - self._boot_time)
+        if not self._import_task:
+            self._import_task = asyncio.create_task(self._import_modules())
+        await self._import_task
+        return importlib.import_module("bot").run_bot
+
+    async def _run(self):
+        try:
+            if not self._import_task:
+                self._import_task = asyncio.create_task(self._import_modules())
+            await self._import_task
+            # Bookings due soon are loaded in the background and kept fresh.
+            from functions.hot_bookings import hot_bookings
+
+            hot_bookings.start()
+            await self._step("silero_model", asyncio.to_thread(self._load_vad_model))
+            await self._step("phrases", self._render_phrases())
+        except Exception as error:
+            logger.error(f"Warm-up failed: {str(error)}")
+            return
+        elapsed = time.monotonic() - self._boot_time
+        WARMUP_SECONDS.set(elapsed)
+        self.ready = True
+        logger.info(f"Warm-up finished {elapsed:.2f}s after boot")
+
+    async def _import_modules(self):
+        for name in PRELOAD_MODULES:
+            await self._step(f"import {name}", asyncio.to_thread(importlib.import_module, name))
+
+    async def _step(self, name: str, coroutine):
+        start = time.monotonic()
+        await coroutine
+        elapsed = time.monotonic() - start
+        WARMUP_STEP_SECONDS.labels(step=name).set(elapsed)
+        logger.debug(f"Warm-up: {name} took {elapsed:.3f}s")
+
+    def _load_vad_model(self):
+        from pipecat.vad.silero import SileroVADAnalyzer
+
+        SileroVADAnalyzer()
+
+    async def _render_phrases(self):
+        from processors.idle_reaper import PHRASES as IDLE_PHRASES
+        from processors.tool_filler import DEFAULT_FILLER_PHRASES
+        from services import phrase_cache_for
+        from tenants import tenants
+
+        # One set of clips per voice, shared by the tenants that use it.
+        for voice_id in {tenant.voice_id for tenant in tenants}:
+            await phrase_cache_for(voice_id).preload([*DEFAULT_FILLER_PHRASES, *IDLE_PHRASES])
+
+
+warmup = Warmup()